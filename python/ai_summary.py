@@ -1,45 +1,35 @@
 # python/ai_summary.py
-import os
-import math
+import argparse
+import asyncio
 import pandas as pd
 from pathlib import Path
 
-# --- Optional: load .env if present ---
-try:
-    from dotenv import load_dotenv
-    load_dotenv(dotenv_path=Path(__file__).resolve().parents[1] / ".env")
-except Exception:
-    pass
+import anomaly
+import storage
+from summary_engine import ResponseCache, SummaryEngine, narrative_prompts, narratives_frame
 
 DATA_DIR = Path(__file__).resolve().parents[1] / "data"
-kpis_path = DATA_DIR / "latest_kpis.csv"
-dept_var_path = DATA_DIR / "variance_summary.csv"
-fcst_dept_path = DATA_DIR / "forecast_by_department.csv"  # optional
-
-# ---------- Load data ----------
-kpis = pd.read_csv(kpis_path)
-dept_var = pd.read_csv(dept_var_path).sort_values("Variance_Pct", ascending=True)
-
-month = str(kpis["Month"].iloc[0])
-actual = float(kpis["Actual_Total"].iloc[0])
-budget = float(kpis["Budget_Total"].iloc[0])
-variance = float(kpis["Variance_Total"].iloc[0])
-variance_pct = float(kpis["Variance_Pct"].iloc[0])
-gm_pct = float(kpis["Gross_Margin_Pct"].iloc[0])
-
-top_over = dept_var.sort_values("Variance_Pct", ascending=False).head(2)[["Department", "Variance_Pct"]]
-top_under = dept_var.sort_values("Variance_Pct", ascending=True).head(2)[["Department", "Variance_Pct"]]
-
-# ---------- Optional forecast load ----------
-fcst_summary_line = None
-fcst_details_line = None
-if fcst_dept_path.exists():
-    fc = pd.read_csv(fcst_dept_path)  # Month, Department, Forecast, Lower, Upper
-    fc["Month"] = fc["Month"].astype(str)
+
+def fmt_pct(x): return f"{x:+.1f}%"
+def money(x): return f"${x:,.0f}"
+
+# ---------- Forecast lines ----------
+def forecast_lines(fc, total=None):
+    """
+    Forward-look bullets from a Month, Department, Forecast frame.
+    total: optional Month, Forecast frame of the reconciled company total
+    (reconcile.py); used for the forward look instead of summing departments.
+    Returns (summary line or None, details line or None)
+    """
+    fcst_summary_line = None
+    fcst_details_line = None
+    if fc is None:
+        return fcst_summary_line, fcst_details_line
+    fc = fc.assign(Month=fc["Month"].astype(str))
 
     # Build next3 WITHOUT groupby.apply to avoid FutureWarning and keep Department column
     parts = []
-    for dept, d in fc.groupby("Department"):
+    for dept, d in fc.groupby("Department", observed=True):
         d_sorted = d.sort_values("Month").head(3)
         parts.append(d_sorted)
     next3 = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=fc.columns)
@@ -47,7 +37,7 @@ if fcst_dept_path.exists():
     # Average of first 3 forecast months per department
     if not next3.empty:
         by_dept = (
-            next3.groupby("Department", as_index=False)
+            next3.groupby("Department", as_index=False, observed=True)
                  .agg(Forecast_Avg=("Forecast", "mean"))
         )
         overall_avg = by_dept["Forecast_Avg"].mean()
@@ -69,7 +59,10 @@ if fcst_dept_path.exists():
         down_text = _fmt_pair(movers_down)
 
         # Total next-3-months forecast (avg of monthly totals)
-        total_next3 = next3.groupby("Month")["Forecast"].sum().mean()
+        if total is not None and not total.empty:
+            total_next3 = total.assign(Month=total["Month"].astype(str)).sort_values("Month").head(3)["Forecast"].mean()
+        else:
+            total_next3 = next3.groupby("Month")["Forecast"].sum().mean()
         if pd.notna(total_next3):
             fcst_summary_line = f"• **Forward look (next 3 months):** average projected revenue ≈ ${total_next3:,.0f}."
         if up_text or down_text:
@@ -77,43 +70,70 @@ if fcst_dept_path.exists():
             if up_text: bits.append(f"Upside leader: {up_text}")
             if down_text: bits.append(f"Downside risk: {down_text}")
             fcst_details_line = "• " + " | ".join(bits)
-
-def fmt_pct(x): return f"{x:+.1f}%"
-def money(x): return f"${x:,.0f}"
-
-# ---------- Rule-based fallback ----------
-fallback_lines = [
-    f"**Executive Summary – {month}**",
-    f"• Revenue was {money(actual)} vs budget {money(budget)} ({fmt_pct(variance_pct)} variance). "
-    f"Gross margin {gm_pct:.1f}%.",
-    ("• Overall performance was **above budget**; monitor sustainability into next month."
-     if variance_pct >= 0 else
-     "• Overall performance was **below budget**; investigate drivers and corrective actions."),
-]
-if not top_over.empty:
-    over_str = ", ".join(f"{r.Department} ({fmt_pct(r.Variance_Pct)})" for r in top_over.itertuples(index=False))
-    fallback_lines.append(f"• Biggest **unfavorable variances**: {over_str}.")
-if not top_under.empty:
-    under_str = ", ".join(f"{r.Department} ({fmt_pct(r.Variance_Pct)})" for r in top_under.itertuples(index=False))
-    fallback_lines.append(f"• Biggest **favorable variances**: {under_str}.")
-if fcst_summary_line: fallback_lines.append(fcst_summary_line)
-if fcst_details_line: fallback_lines.append(fcst_details_line)
-fallback_lines.append("• Next steps: review cost drivers in unfavorable areas, validate forecast assumptions, "
-                      "and refresh the rolling 3-month outlook.")
-fallback_md = "\n".join(fallback_lines)
-
-# ---------- Provider selection ----------
-provider = "fallback"
-text = fallback_md
-
-azure_key = os.getenv("AZURE_OPENAI_KEY")
-azure_endpoint = os.getenv("AZURE_OPENAI_ENDPOINT")
-azure_deployment = os.getenv("AZURE_OPENAI_DEPLOYMENT")
-azure_api_version = os.getenv("AZURE_OPENAI_API_VERSION", "2024-07-18")
-openai_key = os.getenv("OPENAI_API_KEY")
-
-# Build prompt (include forward outlook if available)
-prompt = f"""
+    return fcst_summary_line, fcst_details_line
+
+# ---------- Anomaly lines ----------
+def anomaly_line(anoms, month, months=3, top=3):
+    """Bullet naming the strongest month-level variance breaks (anomaly.py) of the last `months` months, or None."""
+    flagged = anomaly.recent(anoms, months=months, top=top, latest=month)
+    if flagged.empty:
+        return None
+    return "• **Month-level breaks:** " + "; ".join(anomaly.describe(r) for _, r in flagged.iterrows()) + "."
+
+# ---------- Summary ----------
+def build_summary(kpis, dept_var, fc=None, engine=None, fc_total=None, anomalies=None):
+    """
+    Executive summary markdown from the latest KPIs, the department variance
+    rollup and (optionally) the department forecast, its reconciled company
+    total and the flagged month-level anomalies. The LLM call goes through
+    `engine` (a cached SummaryEngine from env vars by default).
+    Returns (markdown text, provider used)
+    """
+    dept_var = dept_var.sort_values("Variance_Pct", ascending=True)
+
+    month = str(kpis["Month"].iloc[0])
+    actual = float(kpis["Actual_Total"].iloc[0])
+    budget = float(kpis["Budget_Total"].iloc[0])
+    variance = float(kpis["Variance_Total"].iloc[0])
+    variance_pct = float(kpis["Variance_Pct"].iloc[0])
+    gm_pct = float(kpis["Gross_Margin_Pct"].iloc[0])
+
+    top_over = dept_var.sort_values("Variance_Pct", ascending=False).head(2)[["Department", "Variance_Pct"]]
+    top_under = dept_var.sort_values("Variance_Pct", ascending=True).head(2)[["Department", "Variance_Pct"]]
+
+    fcst_summary_line, fcst_details_line = forecast_lines(fc, fc_total)
+    breaks_line = anomaly_line(anomalies, month)
+
+    # ---------- Rule-based fallback ----------
+    fallback_lines = [
+        f"**Executive Summary – {month}**",
+        f"• Revenue was {money(actual)} vs budget {money(budget)} ({fmt_pct(variance_pct)} variance). "
+        f"Gross margin {gm_pct:.1f}%.",
+        ("• Overall performance was **above budget**; monitor sustainability into next month."
+         if variance_pct >= 0 else
+         "• Overall performance was **below budget**; investigate drivers and corrective actions."),
+    ]
+    if not top_over.empty:
+        over_str = ", ".join(f"{r.Department} ({fmt_pct(r.Variance_Pct)})" for r in top_over.itertuples(index=False))
+        fallback_lines.append(f"• Biggest **unfavorable variances**: {over_str}.")
+    if not top_under.empty:
+        under_str = ", ".join(f"{r.Department} ({fmt_pct(r.Variance_Pct)})" for r in top_under.itertuples(index=False))
+        fallback_lines.append(f"• Biggest **favorable variances**: {under_str}.")
+    if breaks_line: fallback_lines.append(breaks_line)
+    if fcst_summary_line: fallback_lines.append(fcst_summary_line)
+    if fcst_details_line: fallback_lines.append(fcst_details_line)
+    fallback_lines.append("• Next steps: review cost drivers in unfavorable areas, validate forecast assumptions, "
+                          "and refresh the rolling 3-month outlook.")
+    fallback_md = "\n".join(fallback_lines)
+
+    # ---------- Provider selection ----------
+    provider = "fallback"
+    text = fallback_md
+    if engine is None:
+        engine = SummaryEngine(cache=ResponseCache())
+
+    # Build prompt (include forward outlook if available)
+    prompt = f"""
 You are an FP&A analyst. Write a crisp executive summary (4–6 sentences) for {month}.
 Actuals:
 - Actual: {actual:.2f}
@@ -122,43 +142,93 @@ Actuals:
 - Gross Margin %: {gm_pct:.2f}
 Unfavorable depts: {top_over.to_dict(orient="records")}
 Favorable depts: {top_under.to_dict(orient="records")}
+Month-level variance breaks (last 3 months): {breaks_line or "none flagged"}
 Forward look (if provided):
 - {fcst_summary_line or "n/a"}
 - {fcst_details_line or "n/a"}
 Be specific, neutral, and include 1–2 actionable next steps. Return markdown with a bold title.
 """.strip()
 
-try:
-    if azure_key and azure_endpoint and azure_deployment:
-        from openai import AzureOpenAI
-        client = AzureOpenAI(
-            api_key=azure_key,
-            azure_endpoint=azure_endpoint,
-            api_version=azure_api_version
-        )
-        resp = client.chat.completions.create(
-            model=azure_deployment,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.2,
-        )
-        text = resp.choices[0].message.content.strip()
-        provider = "azure"
-    elif openai_key:
-        from openai import OpenAI
-        client = OpenAI(api_key=openai_key)
-        resp = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.2,
-        )
-        text = resp.choices[0].message.content.strip()
-        provider = "openai"
-except Exception as e:
-    text = fallback_md + f"\n\n> (LLM unavailable, using fallback: {e})"
-    provider = "fallback-error"
-
-# ---------- Write output ----------
-out_path = DATA_DIR / "exec_summary.md"
-out_path.write_text(text, encoding="utf-8")
-print(f"✅ Wrote executive summary → {out_path}")
-print(f"🔎 Provider used: {provider}")
+    if engine.available:
+        try:
+            text = asyncio.run(engine.complete(prompt))
+            provider = engine.provider
+        except Exception as e:
+            text = fallback_md + f"\n\n> (LLM unavailable, using fallback: {e})"
+            provider = "fallback-error"
+
+    return text, provider
+
+def write_summary(text, data_dir: Path = DATA_DIR) -> Path:
+    out_path = data_dir / "exec_summary.md"
+    out_path.write_text(text, encoding="utf-8")
+    return out_path
+
+def build_narratives(engine, dept_var, trend, months=None) -> pd.DataFrame:
+    """Per-department and per-month narratives, fetched concurrently through `engine`."""
+    return narratives_frame(engine.run(narrative_prompts(dept_var, trend, months)))
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Write the executive summary (and optional narratives)")
+    p.add_argument("--narratives", action="store_true",
+                   help="also write per-department and per-month narratives to data/narratives")
+    p.add_argument("--months", type=int, default=None,
+                   help="limit narratives to the latest N months (default: all)")
+    p.add_argument("--concurrency", type=int, default=8, help="LLM requests in flight at once")
+    p.add_argument("--timeout", type=float, default=30.0, help="seconds per LLM attempt")
+    p.add_argument("--retries", type=int, default=3, help="retries per prompt after the first attempt")
+    p.add_argument("--no-cache", action="store_true", help="ignore the response cache in data/.llm_cache")
+    p.add_argument("--clear-cache", action="store_true", help="delete cached LLM responses first")
+    return p.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    cache = None if args.no_cache else ResponseCache()
+    if args.clear_cache:
+        print(f"🧹 Cleared {ResponseCache().clear()} cached LLM response(s)")
+    engine = SummaryEngine(concurrency=args.concurrency, timeout=args.timeout,
+                           retries=args.retries, cache=cache)
+
+    # ---------- Load data ----------
+    kpis = storage.read_table("latest_kpis")
+    dept_var = storage.read_table("variance_summary", columns=["Department", "Variance_Pct"])
+
+    # ---------- Optional forecast load ----------
+    fc = None
+    if storage.table_exists("forecast_by_department"):
+        fc = storage.read_table("forecast_by_department", columns=["Month", "Department", "Forecast"])
+    fc_total = None
+    if storage.table_exists("forecast_reconciled"):
+        rec = storage.read_table("forecast_reconciled", columns=["Level", "Month", "Forecast"])
+        fc_total = rec.loc[rec["Level"] == "Total", ["Month", "Forecast"]]
+
+    anomalies = storage.read_table(anomaly.OUTPUT) if storage.table_exists(anomaly.OUTPUT) else None
+
+    text, provider = build_summary(kpis, dept_var, fc, engine=engine, fc_total=fc_total, anomalies=anomalies)
+
+    # ---------- Write output ----------
+    out_path = write_summary(text)
+    print(f"✅ Wrote executive summary → {out_path}")
+    print(f"🔎 Provider used: {provider}")
+
+    # ---------- Optional narratives ----------
+    if args.narratives:
+        if not engine.available:
+            print("⚠️ Narratives need an LLM provider (set OPENAI_API_KEY or the AZURE_OPENAI_* vars)")
+        else:
+            trend = storage.read_table("monthly_trend")
+            dv = storage.read_table("department_variance")
+            months = None
+            if args.months:
+                months = sorted(trend["Month"].astype(str).unique())[-args.months:]
+            frame = build_narratives(engine, dv, trend, months)
+            path = storage.write_table(frame, "narratives")
+            failed = int((frame["Error"] != "").sum())
+            print(f"✅ Wrote {len(frame) - failed} narrative(s) → {path}")
+            if failed:
+                print(f"⚠️ {failed} narrative(s) failed; see the Error column")
+    if engine.available:
+        print(f"🔁 LLM calls: {engine.stats()}")
+
+if __name__ == "__main__":
+    main()
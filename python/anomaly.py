@@ -0,0 +1,318 @@
+# python/anomaly.py
+"""
+Month-level anomaly detection on department (or cost-center) variances.
+
+Each series is the monthly Variance_Pct of one department:
+sum(Revenue - Forecast_Revenue) / sum(Forecast_Revenue). Three detectors run over it:
+
+  zscore    deviation from the mean of the previous --window months, in rolling std units
+  ewma      EWMA control chart: the smoothed value leaves mean ± L·σ·sqrt(λ / (2 - λ))
+            of all earlier months (catches smaller, sustained shifts)
+  seasonal  the change vs the same month a season ago, against the history of
+            those seasonal changes (breaks that are not just seasonality)
+
+Every detector keeps O(1) running state per series (running sums over a ring
+buffer, Welford mean/variance, the EWMA value), so a series costs O(n) and each
+month is one vectorized step across all series. The state is saved in
+data/.anomaly_state; the next run only feeds the months that arrived since.
+If an already processed month changed, the detectors are rebuilt from scratch.
+
+    python python/anomaly.py                       # departments, from department_variance
+    python python/anomaly.py --by Cost_Center      # any ledger column, from financials
+    python python/anomaly.py --full                # ignore the saved state
+"""
+import argparse
+import hashlib
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import schema
+import storage
+from instrument import span
+
+DATA_DIR = Path(__file__).resolve().parents[1] / "data"
+STATE_DIR = DATA_DIR / ".anomaly_state"
+OUTPUT = "anomalies"  # Department flags; other --by keys write anomalies_<by>
+STATE_VERSION = 2
+
+DEFAULTS = {"window": 12, "z": 3.0, "lam": 0.3, "L": 3.0, "season": 12, "seasonal_z": 3.0, "min_obs": 6}
+COLUMNS = ["Month", "Variance_Pct", "Expected", "Rolling_Z", "EWMA_Dev", "Seasonal_Z", "Detectors", "Score"]
+
+# ---------- Series ----------
+def monthly_variance(df: pd.DataFrame, by: str = "Department"):
+    """
+    Months x series grid of Variance_Pct from a frame with Month, `by`,
+    Revenue and Forecast_Revenue (any number of rows per cell).
+    Returns (month labels, series keys, grid with NaN where a series has no budget)
+    """
+    codes = schema.month_codes(df["Month"])
+    m0 = int(codes.min())
+    n_months = int(codes.max()) - m0 + 1
+    keys, uniques = pd.factorize(df[by].astype(str), sort=True)
+    cell = (codes - m0).astype(np.int64) * len(uniques) + keys
+    size = n_months * len(uniques)
+    rev = np.bincount(cell, weights=df["Revenue"].to_numpy(dtype=float), minlength=size)
+    budget = np.bincount(cell, weights=df["Forecast_Revenue"].to_numpy(dtype=float), minlength=size)
+    grid = np.full(size, np.nan)
+    np.divide(rev - budget, budget, out=grid, where=budget != 0)
+    labels = schema.month_labels(np.arange(m0, m0 + n_months, dtype=np.int32))
+    return labels, np.asarray(uniques, dtype=object), grid.reshape(n_months, len(uniques)) * 100
+
+# ---------- Online detectors ----------
+class DetectorState:
+    """Running state for K series; step() feeds one month for all of them."""
+
+    FIELDS = ["ring", "ring_n", "ring_pos", "win_sum", "win_sq", "season_ring", "season_n",
+              "n", "mean", "m2", "ewma", "d_n", "d_mean", "d_m2"]
+
+    def __init__(self, n_series: int, params: dict):
+        self.params = dict(params)
+        w, m = self.params["window"], self.params["season"]
+        k = n_series
+        self.ring = np.zeros((k, w))            # last `window` values
+        self.ring_n = np.zeros(k, dtype=np.int64)
+        self.ring_pos = np.zeros(k, dtype=np.int64)
+        self.win_sum, self.win_sq = np.zeros(k), np.zeros(k)
+        self.season_ring = np.full((k, m), np.nan)  # last `season` calendar months, NaN = no data
+        self.season_n = np.zeros(k, dtype=np.int64)    # calendar months fed
+        self.n, self.mean, self.m2 = np.zeros(k, dtype=np.int64), np.zeros(k), np.zeros(k)   # Welford, all history
+        self.ewma = np.full(k, np.nan)
+        self.d_n, self.d_mean, self.d_m2 = np.zeros(k, dtype=np.int64), np.zeros(k), np.zeros(k)  # seasonal changes
+
+    def grow(self, n_series: int):
+        """Append fresh state for series first seen now."""
+        extra = n_series - len(self.n)
+        if extra <= 0:
+            return
+        fresh = DetectorState(extra, self.params)
+        for f in self.FIELDS:
+            setattr(self, f, np.concatenate([getattr(self, f), getattr(fresh, f)]))
+
+    def step(self, x: np.ndarray) -> dict:
+        """
+        Score one month (x: one value per series, NaN = no data), then fold it in.
+        Returns {Expected, Rolling_Z, EWMA_Dev, Seasonal_Z}; deviations are NaN
+        until a detector has min_obs observations.
+        """
+        p = self.params
+        w, m, lam, min_obs = p["window"], p["season"], p["lam"], p["min_obs"]
+        seen = ~np.isnan(x)
+        xv = np.where(seen, x, 0.0)
+        rows = np.arange(len(x))
+        out = {}
+
+        # Rolling z-score against the previous `window` values
+        cnt = np.minimum(self.ring_n, w)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            r_mean = self.win_sum / cnt
+            r_var = (self.win_sq - cnt * r_mean ** 2) / (cnt - 1)
+            r_std = np.sqrt(np.maximum(r_var, 0.0))
+            ok = seen & (cnt >= min_obs) & (r_std > 0)
+            out["Expected"] = np.where(cnt > 0, r_mean, np.nan)
+            out["Rolling_Z"] = np.where(ok, (xv - r_mean) / r_std, np.nan)
+
+            # EWMA chart against all earlier values
+            ewma = np.where(np.isnan(self.ewma), xv, lam * xv + (1 - lam) * self.ewma)
+            sigma = np.sqrt(self.m2 / np.maximum(self.n - 1, 1))
+            limit = p["L"] * sigma * np.sqrt(lam / (2 - lam))
+            ok = seen & (self.n >= min_obs) & (limit > 0)
+            out["EWMA_Dev"] = np.where(ok, (ewma - self.mean) / limit, np.nan)
+
+            # Seasonal change vs the history of seasonal changes; the ring advances
+            # every month, so the lag is the same calendar month a season ago
+            lag = self.season_ring[rows, self.season_n % m]
+            has_lag = ~np.isnan(lag)
+            d = xv - lag
+            d_std = np.sqrt(self.d_m2 / np.maximum(self.d_n - 1, 1))
+            ok = seen & has_lag & (self.d_n >= min_obs) & (d_std > 0)
+            out["Seasonal_Z"] = np.where(ok, (d - self.d_mean) / d_std, np.nan)
+
+        # ----- fold the month in (only series with a value) -----
+        old = self.ring[rows, self.ring_pos]
+        full = self.ring_n >= w
+        self.win_sum += np.where(seen, xv - np.where(full, old, 0.0), 0.0)
+        self.win_sq += np.where(seen, xv ** 2 - np.where(full, old ** 2, 0.0), 0.0)
+        self.ring[rows, self.ring_pos] = np.where(seen, xv, old)
+        self.ring_pos = np.where(seen, (self.ring_pos + 1) % w, self.ring_pos)
+        self.ring_n += seen
+
+        self.ewma = np.where(seen, ewma, self.ewma)
+        n1 = self.n + seen
+        delta = np.where(seen, xv - self.mean, 0.0)
+        self.mean += np.where(seen, delta / np.maximum(n1, 1), 0.0)
+        self.m2 += np.where(seen, delta * (xv - self.mean), 0.0)
+        self.n = n1
+
+        upd = seen & has_lag
+        dn1 = self.d_n + upd
+        dd = np.where(upd, d - self.d_mean, 0.0)
+        self.d_mean += np.where(upd, dd / np.maximum(dn1, 1), 0.0)
+        self.d_m2 += np.where(upd, dd * (d - self.d_mean), 0.0)
+        self.d_n = dn1
+        self.season_ring[rows, self.season_n % m] = np.where(seen, xv, np.nan)
+        self.season_n += 1
+        return out
+
+    def save(self, path: Path):
+        np.savez(path, **{f: getattr(self, f) for f in self.FIELDS})
+
+    @classmethod
+    def load(cls, path: Path, params: dict):
+        arrays = np.load(path)
+        state = cls(0, params)
+        for f in cls.FIELDS:
+            setattr(state, f, arrays[f])
+        return state
+
+def flag(scores: dict, params: dict) -> tuple:
+    """({detector: bool per series}, severity = largest deviation relative to its threshold)."""
+    parts = {
+        "zscore": np.nan_to_num(np.abs(scores["Rolling_Z"]) / params["z"]),
+        "ewma": np.nan_to_num(np.abs(scores["EWMA_Dev"])),
+        "seasonal": np.nan_to_num(np.abs(scores["Seasonal_Z"]) / params["seasonal_z"]),
+    }
+    return {name: v >= 1 for name, v in parts.items()}, np.max(np.vstack(list(parts.values())), axis=0)
+
+def detect(labels, keys, grid: np.ndarray, state: DetectorState, by: str = "Department") -> pd.DataFrame:
+    """Run months (rows of grid) through the detectors in order. Returns the flagged cells."""
+    frames = []
+    for i, month in enumerate(labels):
+        x = grid[i]
+        scores = state.step(x)
+        hits, score = flag(scores, state.params)
+        hit = np.logical_or.reduce(list(hits.values()))
+        if hit.any():
+            names = [",".join(n for n, h in hits.items() if h[j]) for j in np.flatnonzero(hit)]
+            frames.append(pd.DataFrame({
+                "Month": month,
+                by: keys[hit],
+                "Variance_Pct": x[hit],
+                **{k: v[hit] for k, v in scores.items()},
+                "Detectors": names,
+                "Score": score[hit],
+            }))
+    cols = ["Month", by, *COLUMNS[1:]]
+    return pd.concat(frames, ignore_index=True)[cols] if frames else pd.DataFrame(columns=cols)
+
+def output_name(by: str = "Department") -> str:
+    return OUTPUT if by == "Department" else f"{OUTPUT}_{by}"
+
+# ---------- State ----------
+def _row_digests(grid: np.ndarray) -> list:
+    return [hashlib.sha1(np.ascontiguousarray(row).tobytes()).hexdigest()[:16] for row in grid]
+
+def _resume(meta: dict, labels, keys, grid: np.ndarray):
+    """
+    (months already processed, column order with known series first) when the
+    processed months are unchanged and no new series has data in them, else None.
+    """
+    done = int(np.searchsorted(labels, meta["last_month"], side="right"))
+    pos = {k: i for i, k in enumerate(keys)}
+    if done != len(meta["digests"]) or any(k not in pos for k in meta["keys"]):
+        return None
+    known = set(meta["keys"])
+    order = [pos[k] for k in meta["keys"]] + [i for i, k in enumerate(keys) if k not in known]
+    head = grid[:done][:, order]
+    if _row_digests(head[:, :len(known)]) != meta["digests"] or not np.isnan(head[:, len(known):]).all():
+        return None
+    return done, order
+
+def load_state(by: str, params: dict, state_dir: Path = STATE_DIR):
+    meta_path = state_dir / f"{by}.json"
+    if not meta_path.exists():
+        return None, None
+    meta = json.loads(meta_path.read_text(encoding="utf-8"))
+    if meta.get("version") != STATE_VERSION or meta.get("params") != params:
+        return None, None
+    return meta, DetectorState.load(state_dir / f"{by}.npz", params)
+
+def save_state(meta: dict, state: DetectorState, by: str, state_dir: Path = STATE_DIR):
+    state_dir.mkdir(parents=True, exist_ok=True)
+    state.save(state_dir / f"{by}.npz")
+    (state_dir / f"{by}.json").write_text(json.dumps(meta), encoding="utf-8")
+
+def run(df: pd.DataFrame, by: str = "Department", params=None, state_dir: Path = STATE_DIR,
+        previous: pd.DataFrame = None, full: bool = False):
+    """
+    Update the anomaly table with the months not seen before.
+    previous: the anomaly table from the last run (flags kept for processed months).
+    Returns (anomalies DataFrame, {"mode": full/online/unchanged, "months": months fed})
+    """
+    params = {**DEFAULTS, **(params or {})}
+    labels, keys, grid = monthly_variance(df, by)
+
+    if previous is not None and by not in previous.columns:
+        previous = None  # flags of another key: rescan
+    meta, state = (None, None) if full or previous is None else load_state(by, params, state_dir)
+    resumed = _resume(meta, labels, keys, grid) if meta is not None else None
+    if resumed is None:
+        state, start, previous = DetectorState(len(keys), params), 0, None
+    else:
+        start, order = resumed
+        keys, grid = keys[order], grid[:, order]
+        state.grow(len(keys))
+
+    with span("anomaly.detect", series=len(keys), months=len(labels) - start):
+        flagged = detect(labels[start:], keys, grid[start:], state, by)
+
+    parts = [f for f in (previous, flagged) if f is not None and not f.empty]
+    out = pd.concat(parts, ignore_index=True) if parts else flagged
+    out = out.sort_values(["Month", "Score"], ascending=[True, False], kind="stable").reset_index(drop=True)
+    save_state({
+        "version": STATE_VERSION, "params": params, "keys": list(keys),
+        "last_month": str(labels[-1]), "digests": _row_digests(grid),
+    }, state, by, state_dir)
+    mode = "full" if start == 0 else ("unchanged" if start == len(labels) else "online")
+    return out, {"mode": mode, "months": len(labels) - start}
+
+# ---------- Reporting ----------
+def recent(anoms: pd.DataFrame, months: int = 3, top: int = 5, latest=None) -> pd.DataFrame:
+    """Strongest flags of the `months` months up to `latest` (default: the last flagged month), most severe first."""
+    if anoms is None or anoms.empty:
+        return pd.DataFrame(columns=COLUMNS)
+    anoms = anoms.assign(Month=anoms["Month"].astype(str))
+    code = schema.month_codes(anoms["Month"])
+    end = int(schema.month_codes([str(latest)])[0]) if latest is not None else int(code.max())
+    pick = anoms[(code > end - months) & (code <= end)]
+    return pick.sort_values("Score", ascending=False, kind="stable").head(top).reset_index(drop=True)
+
+def describe(row, by: str = "Department") -> str:
+    """One line per flag, e.g. '2024-11 Sales: variance -18.2% vs +0.4% expected (zscore, ewma)'."""
+    expected = "" if pd.isna(row["Expected"]) else f" vs {row['Expected']:+.1f}% expected"
+    return f"{row['Month']} {row[by]}: variance {row['Variance_Pct']:+.1f}%{expected} ({row['Detectors'].replace(',', ', ')})"
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Flag month-level breaks in department variances")
+    p.add_argument("--by", default="Department", help="series key: Department (default) or any ledger column")
+    p.add_argument("--window", type=int, default=DEFAULTS["window"], help="rolling z-score window (months)")
+    p.add_argument("--z", type=float, default=DEFAULTS["z"], help="rolling z-score threshold")
+    p.add_argument("--lam", type=float, default=DEFAULTS["lam"], help="EWMA smoothing λ")
+    p.add_argument("--L", type=float, default=DEFAULTS["L"], help="EWMA control limit width (σ)")
+    p.add_argument("--season", type=int, default=DEFAULTS["season"], help="season length (months)")
+    p.add_argument("--seasonal-z", type=float, default=DEFAULTS["seasonal_z"], help="seasonal residual threshold")
+    p.add_argument("--min-obs", type=int, default=DEFAULTS["min_obs"], help="history needed before a detector flags")
+    p.add_argument("--full", action="store_true", help="ignore saved detector state and rescan every month")
+    return p.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    params = {"window": args.window, "z": args.z, "lam": args.lam, "L": args.L,
+              "season": args.season, "seasonal_z": args.seasonal_z, "min_obs": args.min_obs}
+    cols = ["Month", args.by, "Revenue", "Forecast_Revenue"]
+    source = "department_variance" if args.by == "Department" else "financials"
+    df = storage.read_table(source, columns=cols)
+    output = output_name(args.by)
+    previous = storage.read_table(output) if storage.table_exists(output) else None
+
+    anoms, info = run(df, args.by, params, previous=previous, full=args.full)
+    path = storage.write_table(anoms, output)
+    print(f"✅ {len(anoms)} anomal{'y' if len(anoms) == 1 else 'ies'} → {path} "
+          f"({info['mode']}, {info['months']} month(s) scanned)")
+    for _, row in recent(anoms).iterrows():
+        print(f"🔎 {describe(row, args.by)}")
+
+if __name__ == "__main__":
+    main()
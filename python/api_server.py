@@ -0,0 +1,307 @@
+# python/api_server.py
+"""
+Local read-only HTTP API over the computed outputs in data/.
+
+One warm process loads the output tables once, keeps them in memory indexed by
+department and month, and answers filtered queries. BI tools and scripts ask it
+instead of re-parsing the CSVs:
+
+  GET /                                   tables with row counts and versions
+  GET /health
+  GET /tables/<name>?from=2024-01&to=2024-06&department=Sales,Marketing&columns=Month,Revenue&format=csv
+
+Every table response carries an ETag derived from the table contents and the
+query, so a client repeating a request with If-None-Match gets a bodyless 304
+until the pipeline writes outputs with different data. A background task stats
+the table files every --interval seconds and reloads (off the event loop) the
+ones whose mtime or size changed; a half-written file is skipped and retried on
+the next tick.
+
+Stdlib asyncio only (HTTP/1.1 with keep-alive, GET/HEAD); bind to localhost.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+from collections import OrderedDict
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import numpy as np
+import pandas as pd
+
+import storage
+
+TABLES = [
+    "variance_summary",
+    "monthly_trend",
+    "department_variance",
+    "latest_kpis",
+    "forecast_by_department",
+    "forecast_reconciled",
+]
+RESPONSE_CACHE = 256   # encoded responses kept per process
+MAX_HEADER_BYTES = 16 * 1024
+
+# ---------- Indexed tables ----------
+class IndexedTable:
+    """
+    A table sorted by Month with a department -> row positions index, so month
+    ranges are two binary searches and department filters are array lookups.
+    """
+
+    def __init__(self, name: str, df: pd.DataFrame, version: str):
+        self.name, self.version = name, version
+        if "Month" in df.columns:
+            df = df.assign(Month=df["Month"].astype(str).str[:7]).sort_values("Month", kind="stable")
+        df = df.reset_index(drop=True)
+        for col in df.columns:
+            if isinstance(df[col].dtype, pd.CategoricalDtype):
+                df[col] = df[col].astype(str)
+        self.df = df
+        self.months = df["Month"].to_numpy(dtype=str) if "Month" in df.columns else None
+        self.by_dept = None
+        if "Department" in df.columns:
+            codes, uniques = pd.factorize(df["Department"].astype(str))
+            order = np.argsort(codes, kind="stable")
+            bounds = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+            self.by_dept = {u: order[bounds[i]:bounds[i + 1]] for i, u in enumerate(uniques)}
+        # Content digest: a rewrite with identical data keeps serving the same ETags
+        h = hashlib.sha1(",".join(df.columns).encode("utf-8"))
+        h.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+        self.digest = h.hexdigest()[:16]
+
+    def query(self, month_from=None, month_to=None, departments=None, columns=None) -> pd.DataFrame:
+        """Rows within [month_from, month_to] (YYYY-MM, inclusive) for the given departments."""
+        lo, hi = 0, len(self.df)
+        if self.months is not None:
+            if month_from:
+                lo = int(np.searchsorted(self.months, month_from[:7], side="left"))
+            if month_to:
+                hi = int(np.searchsorted(self.months, month_to[:7], side="right"))
+        elif month_from or month_to:
+            raise ValueError(f"{self.name} has no Month column")
+
+        if departments:
+            if self.by_dept is None:
+                raise ValueError(f"{self.name} has no Department column")
+            picked = [self.by_dept[d] for d in departments if d in self.by_dept]
+            rows = np.sort(np.concatenate(picked)) if picked else np.empty(0, dtype=np.intp)
+            rows = rows[(rows >= lo) & (rows < hi)]
+            out = self.df.iloc[rows]
+        else:
+            out = self.df.iloc[lo:hi]
+
+        if columns:
+            missing = [c for c in columns if c not in out.columns]
+            if missing:
+                raise ValueError(f"Unknown column(s) for {self.name}: {', '.join(missing)}")
+            out = out[columns]
+        return out
+
+    def info(self) -> dict:
+        return {"rows": len(self.df), "columns": list(self.df.columns), "version": self.version}
+
+def _stamp(name: str, data_dir):
+    """(path, version) of a table file; version changes whenever the file is rewritten."""
+    path = storage.resolve(name, data_dir=data_dir)
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        return path, None
+    return path, f"{st.st_mtime_ns:x}-{st.st_size:x}"
+
+class TableStore:
+    """The loaded tables plus the hot-reload logic."""
+
+    def __init__(self, names=TABLES, data_dir=storage.DATA_DIR):
+        self.names, self.data_dir = list(names), data_dir
+        self.tables = {}
+
+    def _load(self, name, version):
+        df = storage.read_table(name, data_dir=self.data_dir)
+        return IndexedTable(name, df, version)
+
+    def refresh(self) -> list:
+        """Reload tables whose files changed (or disappeared). Returns the names that changed."""
+        changed = []
+        for name in self.names:
+            _, version = _stamp(name, self.data_dir)
+            current = self.tables.get(name)
+            if version is None:
+                if current is not None:
+                    del self.tables[name]
+                    changed.append(name)
+                continue
+            if current is not None and current.version == version:
+                continue
+            try:
+                table = self._load(name, version)
+            except Exception as e:  # mid-write or malformed: keep serving the old copy
+                print(f"⚠️ Could not load {name}: {type(e).__name__}: {e}")
+                continue
+            if _stamp(name, self.data_dir)[1] != version:  # rewritten while we read it
+                continue
+            self.tables[name] = table
+            changed.append(name)
+        return changed
+
+# ---------- HTTP ----------
+REASONS = {200: "OK", 304: "Not Modified", 400: "Bad Request", 404: "Not Found",
+           405: "Method Not Allowed", 431: "Request Header Fields Too Large"}
+
+def _response(status, body=b"", content_type="application/json", headers=None, head=False) -> bytes:
+    lines = [f"HTTP/1.1 {status} {REASONS[status]}"]
+    hdrs = {"Content-Type": content_type, "Content-Length": str(len(body)), "Cache-Control": "no-cache"}
+    if status == 304:
+        hdrs.pop("Content-Type")
+        hdrs.pop("Content-Length")
+    hdrs.update(headers or {})
+    lines += [f"{k}: {v}" for k, v in hdrs.items()]
+    out = ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+    return out if head or status == 304 else out + body
+
+def _error(status, message, head=False) -> bytes:
+    return _response(status, json.dumps({"error": message}).encode("utf-8"), head=head)
+
+def _split(values) -> list:
+    return [v.strip() for raw in values for v in raw.split(",") if v.strip()]
+
+class ApiServer:
+    def __init__(self, store: TableStore, interval: float = 1.0):
+        self.store, self.interval = store, interval
+        self.cache = OrderedDict()  # (name, content digest, query) -> (etag, content type, body)
+        self.requests = 0
+
+    # ----- routing -----
+    def table_response(self, name, params):
+        table = self.store.tables.get(name)
+        if table is None:
+            return 404, None, None, None
+        fmt = (params.get("format") or ["json"])[-1]
+        key = (name, table.digest, tuple(sorted((k, tuple(v)) for k, v in params.items())))
+        hit = self.cache.get(key)
+        if hit is not None:
+            self.cache.move_to_end(key)
+            return (200, *hit)
+
+        if fmt not in ("json", "csv"):
+            raise ValueError("format must be json or csv")
+        rows = table.query(
+            month_from=(params.get("from") or [None])[-1],
+            month_to=(params.get("to") or [None])[-1],
+            departments=_split(params.get("department", [])),
+            columns=_split(params.get("columns", [])),
+        )
+        if fmt == "csv":
+            body, ctype = rows.to_csv(index=False).encode("utf-8"), "text/csv; charset=utf-8"
+        else:
+            body, ctype = rows.to_json(orient="records", double_precision=10).encode("utf-8"), "application/json"
+        etag = '"' + hashlib.sha1(repr(key).encode("utf-8")).hexdigest()[:20] + '"'
+
+        self.cache[key] = (etag, ctype, body)
+        if len(self.cache) > RESPONSE_CACHE:
+            self.cache.popitem(last=False)
+        return 200, etag, ctype, body
+
+    def handle(self, method, target, headers) -> bytes:
+        head = method == "HEAD"
+        if method not in ("GET", "HEAD"):
+            return _error(405, "only GET and HEAD are supported", head)
+        url = urlsplit(target)
+        path = unquote(url.path).rstrip("/") or "/"
+        if path == "/health":
+            return _response(200, b'{"status": "ok"}', head=head)
+        if path == "/":
+            index = {n: t.info() for n, t in self.store.tables.items()}
+            return _response(200, json.dumps(index).encode("utf-8"), head=head)
+        if not path.startswith("/tables/"):
+            return _error(404, f"no route {path}", head)
+
+        name = path[len("/tables/"):]
+        try:
+            status, etag, ctype, body = self.table_response(name, parse_qs(url.query))
+        except ValueError as e:
+            return _error(400, str(e), head)
+        if status == 404:
+            return _error(404, f"unknown or missing table {name!r}", head)
+        tags = [t.strip() for t in headers.get("if-none-match", "").split(",")]
+        if etag in tags or "*" in tags:
+            return _response(304, headers={"ETag": etag}, head=head)
+        return _response(200, body, ctype, {"ETag": etag}, head=head)
+
+    # ----- connection loop -----
+    async def serve_client(self, reader, writer):
+        try:
+            while True:
+                try:
+                    raw = await reader.readuntil(b"\r\n\r\n")
+                except asyncio.LimitOverrunError:
+                    writer.write(_error(431, "request headers too large"))
+                    break
+                except asyncio.IncompleteReadError:
+                    break
+                lines = raw.decode("latin-1").split("\r\n")
+                try:
+                    method, target, version = lines[0].split(" ", 2)
+                except ValueError:
+                    writer.write(_error(400, "malformed request line"))
+                    break
+                headers = {}
+                for line in lines[1:]:
+                    if ":" in line:
+                        k, v = line.split(":", 1)
+                        headers[k.strip().lower()] = v.strip()
+                if int(headers.get("content-length", 0) or 0):
+                    await reader.readexactly(int(headers["content-length"]))
+
+                self.requests += 1
+                writer.write(self.handle(method, target, headers))
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close" or version == "HTTP/1.0":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def watch(self):
+        """Poll table file stats and reload changed tables in a worker thread."""
+        while True:
+            await asyncio.sleep(self.interval)
+            changed = await asyncio.to_thread(self.store.refresh)
+            if changed:
+                stale = [k for k in self.cache if k[0] in changed]
+                for k in stale:
+                    del self.cache[k]
+                print(f"🔄 Reloaded {', '.join(changed)}")
+
+    async def serve(self, host, port):
+        server = await asyncio.start_server(self.serve_client, host, port, limit=MAX_HEADER_BYTES)
+        watcher = asyncio.create_task(self.watch())
+        addr = server.sockets[0].getsockname()
+        print(f"✅ Serving {len(self.store.tables)} table(s) on http://{addr[0]}:{addr[1]}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            watcher.cancel()
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Serve the computed outputs over a local HTTP API")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8765)
+    p.add_argument("--interval", type=float, default=1.0, help="seconds between output file checks")
+    return p.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    store = TableStore()
+    loaded = store.refresh()
+    print(f"🗂️ Loaded {', '.join(loaded) or 'no tables'}")
+    try:
+        asyncio.run(ApiServer(store, args.interval).serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
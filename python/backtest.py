@@ -0,0 +1,181 @@
+# python/backtest.py
+"""
+Rolling-origin backtest of the department forecasts.
+
+For every department and cutoff month the model is refit on history up to the
+cutoff with forecast.fit_series (Holt-Winters, or the rolling-mean fallback)
+and its next HORIZON months are scored against actuals:
+
+  MAPE      mean |forecast - actual| / |actual|, in %
+  Bias      sum(forecast - actual) / sum(actual), in % (positive = over-forecast)
+  Coverage  share of actuals inside the 95% band, in %
+
+Cutoffs of one department run in order inside a task so each fit warm-starts
+from the previous cutoff's parameters. Tasks are spread over a process pool.
+"""
+import argparse
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import shared_ledger
+import storage
+import forecast
+from instrument import span
+
+DETAIL = "backtest_detail"
+SUMMARY = "backtest_summary"
+MIN_TRAIN = 12  # months of history before the first cutoff
+
+# ---------- Tasks ----------
+def cutoff_blocks(n_months: int, min_train: int = MIN_TRAIN, step: int = 1, last=None, block=None) -> list:
+    """
+    Cutoff positions (number of training months) grouped into contiguous blocks.
+    A cutoff needs at least one later month to score. `last` keeps only the latest N cutoffs.
+    """
+    cutoffs = list(range(min_train, n_months, step))
+    if last:
+        cutoffs = cutoffs[-last:]
+    if not cutoffs:
+        return []
+    block = block or len(cutoffs)
+    return [cutoffs[i:i + block] for i in range(0, len(cutoffs), block)]
+
+def _backtest_task(task):
+    """
+    Worker entry point: refit one department at each cutoff of a block, warm-starting
+    every fit from the previous one. The series may be a shared_ledger.SliceRef.
+    Never raises.
+    Returns (Department, detail DataFrame or None, error or None, {status: count})
+    """
+    dept, series, cutoffs = task
+    frames, statuses, entry = [], {}, None
+    try:
+        series = shared_ledger.resolve(series)
+        for c in cutoffs:
+            train, actual = series.iloc[:c], series.iloc[c:c + forecast.HORIZON].dropna()
+            if train.dropna().empty or actual.empty:
+                continue
+            f, new_entry, status = forecast.fit_series(train, entry)
+            entry = new_entry or entry
+            statuses[status or "fallback"] = statuses.get(status or "fallback", 0) + 1
+
+            f = f.assign(Horizon=np.arange(1, len(f) + 1))
+            f["Actual"] = f["Month"].map(dict(zip(actual.index.strftime("%Y-%m"), actual.to_numpy())))
+            f["Cutoff"] = train.index[-1].strftime("%Y-%m")
+            frames.append(f.dropna(subset=["Actual"]))
+        detail = pd.concat(frames, ignore_index=True) if frames else None
+        return dept, detail, None, statuses
+    except Exception as e:
+        return dept, None, f"{type(e).__name__}: {e}", statuses
+
+def run_backtest(wide: pd.DataFrame, min_train=MIN_TRAIN, step=1, last=None, workers=1, block=None, store=None):
+    """
+    Backtest every column of a months x departments grid (forecast.ledger_series output).
+    block: cutoffs per task; default keeps each department in one task unless there
+    are too few departments to keep the workers busy.
+    store: a shared_ledger store to use instead of `wide`; tasks then carry a
+    SliceRef and workers read their department from the memory-mapped ledger.
+    Returns (detail DataFrame, {dept: error}, {fit status: count})
+    """
+    if not workers:
+        workers = os.cpu_count() or 1
+    if store is not None:
+        depts, n_months, series_of = list(store.departments), store.n_months, store.ref
+    else:
+        depts, n_months, series_of = list(wide.columns), len(wide), wide.__getitem__
+    n_cutoffs = len(cutoff_blocks(n_months, min_train, step, last)[0]) if n_months > min_train else 0
+    if block is None and workers > 1 and depts and len(depts) < workers * 4 and n_cutoffs:
+        block = math.ceil(n_cutoffs / math.ceil(workers * 4 / len(depts)))
+
+    tasks = [(dept, series_of(dept), cutoffs)
+             for dept in depts
+             for cutoffs in cutoff_blocks(n_months, min_train, step, last, block)]
+
+    with span("backtest.fits", tasks=len(tasks), series=len(depts)):
+        if workers <= 1 or len(tasks) <= 1:
+            results = [_backtest_task(t) for t in tasks]
+        else:
+            chunksize = max(1, math.ceil(len(tasks) / (workers * 4)))
+            if forecast.HAS_SM:
+                forecast._exponential_smoothing()  # before forking, see forecast.HAS_SM
+            with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+                results = list(pool.map(_backtest_task, tasks, chunksize=chunksize))
+
+    frames, errors, statuses = [], {}, {}
+    for dept, detail, err, st in results:
+        for k, v in st.items():
+            statuses[k] = statuses.get(k, 0) + v
+        if err is not None:
+            errors[dept] = err
+        elif detail is not None:
+            frames.append(detail.assign(Department=dept))
+    cols = ["Department", "Cutoff", "Month", "Horizon", "Actual", "Forecast", "Lower", "Upper"]
+    detail = pd.concat(frames, ignore_index=True)[cols] if frames else pd.DataFrame(columns=cols)
+    return detail, errors, statuses
+
+# ---------- Scoring ----------
+def _scores(g: pd.DataFrame) -> pd.Series:
+    a, f = g["Actual"].to_numpy(float), g["Forecast"].to_numpy(float)
+    nz = a != 0
+    return pd.Series({
+        "N": len(g),
+        "MAPE": np.abs(f[nz] - a[nz]).dot(1 / np.abs(a[nz])) / nz.sum() * 100 if nz.any() else np.nan,
+        "Bias_Pct": (f - a).sum() / a.sum() * 100 if a.sum() else np.nan,
+        "Coverage_Pct": ((g["Lower"] <= g["Actual"]) & (g["Actual"] <= g["Upper"])).mean() * 100,
+    })
+
+def score(detail: pd.DataFrame, by=("Department",)) -> pd.DataFrame:
+    """MAPE, bias and interval coverage per group, plus an ALL row across departments."""
+    by = list(by)
+    if detail.empty:
+        return pd.DataFrame(columns=[*by, "N", "MAPE", "Bias_Pct", "Coverage_Pct"])
+    per = [_scores(g).rename(k) for k, g in detail.groupby(by, sort=True)]
+    out = pd.DataFrame(per)
+    out.index = pd.MultiIndex.from_tuples([k if isinstance(k, tuple) else (k,) for k in out.index], names=by)
+    out = out.reset_index()
+    if "Department" in by:
+        rest = [c for c in by if c != "Department"]
+        total = score(detail, rest) if rest else pd.DataFrame([_scores(detail)])
+        out = pd.concat([out, total.assign(Department="ALL")], ignore_index=True)
+    out["N"] = out["N"].astype(int)
+    return out[[*by, "N", "MAPE", "Bias_Pct", "Coverage_Pct"]].round(2)
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Rolling-origin backtest of the department forecasts")
+    p.add_argument("--min-train", type=int, default=MIN_TRAIN, help="history months before the first cutoff")
+    p.add_argument("--step", type=int, default=1, help="months between cutoffs")
+    p.add_argument("--last", type=int, default=None, help="only the latest N cutoffs")
+    p.add_argument("--workers", type=int, default=1, help="worker processes (1 = in-process, 0 = all cores)")
+    p.add_argument("--block", type=int, default=None, help="cutoffs per task (default: auto)")
+    p.add_argument("--by-horizon", action="store_true", help="also score each forecast horizon separately")
+    p.add_argument("--shared", action="store_true",
+                   help="workers read their department from the memory-mapped ledger (shared_ledger.py)")
+    return p.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.shared:
+        wide, store = None, shared_ledger.ensure()
+        n_depts = len(store.departments)
+    else:
+        wide, store = forecast.ledger_series(forecast.load_ledger()), None
+        n_depts = wide.shape[1]
+    detail, errors, statuses = run_backtest(wide, args.min_train, args.step, args.last, args.workers, args.block, store)
+
+    summary = score(detail, ["Department", "Horizon"] if args.by_horizon else ["Department"])
+    detail_path = storage.write_table(detail.round(2), DETAIL)
+    summary_path = storage.write_table(summary, SUMMARY)
+
+    print(f"✅ Backtest: {detail['Cutoff'].nunique()} cutoff(s) x {n_depts} department(s) → {detail_path}")
+    print(f"✅ Accuracy summary → {summary_path}")
+    print("🗂️ Fits:", ", ".join(f"{k} {v}" for k, v in sorted(statuses.items())) or "none")
+    for dept, err in errors.items():
+        print(f"⚠️ Backtest failed for {dept}: {err}")
+    print(summary.to_string(index=False))
+
+if __name__ == "__main__":
+    main()
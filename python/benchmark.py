@@ -0,0 +1,222 @@
+# python/benchmark.py
+"""
+Time and memory-profile every pipeline stage at increasing ledger sizes.
+
+Each scale gets a fresh seeded ledger in a temp directory (data/ is never
+touched), then generate → load → variance → forecast → summary → visuals → deck
+run in order. Per stage we record wall time, CPU time, the process max RSS so
+far and the tracemalloc peak (Python + numpy allocations made by the stage,
+taken from a second traced run so tracing does not skew the timings).
+
+Results go to data/benchmarks/<timestamp>.json. Pass --compare <older.json>
+to fail (exit 1) when a stage got slower or hungrier than --tolerance allows.
+
+    python python/benchmark.py --scales 1e4,1e5,1e6
+    python python/benchmark.py --scales 1e5 --compare data/benchmarks/baseline.json
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+
+os.environ.setdefault("MPLBACKEND", "Agg")
+
+import numpy as np
+import pandas as pd
+
+try:
+    import resource  # Unix only
+except ImportError:
+    resource = None
+
+import storage
+import ai_summary
+import forecast
+import generate_data
+import make_deck
+import make_visuals
+import variance_analysis
+from summary_engine import SummaryEngine
+
+DATA_DIR = Path(__file__).resolve().parents[1] / "data"
+OUT_DIR = DATA_DIR / "benchmarks"
+
+STAGES = ["generate", "load", "variance", "forecast", "summary", "visuals", "deck"]
+
+# Ledger shape per scale: fixed months/departments/entities, accounts grow to reach the row target
+MONTHS, DEPARTMENTS, ENTITIES = 36, 12, 4
+
+def ledger_shape(rows: int) -> dict:
+    per_account = MONTHS * DEPARTMENTS * ENTITIES
+    if rows <= MONTHS * DEPARTMENTS:
+        return {"months": MONTHS, "departments": max(1, math.ceil(rows / MONTHS)), "entities": 1, "accounts": 1}
+    return {"months": MONTHS, "departments": DEPARTMENTS, "entities": ENTITIES,
+            "accounts": max(1, math.ceil(rows / per_account))}
+
+def _maxrss_mb():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+# ---------- Measurement ----------
+def measure(fn, trace_memory=True):
+    """
+    Time fn() untraced, then (optionally) run it again under tracemalloc for its
+    peak allocation, since tracing slows pandas/numpy code several-fold.
+    Returns {wall_s, cpu_s, peak_mb, maxrss_mb}
+    """
+    wall, cpu = time.perf_counter(), time.process_time()
+    fn()
+    wall = time.perf_counter() - wall
+    cpu = time.process_time() - cpu
+    maxrss = _maxrss_mb()
+
+    peak = None
+    if trace_memory:
+        tracemalloc.start()
+        try:
+            fn()
+            peak = tracemalloc.get_traced_memory()[1] / 1e6
+        finally:
+            tracemalloc.stop()
+    return {
+        "wall_s": round(wall, 4),
+        "cpu_s": round(cpu, 4),
+        "peak_mb": None if peak is None else round(peak, 2),
+        "maxrss_mb": maxrss,
+    }
+
+def run_scale(rows: int, seed: int = 42, workers: int = 1, trace_memory=True, stages=STAGES) -> list:
+    """Run the selected stages on a fresh ledger of about `rows` rows. Returns result dicts."""
+    shape = ledger_shape(rows)
+    results = []
+    state = {}
+
+    with tempfile.TemporaryDirectory(prefix="fpna_bench_") as tmp:
+        tmp = Path(tmp)
+
+        def generate():
+            _, state["rows"] = generate_data.write_ledger(data_dir=tmp, seed=seed, **shape)
+
+        def load():
+            state["ledger"] = variance_analysis.load_financials(tmp)
+
+        def variance():
+            outputs = variance_analysis.build_outputs(state["ledger"])
+            variance_analysis.write_outputs(outputs, tmp)
+            state["variance"] = outputs
+
+        def fcst():
+            out, errors = forecast.forecast_frame(state["ledger"], workers=workers)
+            storage.write_table(out, forecast.OUTPUT, data_dir=tmp)
+            state["forecast"] = out
+
+        def summary():
+            v = state["variance"]
+            engine = SummaryEngine(client=None, model="offline")  # rule-based path, no network
+            text, _ = ai_summary.build_summary(v["latest_kpis"], v["variance_summary"], state["forecast"], engine=engine)
+            ai_summary.write_summary(text, tmp)
+            state["summary"] = text
+
+        def visuals():
+            v = state["variance"]
+            # measure() runs a stage twice; force so the traced run draws instead of hitting the manifest
+            make_visuals.render_charts(v["monthly_trend"], v["variance_summary"], state["forecast"], out_dir=tmp, force=True)
+
+        def deck():
+            make_deck.build_deck(state["summary"], data_dir=tmp)
+
+        fns = {"generate": generate, "load": load, "variance": variance, "forecast": fcst,
+               "summary": summary, "visuals": visuals, "deck": deck}
+        # Later stages need earlier outputs, so always run prerequisites but only report selected ones
+        last = max(STAGES.index(s) for s in stages)
+        for name in STAGES[:last + 1]:
+            stats = measure(fns[name], trace_memory)
+            if name in stages:
+                results.append({"scale": rows, "rows": state.get("rows"), "stage": name, **stats})
+            if name == "forecast":
+                state.pop("ledger", None)  # later stages only need the rollups
+    return results
+
+# ---------- Regression check ----------
+def compare(current: list, baseline: list, tolerance: float, min_wall: float = 0.05) -> list:
+    """Stages whose wall time or peak memory grew by more than `tolerance` (fraction) vs baseline."""
+    base = {(r["scale"], r["stage"]): r for r in baseline}
+    regressions = []
+    for r in current:
+        b = base.get((r["scale"], r["stage"]))
+        if b is None:
+            continue
+        if r["wall_s"] > max(b["wall_s"], min_wall) * (1 + tolerance):
+            regressions.append(f"{r['stage']}@{r['scale']:,}: wall {b['wall_s']:.3f}s → {r['wall_s']:.3f}s")
+        if r["peak_mb"] and b.get("peak_mb") and r["peak_mb"] > max(b["peak_mb"], 1.0) * (1 + tolerance):
+            regressions.append(f"{r['stage']}@{r['scale']:,}: peak {b['peak_mb']:.1f}MB → {r['peak_mb']:.1f}MB")
+    return regressions
+
+def environment() -> dict:
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "statsmodels": forecast.HAS_SM,
+        "storage": storage.DEFAULT_FORMAT,
+    }
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Benchmark pipeline stages at increasing ledger sizes")
+    p.add_argument("--scales", default="1e3,1e4,1e5",
+                   help="comma-separated target row counts, e.g. 1e4,1e5,1e6,1e7")
+    p.add_argument("--stages", default=",".join(STAGES), help=f"subset of {','.join(STAGES)}")
+    p.add_argument("--seed", type=int, default=42)
+    p.add_argument("--workers", type=int, default=1, help="forecast worker processes")
+    p.add_argument("--no-tracemalloc", action="store_true",
+                   help="skip the traced rerun (halves run time, no per-stage peak)")
+    p.add_argument("--output", type=Path, default=None, help="results JSON (default data/benchmarks/<timestamp>.json)")
+    p.add_argument("--compare", type=Path, default=None, help="earlier results JSON to check for regressions")
+    p.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown / growth vs --compare")
+    return p.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    scales = [int(float(s)) for s in args.scales.split(",") if s.strip()]
+    stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        raise SystemExit(f"Unknown stages: {sorted(unknown)}")
+
+    results = []
+    for rows in scales:
+        print(f"⏱️ Scale {rows:,} rows {ledger_shape(rows)}")
+        for r in run_scale(rows, args.seed, args.workers, not args.no_tracemalloc, stages):
+            results.append(r)
+            peak = "     n/a" if r["peak_mb"] is None else f"{r['peak_mb']:8.1f}"
+            print(f"  - {r['stage']:<9} {r['wall_s']:8.3f}s wall {r['cpu_s']:8.3f}s cpu {peak}MB peak")
+
+    out = args.output or OUT_DIR / f"{datetime.now():%Y%m%d-%H%M%S}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps({"environment": environment(), "results": results}, indent=2), encoding="utf-8")
+    print(f"✅ Wrote benchmark results → {out}")
+
+    if args.compare:
+        baseline = json.loads(args.compare.read_text(encoding="utf-8"))["results"]
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"⚠️ {len(regressions)} regression(s) vs {args.compare}:")
+            for line in regressions:
+                print(f"  - {line}")
+            sys.exit(1)
+        print(f"✅ No regressions vs {args.compare} (tolerance {args.tolerance:.0%})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+# python/build_cache.py
+"""
+Content-hash build cache for pipeline stages (make-style skipping, Bazel-style keys).
+
+A stage's key is the hash of its name, the source of the modules it runs (and
+every local module they import, found by walking their imports), its
+parameters and the content of its input files. After a stage runs, the key is
+stored together with the content hashes of the outputs it wrote. Next time, a
+stage whose key is known and whose outputs still hash to the recorded values is
+skipped; downstream stages read its outputs from disk instead.
+
+File hashes are memoized by (size, mtime) so unchanged files are not re-read.
+Entries carry a last-used timestamp and are evicted by age and count.
+
+    python python/build_cache.py list
+    python python/build_cache.py evict --max-age-days 7
+    python python/build_cache.py clear [--stage variance]
+"""
+import argparse
+import ast
+import hashlib
+import json
+import threading
+import time
+from pathlib import Path
+
+DATA_DIR = Path(__file__).resolve().parents[1] / "data"
+CACHE_PATH = DATA_DIR / ".build_cache.json"
+SRC_DIR = Path(__file__).resolve().parent
+CACHE_VERSION = 1
+
+def file_sha1(path: Path) -> str:
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def _imports(name: str) -> set:
+    """Modules under python/ that a module imports anywhere (lazy imports inside functions too)."""
+    tree = ast.parse((SRC_DIR / f"{name}.py").read_bytes())
+    found = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            found.update(a.name.split(".")[0] for a in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            found.add(node.module.split(".")[0])
+    return {m for m in found if (SRC_DIR / f"{m}.py").exists()}
+
+def local_modules(modules) -> list:
+    """The given modules plus every module under python/ they import, transitively."""
+    seen, todo = set(), list(modules)
+    while todo:
+        name = todo.pop()
+        if name not in seen:
+            seen.add(name)
+            todo.extend(_imports(name) - seen)
+    return sorted(seen)
+
+def code_version(modules) -> str:
+    """Hash of the source files of the given modules (names under python/) and their local imports."""
+    h = hashlib.sha1()
+    for name in local_modules(modules):
+        h.update(name.encode("utf-8"))
+        h.update((SRC_DIR / f"{name}.py").read_bytes())
+    return h.hexdigest()
+
+class BuildCache:
+    """
+    On-disk record of stage runs: {stage: {key: {"outputs": {path: sha1}, "last_used": ts}}}
+    plus a {path: [size, mtime_ns, sha1]} memo. Safe to share between the
+    pipeline's stage threads.
+    """
+
+    def __init__(self, path: Path = CACHE_PATH, max_entries: int = 8, max_age_days: float = 30):
+        self.path = Path(path)
+        self.max_entries = max_entries  # per stage
+        self.max_age_days = max_age_days
+        self.entries, self.files = {}, {}
+        self.stats = {"reused": [], "rebuilt": [], "evicted": 0}
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        if not self.path.exists():
+            return
+        try:
+            payload = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return  # unreadable cache is just a cold cache
+        if payload.get("version") == CACHE_VERSION:
+            self.entries = payload.get("entries", {})
+            self.files = payload.get("files", {})
+
+    # ---------- Hashing ----------
+    def hash_file(self, path) -> str:
+        """Content hash of a file, or None if it does not exist. Memoized by size + mtime."""
+        path = Path(path)
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            return None
+        key = str(path.resolve())
+        with self._lock:
+            memo = self.files.get(key)
+        if memo and memo[0] == st.st_size and memo[1] == st.st_mtime_ns:
+            return memo[2]
+        digest = file_sha1(path)
+        with self._lock:
+            self.files[key] = [st.st_size, st.st_mtime_ns, digest]
+        return digest
+
+    def stage_key(self, stage: str, inputs=(), code=(), params=None) -> str:
+        h = hashlib.sha1(f"{CACHE_VERSION}|{stage}".encode("utf-8"))
+        h.update(code_version(code).encode("utf-8"))
+        h.update(json.dumps(params or {}, sort_keys=True, default=str).encode("utf-8"))
+        for path in sorted(str(p) for p in inputs):
+            h.update(f"{Path(path).name}={self.hash_file(path)}".encode("utf-8"))
+        return h.hexdigest()
+
+    # ---------- Lookups ----------
+    def lookup(self, stage: str, key: str) -> bool:
+        """True when the stage ran with this key before and its outputs are unchanged since."""
+        with self._lock:
+            entry = self.entries.get(stage, {}).get(key)
+        if entry is None or not entry["outputs"]:
+            return False
+        if any(self.hash_file(p) != digest for p, digest in entry["outputs"].items()):
+            return False
+        with self._lock:
+            entry["last_used"] = time.time()
+            self.stats["reused"].append(stage)
+        return True
+
+    def record(self, stage: str, key: str, outputs):
+        """Store a finished run: the key and the content hashes of the outputs it wrote."""
+        hashes = {str(p): self.hash_file(p) for p in outputs}
+        with self._lock:
+            self.entries.setdefault(stage, {})[key] = {
+                "outputs": {p: d for p, d in hashes.items() if d is not None},
+                "last_used": time.time(),
+            }
+            self.stats["rebuilt"].append(stage)
+
+    def invalidate(self, stage=None):
+        """Drop one stage's entries, or everything when stage is None."""
+        with self._lock:
+            if stage is None:
+                self.entries.clear()
+                self.files.clear()
+            else:
+                self.entries.pop(stage, None)
+
+    def evict(self):
+        """Drop entries older than max_age_days, then the least recently used beyond max_entries per stage."""
+        cutoff = time.time() - self.max_age_days * 86400 if self.max_age_days else None
+        with self._lock:
+            for stage, runs in list(self.entries.items()):
+                before = len(runs)
+                if cutoff is not None:
+                    runs = {k: e for k, e in runs.items() if e.get("last_used", 0) >= cutoff}
+                if self.max_entries and len(runs) > self.max_entries:
+                    newest = sorted(runs.items(), key=lambda kv: kv[1].get("last_used", 0), reverse=True)
+                    runs = dict(newest[: self.max_entries])
+                self.stats["evicted"] += before - len(runs)
+                if runs:
+                    self.entries[stage] = runs
+                else:
+                    del self.entries[stage]
+            live = {p for runs in self.entries.values() for e in runs.values() for p in e["outputs"]}
+            self.files = {p: m for p, m in self.files.items() if p in live or Path(p).exists()}
+
+    def save(self):
+        self.evict()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        with self._lock:
+            payload = {"version": CACHE_VERSION, "entries": self.entries, "files": self.files}
+            tmp.write_text(json.dumps(payload), encoding="utf-8")
+        tmp.replace(self.path)
+
+    def summary(self) -> str:
+        s = self.stats
+        return (f"{len(s['reused'])} reused ({', '.join(s['reused']) or 'none'}), "
+                f"{len(s['rebuilt'])} rebuilt, {s['evicted']} evicted")
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Inspect or evict the pipeline build cache")
+    sub = p.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("list", help="cached stage runs")
+    e = sub.add_parser("evict", help="drop old entries")
+    e.add_argument("--max-age-days", type=float, default=30)
+    e.add_argument("--max-entries", type=int, default=8, help="runs kept per stage")
+    c = sub.add_parser("clear", help="drop every entry (or one stage's)")
+    c.add_argument("--stage", default=None)
+    return p.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.cmd == "list":
+        cache = BuildCache()
+        for stage, runs in sorted(cache.entries.items()):
+            for key, e in sorted(runs.items(), key=lambda kv: -kv[1].get("last_used", 0)):
+                used = time.strftime("%Y-%m-%d %H:%M", time.localtime(e.get("last_used", 0)))
+                print(f"  {stage:<10} {key[:12]}  last used {used}  {len(e['outputs'])} output(s)")
+        return
+    if args.cmd == "evict":
+        cache = BuildCache(max_entries=args.max_entries, max_age_days=args.max_age_days)
+    else:
+        cache = BuildCache()
+        cache.invalidate(args.stage)
+    cache.save()
+    print(f"✅ Build cache saved → {cache.path} ({cache.stats['evicted']} evicted)")
+
+if __name__ == "__main__":
+    main()
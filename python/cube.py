@@ -0,0 +1,276 @@
+# python/cube.py
+import argparse
+import json
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import storage
+
+DATA_DIR = Path(__file__).resolve().parents[1] / "data"
+CUBE_PATH = DATA_DIR / "cube.npz"
+
+MEASURES = ["Revenue", "Expense", "Forecast_Revenue"]
+
+# Coarsest -> finest. Levels missing from the ledger are dropped; Year and
+# Quarter are derived from Month.
+DEFAULT_HIERARCHIES = {
+    "Time": ["Year", "Quarter", "Month"],
+    "Org": ["Entity", "Department", "Cost_Center"],
+    "Geo": ["Region"],
+    "Account": ["Account"],
+    "Product": ["Product"],
+}
+DEFAULT_ROLLUPS = [("Department",), ("Month",), ("Department", "Month")]
+
+def _derive_time(df: pd.DataFrame) -> pd.DataFrame:
+    # Parse each distinct month once, then broadcast back through the codes
+    codes, uniq = pd.factorize(df["Month"].astype(str))
+    month = pd.PeriodIndex([u[:7] for u in uniq], freq="M")
+    return df.assign(
+        Month=np.asarray(month.strftime("%Y-%m"), dtype=object)[codes],
+        Quarter=np.asarray(month.asfreq("Q").strftime("%YQ%q"), dtype=object)[codes],
+        Year=np.asarray(month.year.astype(str), dtype=object)[codes],
+    )
+
+def _group_sum(keys: np.ndarray, values: np.ndarray):
+    """Sum rows of values (n x m) by integer keys. Returns (unique keys, sums)."""
+    uniq, inv = np.unique(keys, return_inverse=True)
+    sums = np.empty((len(uniq), values.shape[1]))
+    for j in range(values.shape[1]):
+        sums[:, j] = np.bincount(inv, weights=values[:, j], minlength=len(uniq))
+    return uniq, sums
+
+class Cube:
+    """
+    Array-backed OLAP cube over the ledger.
+
+    Each dimension level has an index (sorted member labels; position = code).
+    Facts are stored as aggregates: an int32 code matrix (cells x levels) plus a
+    float64 measure matrix (cells x measures). The base aggregate is at the
+    finest level of every hierarchy; extra rollups (e.g. Department x Month)
+    are materialized at build time, and any query is answered from the smallest
+    aggregate whose levels can be mapped up to the requested ones, so the ledger
+    is never rescanned.
+    """
+
+    def __init__(self, hierarchies, members, up, aggregates, measures):
+        self.hierarchies = hierarchies      # {hierarchy: [levels coarse -> fine]}
+        self.members = members              # {level: ndarray of labels}
+        self.up = up                        # {(finer, coarser): code map ndarray}
+        self.aggregates = aggregates        # {levels tuple: (codes int32 ndarray, measures ndarray)}
+        self.measures = measures
+        self.index = {lvl: {m: i for i, m in enumerate(labels)} for lvl, labels in members.items()}
+        self._cache = OrderedDict()
+
+    # ---------- Build ----------
+    @classmethod
+    def build(cls, df: pd.DataFrame, hierarchies=None, rollups=DEFAULT_ROLLUPS, measures=MEASURES):
+        df = _derive_time(df)
+        hierarchies = {
+            h: [lvl for lvl in levels if lvl in df.columns]
+            for h, levels in (hierarchies or DEFAULT_HIERARCHIES).items()
+        }
+        hierarchies = {h: levels for h, levels in hierarchies.items() if levels}
+        measures = [m for m in measures if m in df.columns]
+
+        members, codes = {}, {}
+        for levels in hierarchies.values():
+            for lvl in levels:
+                c, labels = pd.factorize(df[lvl].astype(str), sort=True)
+                members[lvl], codes[lvl] = np.asarray(labels, dtype=object), c.astype(np.int32)
+
+        # Parent maps between every finer/coarser pair inside a hierarchy
+        up = {}
+        for levels in hierarchies.values():
+            for i, coarse in enumerate(levels):
+                for fine in levels[i + 1:]:
+                    m = np.full(len(members[fine]), -1, dtype=np.int32)
+                    m[codes[fine]] = codes[coarse]
+                    if (m[codes[fine]] != codes[coarse]).any():
+                        raise ValueError(f"{fine} members roll up to more than one {coarse}")
+                    up[(fine, coarse)] = m
+
+        leaves = tuple(levels[-1] for levels in hierarchies.values())
+        values = df[measures].to_numpy(dtype=float)
+        cube = cls(hierarchies, members, up, {}, measures)
+        cube.aggregates[leaves] = cube._aggregate({lvl: codes[lvl] for lvl in leaves}, leaves, values)
+        for r in rollups:
+            r = tuple(lvl for lvl in r if lvl in members)
+            if r and set(r) not in [set(lv) for lv in cube.aggregates]:
+                cube.aggregates[r] = cube._rollup(r)
+        return cube
+
+    def _aggregate(self, level_codes: dict, levels: tuple, values: np.ndarray):
+        dims = [len(self.members[lvl]) for lvl in levels]
+        flat = np.ravel_multi_index([level_codes[lvl] for lvl in levels], dims) if levels else np.zeros(len(values), dtype=np.int64)
+        keys, sums = _group_sum(flat, values)
+        cell_codes = np.stack(np.unravel_index(keys, dims), axis=1).astype(np.int32) if levels else np.zeros((len(keys), 0), np.int32)
+        return cell_codes, sums
+
+    # ---------- Navigation ----------
+    def levels(self):
+        return [lvl for levels in self.hierarchies.values() for lvl in levels]
+
+    def _hierarchy_of(self, level):
+        for h, levels in self.hierarchies.items():
+            if level in levels:
+                return levels
+        raise KeyError(f"Unknown level {level!r}; cube has {self.levels()}")
+
+    def _source_level(self, agg_levels, level):
+        """Level in agg_levels that `level` can be read from (itself or a finer level)."""
+        chain = self._hierarchy_of(level)
+        for lvl in agg_levels:
+            if lvl in chain and chain.index(lvl) >= chain.index(level):
+                return lvl
+        return None
+
+    def _codes_at(self, agg_levels, cell_codes, level):
+        src = self._source_level(agg_levels, level)
+        col = cell_codes[:, agg_levels.index(src)]
+        return col if src == level else self.up[(src, level)][col]
+
+    def _best_aggregate(self, needed):
+        usable = [
+            lv for lv in self.aggregates
+            if all(self._source_level(lv, n) is not None for n in needed)
+        ]
+        return min(usable, key=lambda lv: len(self.aggregates[lv][0]))
+
+    def _rollup(self, levels: tuple):
+        src = self._best_aggregate(levels)
+        cell_codes, values = self.aggregates[src]
+        return self._aggregate({lvl: self._codes_at(src, cell_codes, lvl) for lvl in levels}, levels, values)
+
+    # ---------- Queries ----------
+    def query(self, by=(), where=None, measures=None) -> pd.DataFrame:
+        """
+        Aggregate measures grouped by `by` levels, filtered by where={level: member or [members]}.
+        Adds Gross_Profit, Variance and margin/variance percentages when their inputs are present.
+        """
+        by = tuple(by)
+        where = {k: (list(v) if isinstance(v, (list, tuple, set)) else [v]) for k, v in (where or {}).items()}
+        measures = list(measures or self.measures)
+        key = (by, tuple(sorted((k, tuple(map(str, v))) for k, v in where.items())), tuple(measures))
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key].copy()
+
+        src = self._best_aggregate(set(by) | set(where))
+        cell_codes, values = self.aggregates[src]
+        values = values[:, [self.measures.index(m) for m in measures]]
+
+        mask = np.ones(len(cell_codes), dtype=bool)
+        for lvl, wanted in where.items():
+            idx = self.index[lvl]
+            ids = [idx[str(w)] for w in wanted if str(w) in idx]
+            mask &= np.isin(self._codes_at(src, cell_codes, lvl), ids)
+
+        cell_codes, values = cell_codes[mask], values[mask]
+        grouped, sums = self._aggregate({lvl: self._codes_at(src, cell_codes, lvl) for lvl in by}, by, values)
+
+        out = pd.DataFrame({lvl: self.members[lvl][grouped[:, i]] for i, lvl in enumerate(by)})
+        for j, m in enumerate(measures):
+            out[m] = sums[:, j]
+        out = _add_ratios(out)
+
+        self._cache[key] = out
+        if len(self._cache) > 256:
+            self._cache.popitem(last=False)
+        return out.copy()
+
+    def drill_down(self, level, where=None, by=()):
+        """Break `level` (e.g. Year) out into its next finer level (e.g. Quarter)."""
+        chain = self._hierarchy_of(level)
+        i = chain.index(level)
+        if i == len(chain) - 1:
+            raise ValueError(f"{level} is already the finest level of its hierarchy")
+        return self.query(by=tuple(by) + (level, chain[i + 1]), where=where)
+
+    # ---------- Persistence ----------
+    def save(self, path: Path = CUBE_PATH):
+        arrays = {}
+        for i, (levels, (codes, values)) in enumerate(self.aggregates.items()):
+            arrays[f"agg{i}_codes"], arrays[f"agg{i}_values"] = codes, values
+        for (fine, coarse), m in self.up.items():
+            arrays[f"up__{fine}__{coarse}"] = m
+        meta = {
+            "hierarchies": self.hierarchies,
+            "measures": self.measures,
+            "aggregates": [list(lv) for lv in self.aggregates],
+            "members": {lvl: [str(x) for x in labels] for lvl, labels in self.members.items()},
+        }
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        np.savez_compressed(path, meta=np.array(json.dumps(meta)), **arrays)
+
+    @classmethod
+    def load(cls, path: Path = CUBE_PATH):
+        with np.load(path, allow_pickle=False) as z:
+            meta = json.loads(str(z["meta"]))
+            aggregates = {
+                tuple(lv): (z[f"agg{i}_codes"], z[f"agg{i}_values"]) for i, lv in enumerate(meta["aggregates"])
+            }
+            up = {tuple(k[4:].split("__")): z[k] for k in z.files if k.startswith("up__")}
+        members = {lvl: np.asarray(labels, dtype=object) for lvl, labels in meta["members"].items()}
+        return cls(meta["hierarchies"], members, up, aggregates, meta["measures"])
+
+def _add_ratios(out: pd.DataFrame) -> pd.DataFrame:
+    if {"Revenue", "Expense"} <= set(out.columns):
+        out["Gross_Profit"] = out["Revenue"] - out["Expense"]
+        out["Gross_Margin_Pct"] = (out["Gross_Profit"] / out["Revenue"]).where(out["Revenue"] != 0) * 100
+    if {"Revenue", "Forecast_Revenue"} <= set(out.columns):
+        out["Variance_vs_Forecast"] = out["Revenue"] - out["Forecast_Revenue"]
+        out["Variance_Pct"] = (
+            (out["Variance_vs_Forecast"] / out["Forecast_Revenue"]).where(out["Forecast_Revenue"] != 0) * 100
+        )
+    return out
+
+# ---------- CLI ----------
+def _parse_where(items):
+    where = {}
+    for item in items or []:
+        level, _, values = item.partition("=")
+        where[level] = values.split(",")
+    return where
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Build or query the FP&A cube")
+    sub = p.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build", help="scan financials once and save data/cube.npz")
+    b.add_argument("--hierarchies", help="JSON {hierarchy: [levels coarse->fine]} (default: Time/Org/Geo/Account/Product)")
+    b.add_argument("--rollup", action="append", default=[],
+                   help="extra comma-separated level set to materialize (repeatable)")
+    q = sub.add_parser("query", help="slice/dice the saved cube")
+    q.add_argument("--by", default="", help="comma-separated levels to group by, e.g. Department,Quarter")
+    q.add_argument("--where", action="append", help="LEVEL=member[,member...] filter (repeatable)")
+    q.add_argument("--drill", help="level to drill down into its next finer level")
+    return p.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.cmd == "build":
+        t0 = time.perf_counter()
+        hierarchies = json.loads(args.hierarchies) if args.hierarchies else None
+        rollups = DEFAULT_ROLLUPS + [tuple(r.split(",")) for r in args.rollup]
+        cube = Cube.build(storage.read_table("financials"), hierarchies=hierarchies, rollups=rollups)
+        cube.save()
+        print(f"✅ Cube built → {CUBE_PATH} ({time.perf_counter() - t0:.2f}s)")
+        for levels, (codes, _) in cube.aggregates.items():
+            print(f"  - {' x '.join(levels)}: {len(codes):,} cells")
+        return
+
+    cube = Cube.load()
+    by = [b for b in args.by.split(",") if b]
+    where = _parse_where(args.where)
+    t0 = time.perf_counter()
+    out = cube.drill_down(args.drill, where=where, by=by) if args.drill else cube.query(by=by, where=where)
+    ms = (time.perf_counter() - t0) * 1000
+    print(out.round(2).to_string(index=False))
+    print(f"⏱️ {len(out)} rows in {ms:.1f} ms")
+
+if __name__ == "__main__":
+    main()
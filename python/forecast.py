@@ -1,31 +1,107 @@
 # python/forecast.py
+import argparse
+import importlib.util
 import math
+import os
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+import numpy as np
 import pandas as pd
 
-# Try to import statsmodels for Holt-Winters forecasting
-try:
+import schema
+import shared_ledger
+import storage
+from instrument import span
+from param_cache import ParamCache, series_fingerprint
+
+# statsmodels (Holt-Winters) takes about a second to import, so only check that
+# it is installed here and import it on the first fit. Process pools import it
+# in the parent first: forking while another thread holds the import lock would
+# leave the children deadlocked on their first fit.
+HAS_SM = importlib.util.find_spec("statsmodels") is not None
+
+def _exponential_smoothing():
     from statsmodels.tsa.holtwinters import ExponentialSmoothing
-    HAS_SM = True
-except Exception:
-    HAS_SM = False
+    return ExponentialSmoothing
 
 DATA_DIR = Path(__file__).resolve().parents[1] / "data"
-INPUT = DATA_DIR / "financials.csv"      # <-- directly use your dataset with Department
-OUTPUT = DATA_DIR / "forecast_by_department.csv"
+INPUT = "financials"                   # <-- directly use your dataset with Department
+OUTPUT = "forecast_by_department"
+PARAM_CACHE = DATA_DIR / ".hw_param_cache.json"  # fitted Holt-Winters params between runs
 
 HORIZON = 6   # forecast 6 months
 ROLLING_WINDOW = 3  # fallback rolling mean
 
-def forecast_series(series: pd.Series) -> pd.DataFrame:
+def _hw_config(s: pd.Series) -> dict:
+    return {"trend": "add", "seasonal": "add", "seasonal_periods": 12 if len(s) >= 24 else None}
+
+def _hw_entry(model, config: dict, fingerprint: str) -> dict:
+    """Cacheable snapshot of a fitted model: smoothing parameters + initial states."""
+    p = model.params
+    start = [p["smoothing_level"], p["smoothing_trend"], p["smoothing_seasonal"],
+             p["initial_level"], p["initial_trend"], *np.ravel(p["initial_seasons"])]
+    return {
+        "fingerprint": fingerprint,
+        "config": config,
+        "start_params": [float(x) for x in start],
+    }
+
+def _fit_holt_winters(s: pd.Series, cached=None):
+    """
+    Fit Holt-Winters on s, using a cached entry when it applies.
+    Returns (fitted model, new cache entry, status) with status hit/warm/miss.
+    """
+    with span("forecast.fit", series=str(s.name), rows=len(s)) as sp:
+        model, entry, status = _fit_cached(s, cached)
+        sp["status"] = status
+    return model, entry, status
+
+def _fit_cached(s: pd.Series, cached):
+    ExponentialSmoothing = _exponential_smoothing()
+    config = _hw_config(s)
+    fingerprint = series_fingerprint(s)
+    usable = cached is not None and cached.get("config") == config
+
+    if usable and cached["fingerprint"] == fingerprint:
+        # Unchanged data: rebuild the model from stored parameters, no optimization
+        sp = cached["start_params"]
+        model = ExponentialSmoothing(
+            s, **config,
+            initialization_method="known",
+            initial_level=sp[3], initial_trend=sp[4], initial_seasonal=sp[5:],
+            freq="MS",
+        ).fit(smoothing_level=sp[0], smoothing_trend=sp[1], smoothing_seasonal=sp[2], optimized=False)
+        return model, cached, "hit"
+
+    base = ExponentialSmoothing(s, **config, initialization_method="estimated", freq="MS")
+    if usable:
+        # Data moved (e.g. a new month): start the optimizer from last run's optimum
+        # and skip the brute-force grid search.
+        try:
+            model = base.fit(optimized=True, start_params=np.asarray(cached["start_params"]), use_brute=False)
+            return model, _hw_entry(model, config, fingerprint), "warm"
+        except Exception:
+            pass
+
+    model = base.fit(optimized=True)
+    return model, _hw_entry(model, config, fingerprint), "miss"
+
+def forecast_series(series: pd.Series, cached=None) -> pd.DataFrame:
     """
     Forecast one series for HORIZON months.
     If statsmodels unavailable, fallback to rolling mean.
     Returns DataFrame with Month, Forecast, Lower, Upper
     """
+    return fit_series(series, cached)[0]
+
+def fit_series(series: pd.Series, cached=None):
+    """
+    Same as forecast_series, but also returns the Holt-Winters cache entry and
+    cache status (hit/warm/miss), or (None, None) when no model was fitted.
+    """
     s = series.dropna().astype(float)
     if s.empty:
-        return pd.DataFrame(columns=["Month", "Forecast", "Lower", "Upper"])
+        return pd.DataFrame(columns=["Month", "Forecast", "Lower", "Upper"]), None, None
 
     # Convert to datetime index
     s.index = pd.to_datetime(s.index)
@@ -49,18 +125,11 @@ def forecast_series(series: pd.Series) -> pd.DataFrame:
             "Forecast": [float(avg)] * HORIZON,
             "Lower": [float(avg - z * residual_std)] * HORIZON,
             "Upper": [float(avg + z * residual_std)] * HORIZON
-        })
+        }), None, None
 
     # Statsmodels Holt-Winters
     try:
-        model = ExponentialSmoothing(
-            s,
-            trend="add",
-            seasonal="add",
-            seasonal_periods=12 if len(s) >= 24 else None,
-            initialization_method="estimated",
-            freq="MS",
-        ).fit(optimized=True)
+        model, entry, status = _fit_holt_winters(s, cached)
 
         forecast_vals = model.forecast(HORIZON)
         resid = model.resid
@@ -74,7 +143,7 @@ def forecast_series(series: pd.Series) -> pd.DataFrame:
             "Forecast": forecast_vals.values.astype(float),
             "Lower": lower.values.astype(float),
             "Upper": upper.values.astype(float),
-        })
+        }), entry, status
     except Exception:
         # fallback again
         avg = s.iloc[-ROLLING_WINDOW:].mean()
@@ -87,35 +156,233 @@ def forecast_series(series: pd.Series) -> pd.DataFrame:
             "Forecast": [float(avg)] * HORIZON,
             "Lower": [float(avg - z * residual_std)] * HORIZON,
             "Upper": [float(avg + z * residual_std)] * HORIZON
-        })
+        }), None, None
+
+def pivot_series(df: pd.DataFrame, value: str = "Revenue") -> pd.DataFrame:
+    """
+    Pivot a long (MonthKey, Department, value) frame into one months x departments
+    grid on a contiguous month-start index. Rows sharing a month and department
+    (entities, accounts) are summed; gaps and out-of-range months are NaN.
+    """
+    wide = (
+        df.groupby(["MonthKey", "Department"], observed=True, sort=True)[value]
+          .sum(min_count=1)
+          .unstack("Department")
+          .astype(float)
+    )
+    full_idx = pd.date_range(wide.index.min(), wide.index.max(), freq="MS")
+    return wide.reindex(full_idx)
+
+def ledger_series(df: pd.DataFrame) -> pd.DataFrame:
+    """Months x departments revenue grid from a (Month, Department, Revenue) ledger."""
+    # Month may be YYYY-MM strings or compact int32 codes (schema.py)
+    keyed = df[["Department", "Revenue"]].assign(MonthKey=schema.month_start(df["Month"]))
+    return pivot_series(keyed)
+
+def series_spans(wide: pd.DataFrame) -> np.ndarray:
+    """Length of each column after dropna().asfreq('MS'), i.e. first..last valid month."""
+    valid = ~np.isnan(wide.to_numpy())
+    n = len(wide)
+    first = valid.argmax(axis=0)
+    last = n - 1 - valid[::-1].argmax(axis=0)
+    return np.where(valid.any(axis=0), last - first + 1, 0)
+
+def forecast_fallback_batch(wide: pd.DataFrame) -> pd.DataFrame:
+    """
+    Rolling-mean fallback for every column of a months x series grid in one
+    vectorized pass. Gives the same numbers as forecast_series' fallback path.
+    Returns DataFrame with Month, Department, Forecast, Lower, Upper
+    """
+    cols = ["Month", "Department", "Forecast", "Lower", "Upper"]
+    v = wide.to_numpy(dtype=float)
+    valid = ~np.isnan(v)
+    keep = valid.any(axis=0)
+    v, valid = v[:, keep], valid[:, keep]
+    depts = wide.columns[keep]
+    if v.size == 0:
+        return pd.DataFrame(columns=cols)
+
+    n, k = v.shape
+    col_idx = np.arange(k)
+    last = n - 1 - valid[::-1].argmax(axis=0)
+    count = valid.sum(axis=0)
 
-def main():
-    if not INPUT.exists():
-        raise FileNotFoundError(f"Missing {INPUT}")
+    # One rolling pass over the whole grid; leading/trailing NaNs are skipped the
+    # same way they are per series, so values at each series' last month match.
+    grid = pd.DataFrame(v)
+    roll = grid.rolling(ROLLING_WINDOW)
+    avg = roll.mean().to_numpy()[last, col_idx]
+    avg = np.where(np.isnan(avg), v[last, col_idx], avg)
 
-    df = pd.read_csv(INPUT)
-    required = {"Month", "Department", "Revenue"}
-    if missing := (required - set(df.columns)):
-        raise ValueError(f"Missing columns in {INPUT}: {missing}")
+    residual_std = roll.std().to_numpy()[last, col_idx]
+    hist_std = np.where(count > 1, grid.std().to_numpy(), 0.0)
+    residual_std = np.where(np.isnan(residual_std), hist_std, residual_std)
 
-    # Convert Month to datetime
-    df["MonthKey"] = pd.to_datetime(df["Month"] + "-01")
+    z = 1.96  # 95% CI
+    labels = pd.period_range(wide.index[0], periods=n + HORIZON, freq="M").strftime("%Y-%m")
+    future = last[:, None] + np.arange(1, HORIZON + 1)   # k x HORIZON
 
-    forecasts = []
+    return pd.DataFrame({
+        "Month": np.asarray(labels)[future.ravel()],
+        "Department": np.repeat(np.asarray(depts), HORIZON),
+        "Forecast": np.repeat(avg, HORIZON),
+        "Lower": np.repeat(avg - z * residual_std, HORIZON),
+        "Upper": np.repeat(avg + z * residual_std, HORIZON),
+    })[cols]
 
-    for dept, sub in df.groupby("Department"):
-        series = sub.set_index("MonthKey")["Revenue"].sort_index()
-        f = forecast_series(series)
+def _forecast_task(task):
+    """
+    Worker entry point: forecast one (Department, series, cached params) task.
+    The series may be a shared_ledger.SliceRef, read here from the memory-mapped store.
+    Never raises, so a single bad fit cannot take down the whole batch.
+    Returns (Department, DataFrame or None, error message or None, cache entry, cache status)
+    """
+    dept, series, cached = task
+    try:
+        f, entry, status = fit_series(shared_ledger.resolve(series), cached)
+        return dept, f, None, entry, status
+    except Exception as e:
+        return dept, None, f"{type(e).__name__}: {e}", None, None
+
+def forecast_departments(series_by_dept, workers=1, chunksize=None, cache=None):
+    """
+    Forecast many department series, optionally spread over a process pool.
+    workers: 1 runs in-process, 0/None uses every core.
+    chunksize: series per worker task (default: ~4 chunks per worker).
+    cache: optional ParamCache; entries are shipped to workers and updated here.
+    Output rows keep the input order regardless of which worker finishes first.
+    Returns (DataFrame with Month, Department, Forecast, Lower, Upper; {dept: error})
+    """
+    tasks = [(dept, series, cache.get(dept) if cache else None) for dept, series in series_by_dept]
+    if not workers:
+        workers = os.cpu_count() or 1
+    workers = min(workers, max(len(tasks), 1))
+
+    if workers <= 1:
+        results = [_forecast_task(t) for t in tasks]
+    else:
+        if chunksize is None:
+            chunksize = max(1, math.ceil(len(tasks) / (workers * 4)))
+        if HAS_SM:
+            _exponential_smoothing()  # before forking, see HAS_SM
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # map() yields in submission order -> deterministic output
+            results = list(pool.map(_forecast_task, tasks, chunksize=chunksize))
+
+    forecasts, errors = [], {}
+    for dept, f, err, entry, status in results:
+        if err is not None:
+            errors[dept] = err
+            continue
+        if cache is not None and status is not None:
+            cache.record(dept, status, entry)
         f["Department"] = dept
         forecasts.append(f)
 
-    out = pd.concat(forecasts, ignore_index=True)
-    out = out[["Month", "Department", "Forecast", "Lower", "Upper"]]
+    cols = ["Month", "Department", "Forecast", "Lower", "Upper"]
+    out = pd.concat(forecasts, ignore_index=True) if forecasts else pd.DataFrame(columns=cols)
+    return out[cols], errors
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Department-level revenue forecast")
+    p.add_argument("--workers", type=int, default=1,
+                   help="worker processes for model fits (1 = in-process, 0 = all cores)")
+    p.add_argument("--chunksize", type=int, default=None,
+                   help="series per worker task (default: auto)")
+    p.add_argument("--no-cache", action="store_true",
+                   help="always re-optimize Holt-Winters parameters from scratch")
+    p.add_argument("--clear-cache", action="store_true",
+                   help="invalidate all cached Holt-Winters parameters before fitting")
+    p.add_argument("--cache-max-entries", type=int, default=5000,
+                   help="evict least-recently-used cache entries beyond this count")
+    p.add_argument("--shared", action="store_true",
+                   help="workers read their department from the memory-mapped ledger (shared_ledger.py)")
+    return p.parse_args(argv)
+
+def load_ledger() -> pd.DataFrame:
+    """Month, Department, Revenue columns of the ledger."""
+    input_path = storage.resolve(INPUT)
+    if not input_path.exists():
+        raise FileNotFoundError(f"Missing {input_path}")
+
+    required = ["Month", "Department", "Revenue"]
+    try:
+        return storage.read_table(INPUT, columns=required)
+    except (ValueError, KeyError):
+        df = storage.read_table(INPUT)
+        missing = set(required) - set(df.columns)
+        raise ValueError(f"Missing columns in {input_path}: {missing}")
+
+def forecast_frame(df: pd.DataFrame, workers=1, chunksize=None, cache=None):
+    """
+    Forecast every department of a ledger frame (Month, Department, Revenue).
+    The input frame is not modified.
+    Returns (DataFrame with Month, Department, Forecast, Lower, Upper; {dept: error})
+    """
+    return forecast_wide(ledger_series(df), workers=workers, chunksize=chunksize, cache=cache)
+
+def forecast_wide(wide: pd.DataFrame, workers=1, chunksize=None, cache=None):
+    """
+    Forecast every column of a months x series grid; columns become the Department key.
+    Returns (DataFrame with Month, Department, Forecast, Lower, Upper; {series: error})
+    """
+    # Series that would take the rolling-mean fallback are done in one batch;
+    # only the rest go through per-series Holt-Winters fits.
+    if HAS_SM:
+        short = series_spans(wide) < max(ROLLING_WINDOW + 1, 4)
+    else:
+        short = np.ones(wide.shape[1], dtype=bool)
+
+    with span("forecast.fallback_batch", series=int(short.sum()), rows=int(short.sum()) * len(wide)):
+        batch = forecast_fallback_batch(wide.loc[:, short])
+    series_by_dept = ((dept, wide[dept]) for dept in wide.columns[~short])
+    fitted, errors = forecast_departments(series_by_dept, workers=workers, chunksize=chunksize, cache=cache)
+    return _combine(batch, fitted), errors
+
+def forecast_store(store, workers=1, chunksize=None, cache=None):
+    """
+    forecast_wide over a shared_ledger store. Holt-Winters tasks carry only a
+    SliceRef; each worker attaches to the memory-mapped ledger and builds its
+    department's series from its own slice.
+    Returns (DataFrame with Month, Department, Forecast, Lower, Upper; {dept: error})
+    """
+    depts = np.asarray(store.departments, dtype=object)
+    if HAS_SM:
+        short = store.spans() < max(ROLLING_WINDOW + 1, 4)
+    else:
+        short = np.ones(len(depts), dtype=bool)
+
+    with span("forecast.fallback_batch", series=int(short.sum())):
+        batch = forecast_fallback_batch(store.wide(depts[short]))
+    refs = ((dept, store.ref(dept)) for dept in depts[~short])
+    fitted, errors = forecast_departments(refs, workers=workers, chunksize=chunksize, cache=cache)
+    return _combine(batch, fitted), errors
+
+def _combine(batch: pd.DataFrame, fitted: pd.DataFrame) -> pd.DataFrame:
+    parts = [f for f in (batch, fitted) if not f.empty]
+    out = pd.concat(parts, ignore_index=True) if parts else fitted
+    return out.sort_values("Department", kind="stable").reset_index(drop=True)
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    cache = None if args.no_cache else ParamCache(PARAM_CACHE, max_entries=args.cache_max_entries)
+    if cache is not None and args.clear_cache:
+        cache.invalidate()
+    if args.shared:
+        out, errors = forecast_store(shared_ledger.ensure(), workers=args.workers, chunksize=args.chunksize, cache=cache)
+    else:
+        out, errors = forecast_frame(load_ledger(), workers=args.workers, chunksize=args.chunksize, cache=cache)
+    if cache is not None:
+        cache.save()
 
-    OUTPUT.parent.mkdir(parents=True, exist_ok=True)
-    out.to_csv(OUTPUT, index=False)
+    output_path = storage.write_table(out, OUTPUT)
 
-    print("✅ Wrote department-level forecast →", OUTPUT)
+    print("✅ Wrote department-level forecast →", output_path)
+    if cache is not None:
+        print("🗂️ Param cache:", cache.summary())
+    for dept, err in errors.items():
+        print(f"⚠️ Forecast failed for {dept}: {err}")
     print(out.head(12).to_string(index=False))
 
 if __name__ == "__main__":
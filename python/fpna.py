@@ -0,0 +1,162 @@
+# python/fpna.py
+"""
+One command line for every pipeline step.
+
+  python python/fpna.py stages
+  python python/fpna.py run variance --incremental
+  python python/fpna.py run --timing forecast --workers 0
+  python python/fpna.py startup --save data/benchmarks/startup.json
+  python python/fpna.py startup --compare data/benchmarks/startup.json
+
+`run` imports only the module of the requested stage and calls its main() with
+the remaining arguments (options for `run` itself go before the stage name).
+
+`startup` spawns a fresh interpreter per entry point and measures the cold start:
+process wall time and the time spent importing the module (best of --repeat).
+It also lists heavy libraries (statsmodels, scipy, matplotlib, python-pptx,
+openai, dotenv) that got imported at module load; those should only load when a
+step actually uses them. With --compare it exits 1 on a slower import or a new
+heavy import, so schedulers' small refreshes stay fast.
+"""
+import argparse
+import importlib
+import json
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+
+STAGES = {
+    "generate": "generate_data",
+    "variance": "variance_analysis",
+    "forecast": "forecast",
+    "backtest": "backtest",
+    "reconcile": "reconcile",
+    "scenarios": "scenarios",
+    "anomalies": "anomaly",
+    "summary": "ai_summary",
+    "visuals": "make_visuals",
+    "deck": "make_deck",
+    "cube": "cube",
+    "share": "shared_ledger",
+    "serve": "api_server",
+    "pipeline": "pipeline",
+    "benchmark": "benchmark",
+}
+HEAVY = ("statsmodels", "scipy", "matplotlib", "pptx", "openai", "dotenv")
+
+_PROBE = """
+import json, sys, time
+t = time.perf_counter()
+import {module}
+ms = (time.perf_counter() - t) * 1000
+print(json.dumps({{"import_ms": ms, "heavy": sorted(m for m in {heavy!r} if m in sys.modules)}}))
+"""
+
+# ---------- Run ----------
+def run(stage: str, argv=None, timing=False):
+    """Import the stage's module and call its main(argv)."""
+    t0 = time.perf_counter()
+    module = importlib.import_module(STAGES[stage])
+    t1 = time.perf_counter()
+    try:
+        return module.main(argv)
+    finally:
+        if timing:
+            t2 = time.perf_counter()
+            print(f"⏱️ {stage}: import {(t1 - t0) * 1000:.0f} ms, run {(t2 - t1) * 1000:.0f} ms")
+
+# ---------- Startup benchmark ----------
+def probe(module: str) -> dict:
+    """Cold-start one module in a fresh interpreter. Returns {wall_ms, import_ms, heavy}."""
+    code = _PROBE.format(module=module, heavy=HEAVY)
+    t = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-c", code], cwd=HERE, capture_output=True, text=True)
+    wall = (time.perf_counter() - t) * 1000
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr.strip()}")
+    out = json.loads(proc.stdout.strip().splitlines()[-1])
+    return {"wall_ms": wall, "import_ms": out["import_ms"], "heavy": out["heavy"]}
+
+def startup_times(stages=None, repeat: int = 3) -> dict:
+    """{stage: {wall_ms, import_ms, heavy}} with the best of `repeat` cold starts."""
+    results = {}
+    for stage in stages or STAGES:
+        runs = [probe(STAGES[stage]) for _ in range(repeat)]
+        results[stage] = {
+            "wall_ms": round(min(r["wall_ms"] for r in runs), 1),
+            "import_ms": round(min(r["import_ms"] for r in runs), 1),
+            "heavy": runs[-1]["heavy"],
+        }
+    return results
+
+def compare(current: dict, baseline: dict, tolerance: float = 0.25, slack_ms: float = 50.0) -> list:
+    """Regression messages: imports slower than baseline by > tolerance and > slack_ms, or new heavy imports."""
+    problems = []
+    for stage, cur in current.items():
+        base = baseline.get(stage)
+        if base is None:
+            continue
+        limit = max(base["import_ms"] * (1 + tolerance), base["import_ms"] + slack_ms)
+        if cur["import_ms"] > limit:
+            problems.append(f"{stage}: import {cur['import_ms']:.0f} ms vs baseline {base['import_ms']:.0f} ms")
+        new = sorted(set(cur["heavy"]) - set(base.get("heavy", [])))
+        if new:
+            problems.append(f"{stage}: now imports {', '.join(new)} at load time")
+    return problems
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="FP&A pipeline command line")
+    sub = p.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("stages", help="list runnable stages")
+
+    r = sub.add_parser("run", help="run one stage; remaining arguments go to the stage")
+    r.add_argument("--timing", action="store_true", help="print import and run time")
+    r.add_argument("stage", choices=sorted(STAGES))
+    r.add_argument("args", nargs=argparse.REMAINDER)
+
+    s = sub.add_parser("startup", help="measure cold-start import time of each entry point")
+    s.add_argument("--stages", default=None, help="comma-separated subset (default: all)")
+    s.add_argument("--repeat", type=int, default=3, help="cold starts per stage; the best is kept")
+    s.add_argument("--save", type=Path, default=None, help="write the results as a baseline JSON")
+    s.add_argument("--compare", type=Path, default=None, help="baseline JSON; exit 1 on a regression")
+    s.add_argument("--tolerance", type=float, default=0.25, help="allowed relative slowdown")
+    return p.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.cmd == "stages":
+        for stage, module in STAGES.items():
+            print(f"  {stage:<10} python/{module}.py")
+        return
+    if args.cmd == "run":
+        script_args = args.args[1:] if args.args[:1] == ["--"] else args.args
+        run(args.stage, script_args, timing=args.timing)
+        return
+
+    stages = [s.strip() for s in args.stages.split(",")] if args.stages else None
+    unknown = set(stages or []) - set(STAGES)
+    if unknown:
+        raise SystemExit(f"Unknown stage(s) {sorted(unknown)}; expected {', '.join(STAGES)}")
+    results = startup_times(stages, args.repeat)
+
+    print(f"⏱️ Cold start (best of {args.repeat}):")
+    for stage, r in results.items():
+        heavy = f"  ⚠️ loads {', '.join(r['heavy'])}" if r["heavy"] else ""
+        print(f"  - {stage:<10} process {r['wall_ms']:7.0f} ms   import {r['import_ms']:6.0f} ms{heavy}")
+    if args.save:
+        args.save.parent.mkdir(parents=True, exist_ok=True)
+        args.save.write_text(json.dumps(results, indent=2), encoding="utf-8")
+        print(f"✅ Baseline → {args.save}")
+    if args.compare:
+        problems = compare(results, json.loads(args.compare.read_text(encoding="utf-8")), args.tolerance)
+        for msg in problems:
+            print(f"⚠️ Startup regression: {msg}")
+        if problems:
+            sys.exit(1)
+        print(f"✅ No startup regressions vs {args.compare}")
+
+if __name__ == "__main__":
+    main()
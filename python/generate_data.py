@@ -1,36 +1,121 @@
+# python/generate_data.py
+import argparse
+
 import pandas as pd
 import numpy as np
-import os
 
-# Ensure data folder exists
-os.makedirs("../data", exist_ok=True)
+import storage
+
+BASE_DEPARTMENTS = ["Sales", "Marketing", "Operations", "R&D"]
+
+def _labels(prefix, n, base=()):
+    base = list(base)[:n]
+    return base + [f"{prefix}_{i:03d}" for i in range(len(base) + 1, n + 1)]
+
+def _month_rows(rng, m, base_rev, base_exp, phase, trend, seasonality, scale):
+    """Revenue, Expense, Forecast_Revenue for every series in month index m."""
+    n = len(base_rev)
+    season = 1 + seasonality * np.sin(2 * np.pi * (m + phase) / 12)
+    growth = (1 + trend) ** m
+    revenue = np.rint(base_rev * season * growth + rng.integers(-10000, 15000, n) / scale).astype(np.int64)
+    expense = np.rint(base_exp * growth + rng.integers(-5000, 10000, n) / scale).astype(np.int64)
+    forecast = np.round(revenue * (1 + rng.uniform(-0.05, 0.1, n)), 2)  # ±5–10%
+    return revenue, expense, forecast
+
+def generate_chunks(departments=4, entities=1, accounts=1, months=24, start="2023-01",
+                    seed=None, trend=0.005, seasonality=0.08, months_per_chunk=12, cost_centers=1):
+    """
+    Synthetic ledger in chunks of `months_per_chunk` months, one row per
+    Month x Department (x Entity x Cost_Center x Account) series.
+
+    Draws are keyed on (seed, month), so a seed gives the same ledger whatever
+    the chunk size. Entity/Cost_Center/Account columns only appear when there is more than one.
+    Revenue follows a per-series level, yearly seasonality and compound monthly trend.
+    """
+    entropy = np.random.SeedSequence(seed).entropy
+    dept_labels = _labels("Dept", departments, BASE_DEPARTMENTS)
+    ent_labels = _labels("Entity", entities)
+    cc_labels = _labels("CC", cost_centers)
+    acct_labels = _labels("Account", accounts)
+    n_series = departments * entities * cost_centers * accounts
+
+    # Series-level draws: base levels and a seasonal phase per department
+    rng = np.random.default_rng([entropy, 0])
+    scale = entities * cost_centers * accounts
+    base_rev = rng.integers(50000, 150000, n_series) / scale
+    base_exp = rng.integers(30000, 80000, n_series) / scale
+    dept_code = np.repeat(np.arange(departments, dtype=np.int32), scale)
+    phase = rng.integers(0, 12, departments)[dept_code]
+    ent_code = np.tile(np.repeat(np.arange(entities, dtype=np.int32), cost_centers * accounts), departments)
+    cc_code = np.tile(np.repeat(np.arange(cost_centers, dtype=np.int32), accounts), departments * entities)
+    acct_code = np.tile(np.arange(accounts, dtype=np.int32), departments * entities * cost_centers)
 
-# Months
-months = pd.date_range("2023-01-01", periods=24, freq="M")  # 2 years
+    month_labels = pd.period_range(start, periods=months, freq="M").strftime("%Y-%m")
 
-# Departments
-departments = ["Sales", "Marketing", "Operations", "R&D"]
+    for lo in range(0, months, months_per_chunk):
+        span = range(lo, min(lo + months_per_chunk, months))
+        rev, exp, fc = zip(*(
+            _month_rows(np.random.default_rng([entropy, 1, m]), m, base_rev, base_exp, phase, trend, seasonality, scale)
+            for m in span
+        ))
+        k = len(span)
+        cols = {
+            "Month": pd.Categorical.from_codes(np.repeat(np.arange(lo, lo + k, dtype=np.int32), n_series),
+                                               categories=month_labels),
+            "Department": pd.Categorical.from_codes(np.tile(dept_code, k), categories=dept_labels),
+        }
+        if entities > 1:
+            cols["Entity"] = pd.Categorical.from_codes(np.tile(ent_code, k), categories=ent_labels)
+        if cost_centers > 1:
+            cols["Cost_Center"] = pd.Categorical.from_codes(np.tile(cc_code, k), categories=cc_labels)
+        if accounts > 1:
+            cols["Account"] = pd.Categorical.from_codes(np.tile(acct_code, k), categories=acct_labels)
+        cols["Revenue"] = np.concatenate(rev)
+        cols["Expense"] = np.concatenate(exp)
+        cols["Forecast_Revenue"] = np.concatenate(fc)
+        yield pd.DataFrame(cols)
 
-rows = []
-for dept in departments:
-    base_revenue = np.random.randint(50000, 150000)
-    base_expense = np.random.randint(30000, 80000)
+def generate(departments=4, entities=1, accounts=1, months=24, start="2023-01", seed=None, **kw) -> pd.DataFrame:
+    """Synthetic ledger as one frame (default: 4 departments x 24 months)."""
+    return pd.concat(
+        generate_chunks(departments, entities, accounts, months, start, seed, **kw),
+        ignore_index=True,
+    )
 
-    for month in months:
-        revenue = base_revenue + np.random.randint(-10000, 15000)
-        expense = base_expense + np.random.randint(-5000, 10000)
-        forecast = revenue * (1 + np.random.uniform(-0.05, 0.1))  # ±5–10%
+def write_ledger(name="financials", data_dir=storage.DATA_DIR, **kw):
+    """Stream generate_chunks() into a table without holding the whole ledger. Returns (path, rows)."""
+    rows = 0
+    with storage.TableWriter(name, data_dir=data_dir) as w:
+        for chunk in generate_chunks(**kw):
+            w.write(chunk)
+            rows += len(chunk)
+    return w.path, rows
 
-        rows.append({
-            "Month": month.strftime("%Y-%m"),
-            "Department": dept,
-            "Revenue": revenue,
-            "Expense": expense,
-            "Forecast_Revenue": round(forecast, 2)
-        })
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Generate a synthetic financials ledger")
+    p.add_argument("--departments", type=int, default=4)
+    p.add_argument("--entities", type=int, default=1)
+    p.add_argument("--cost-centers", type=int, default=1, help="cost centers per entity and department")
+    p.add_argument("--accounts", type=int, default=1)
+    p.add_argument("--months", type=int, default=24)
+    p.add_argument("--start", default="2023-01", help="first month (YYYY-MM)")
+    p.add_argument("--seed", type=int, default=None, help="fix the ledger for reproducible runs")
+    p.add_argument("--trend", type=float, default=0.005, help="compound monthly growth")
+    p.add_argument("--seasonality", type=float, default=0.08, help="yearly revenue swing (fraction)")
+    p.add_argument("--months-per-chunk", type=int, default=12,
+                   help="months generated and written at a time (bounds memory)")
+    return p.parse_args(argv)
 
-# Save to CSV inside /data
-output_path = os.path.join("..", "data", "financials.csv")
-pd.DataFrame(rows).to_csv(output_path, index=False)
+def main(argv=None):
+    args = parse_args(argv)
+    # Save inside /data (CSV unless FPNA_STORAGE says otherwise)
+    output_path, rows = write_ledger(
+        departments=args.departments, entities=args.entities, accounts=args.accounts,
+        cost_centers=args.cost_centers,
+        months=args.months, start=args.start, seed=args.seed, trend=args.trend,
+        seasonality=args.seasonality, months_per_chunk=args.months_per_chunk,
+    )
+    print(f"✅ {output_path.name} generated at {output_path} ({rows:,} rows)")
 
-print(f"✅ financials.csv generated at {output_path}")
+if __name__ == "__main__":
+    main()
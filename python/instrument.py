@@ -0,0 +1,188 @@
+# python/instrument.py
+"""
+Lightweight spans around the pipeline's hot spots.
+
+Tracing is off unless FPNA_TRACE names an output file (or enable() is called).
+Each finished span is appended to that file as a Chrome trace event ("ph": "X"),
+so it opens directly in chrome://tracing or https://ui.perfetto.dev. Event args
+carry cpu_ms (thread CPU time), maxrss_mb (process peak RSS at span end) and
+any row counts the caller attached.
+
+    with instrument.span("variance.rollup", rows=len(df)) as sp:
+        ...
+        sp["out_rows"] = len(result)
+
+Events are appended one line at a time, so forecast worker processes (which
+inherit FPNA_TRACE) write into the same file. With FPNA_PROFILE=<dir>, profiled()
+blocks also dump cProfile stats to <dir>/<name>.prof.
+
+    python python/instrument.py summary data/trace.json
+    python python/instrument.py profile --out forecast.prof python/forecast.py --workers 1
+"""
+import cProfile
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import resource  # Unix only
+except ImportError:
+    resource = None
+
+_lock = threading.Lock()
+
+def trace_path():
+    return os.getenv("FPNA_TRACE") or None
+
+def profile_dir():
+    return os.getenv("FPNA_PROFILE") or None
+
+def enable(trace=None, profile=None):
+    """
+    Start a fresh trace file and/or cProfile directory for this process and its children.
+    Settings go through the environment so worker processes pick them up.
+    """
+    if trace:
+        path = Path(trace)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text("[\n", encoding="utf-8")
+        os.environ["FPNA_TRACE"] = str(path)
+    if profile:
+        Path(profile).mkdir(parents=True, exist_ok=True)
+        os.environ["FPNA_PROFILE"] = str(profile)
+
+def _maxrss_mb():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def _emit(path, event):
+    line = json.dumps(event, default=str) + ",\n"
+    with _lock:
+        fresh = not os.path.exists(path)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(("[\n" + line) if fresh else line)
+
+# ---------- Spans ----------
+class _NullSpan(dict):
+    """Stand-in when tracing is off: accepts row counts, records nothing."""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+@contextmanager
+def _span(path, name, cat, args):
+    info = dict(args)
+    ts = time.time_ns() // 1000
+    wall, cpu = time.perf_counter(), time.thread_time()
+    try:
+        yield info
+    finally:
+        dur = time.perf_counter() - wall
+        info["cpu_ms"] = round((time.thread_time() - cpu) * 1000, 3)
+        info["maxrss_mb"] = _maxrss_mb()
+        _emit(path, {
+            "name": name, "cat": cat, "ph": "X", "ts": ts, "dur": round(dur * 1e6),
+            "pid": os.getpid(), "tid": threading.get_ident(), "args": info,
+        })
+
+def span(name: str, cat: str = "fpna", **args):
+    """Context manager timing a block. Yields a dict; keys set on it land in the event args."""
+    path = trace_path()
+    if path is None:
+        return _NullSpan()
+    return _span(path, name, cat, args)
+
+@contextmanager
+def profiled(name: str):
+    """cProfile the block into FPNA_PROFILE/<name>.prof (no-op when unset or another profiler is active)."""
+    out = profile_dir()
+    if out is None:
+        yield
+        return
+    prof = cProfile.Profile()
+    try:
+        prof.enable()
+    except ValueError:  # only one profiler per thread (per process on 3.12+)
+        yield
+        return
+    try:
+        yield
+    finally:
+        prof.disable()
+        prof.dump_stats(str(Path(out) / f"{name}.prof"))
+
+# ---------- Reading traces ----------
+def load_trace(path) -> list:
+    """Events from a trace file (tolerates the open-ended array the writers leave)."""
+    text = Path(path).read_text(encoding="utf-8").strip()
+    if not text.endswith("]"):
+        text = text.rstrip(",") + "]"
+    return json.loads(text)
+
+def summarize(events):
+    """Per-span totals: calls, wall/cpu ms, max RSS and summed rows, slowest first."""
+    import pandas as pd
+    rows = []
+    for e in events:
+        if e.get("ph") != "X":
+            continue
+        a = e.get("args", {})
+        rows.append({
+            "name": e["name"],
+            "wall_ms": e["dur"] / 1000,
+            "cpu_ms": a.get("cpu_ms"),
+            "maxrss_mb": a.get("maxrss_mb"),
+            "rows": a.get("rows"),
+        })
+    df = pd.DataFrame(rows, columns=["name", "wall_ms", "cpu_ms", "maxrss_mb", "rows"])
+    out = df.groupby("name").agg(
+        calls=("wall_ms", "size"),
+        wall_ms=("wall_ms", "sum"),
+        cpu_ms=("cpu_ms", "sum"),
+        maxrss_mb=("maxrss_mb", "max"),
+        rows=("rows", "sum"),
+    )
+    return out.sort_values("wall_ms", ascending=False).round(1)
+
+def main(argv=None):
+    import argparse
+    import pstats
+    import runpy
+
+    p = argparse.ArgumentParser(description="Inspect traces or profile a pipeline script")
+    sub = p.add_subparsers(dest="cmd", required=True)
+    s = sub.add_parser("summary", help="per-span totals of a trace file")
+    s.add_argument("trace", type=Path)
+    r = sub.add_parser("profile", help="run a script under cProfile and print the top functions")
+    r.add_argument("script", type=Path)
+    r.add_argument("--out", type=Path, default=None, help="stats file (default <script>.prof)")
+    r.add_argument("--top", type=int, default=25)
+    r.add_argument("args", nargs=argparse.REMAINDER)
+    args = p.parse_args(argv)
+
+    if args.cmd == "summary":
+        print(summarize(load_trace(args.trace)).to_string())
+        return
+
+    out = args.out or args.script.with_suffix(".prof").name
+    script_args = args.args[1:] if args.args[:1] == ["--"] else args.args
+    sys.argv = [str(args.script), *script_args]
+    sys.path.insert(0, str(args.script.resolve().parent))
+    prof = cProfile.Profile()
+    try:
+        prof.runcall(runpy.run_path, str(args.script), run_name="__main__")
+    finally:
+        prof.dump_stats(str(out))
+        print(f"✅ Wrote cProfile stats → {out}")
+        pstats.Stats(prof).sort_stats("cumulative").print_stats(args.top)
+
+if __name__ == "__main__":
+    main()
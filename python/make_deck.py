@@ -1,11 +1,35 @@
 # python/make_deck.py
+import argparse
+import copy
+import hashlib
+import io
+import os
+import uuid
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from pptx import Presentation
-from pptx.util import Inches, Pt
-from pptx.enum.text import PP_ALIGN
+
+import storage
+from instrument import span
 
 ROOT = Path(__file__).resolve().parents[1]
 DATA = ROOT / "data"
+PARTS_DIR = DATA / ".deck_parts"   # cached per-department slide parts, <slug>-<input hash>.pptx
+PACK_VERSION = 1                   # bump when department slide layout changes
+
+CHARTS = [
+    ("Revenue vs Budget (Trend)", "viz_trend.png"),
+    ("Variance % by Department", "viz_dept_variance.png"),
+    ("Forecast by Department (6 mo.)", "viz_forecast_dept.png"),
+]
+CACHE_CODE = ["make_deck"]  # build cache code list (local imports are added by build_cache)
+
+def cache_inputs(data_dir=DATA) -> list:
+    """Build cache inputs of the one-pager, shared by main() and the pipeline's deck stage (files and table names)."""
+    data_dir = Path(data_dir)
+    return [data_dir / "exec_summary.md", *(data_dir / name for _, name in CHARTS), "anomalies"]
+
+# python-pptx (and lxml under it) is imported inside the functions that build
+# slides, so importing this module (e.g. from the pipeline) stays cheap.
 
 def add_title_slide(prs, title, subtitle=None):
     slide_layout = prs.slide_layouts[0]  # Title slide
@@ -15,15 +39,19 @@ def add_title_slide(prs, title, subtitle=None):
         slide.placeholders[1].text = subtitle
 
 def add_picture_slide(prs, title, img_path):
+    from pptx.util import Inches
     slide_layout = prs.slide_layouts[5]  # Title Only
     slide = prs.slides.add_slide(slide_layout)
     slide.shapes.title.text = title
     left = Inches(0.5)
     top = Inches(1.3)
     height = Inches(5.2)  # keep aspect ratio by setting only one dimension
-    slide.shapes.add_picture(str(img_path), left, top, height=height)
+    img = img_path if hasattr(img_path, "read") else str(img_path)  # path or in-memory PNG
+    slide.shapes.add_picture(img, left, top, height=height)
 
 def add_text_slide(prs, title, text):
+    from pptx.util import Pt
+    from pptx.enum.text import PP_ALIGN
     slide_layout = prs.slide_layouts[1]  # Title and Content
     slide = prs.slides.add_slide(slide_layout)
     slide.shapes.title.text = title
@@ -38,27 +66,245 @@ def add_text_slide(prs, title, text):
     for p in tf.paragraphs:
         p.alignment = PP_ALIGN.LEFT
 
-def main():
+def anomaly_text(anoms, months=12, top=8):
+    """Slide text for the strongest variance breaks (anomaly.py) of the last `months` flagged months, or None."""
+    import anomaly
+    flagged = anomaly.recent(anoms, months=months, top=top)
+    if flagged.empty:
+        return None
+    flagged = flagged.sort_values(["Month", "Score"], ascending=[False, False], kind="stable")
+    return "\n".join(anomaly.describe(r) for _, r in flagged.iterrows())
+
+def build_deck(exec_md=None, data_dir=DATA, anomalies=None):
+    """
+    Assemble the one-pager deck; exec_md defaults to data/exec_summary.md and
+    anomalies to the anomalies table when it exists. Returns its path.
+    """
+    from pptx import Presentation
+    data_dir = Path(data_dir)
     prs = Presentation()
     add_title_slide(prs, "FP&A AI Dashboard – Executive Pack", "Automated Variance • Forecast • AI Summary")
 
     # Executive summary
-    exec_md = (DATA / "exec_summary.md").read_text(encoding="utf-8") if (DATA / "exec_summary.md").exists() else "Summary unavailable."
+    if exec_md is None:
+        exec_md = (data_dir / "exec_summary.md").read_text(encoding="utf-8") if (data_dir / "exec_summary.md").exists() else "Summary unavailable."
     add_text_slide(prs, "Executive Summary", exec_md)
 
+    # Month-level variance breaks
+    if anomalies is None and storage.table_exists("anomalies", data_dir=data_dir):
+        anomalies = storage.read_table("anomalies", data_dir=data_dir)
+    text = anomaly_text(anomalies)
+    if text:
+        add_text_slide(prs, "Variance Anomalies", text)
+
     # Visuals (ensure they exist)
+    for title, name in CHARTS:
+        if (data_dir / name).exists():
+            add_picture_slide(prs, title, data_dir / name)
+
+    out = data_dir / "fpna_onepager.pptx"
+    with span("deck.save", slides=len(prs.slides)):
+        prs.save(out)
+    return out
+
+# ---------- Department pack ----------
+# Each department's slides are built (in worker processes) into a small part deck
+# cached under PARTS_DIR by a hash of that department's inputs. The pack is then
+# assembled by copying slides out of the parts, so only changed departments pay
+# for chart rendering and slide building.
+def department_inputs(dept_var, fby=None) -> dict:
+    """{department: (monthly actual/budget frame, forecast frame or None)}"""
+    monthly = (
+        dept_var.assign(Month=dept_var["Month"].astype(str), Department=dept_var["Department"].astype(str))
+                .groupby(["Department", "Month"], sort=True)[["Revenue", "Forecast_Revenue"]]
+                .sum()
+                .reset_index()
+    )
+    monthly["Variance"] = monthly["Revenue"] - monthly["Forecast_Revenue"]
+    fc = None
+    if fby is not None:
+        fc = fby.assign(Month=fby["Month"].astype(str), Department=fby["Department"].astype(str))
+    out = {}
+    for dept, d in monthly.groupby("Department", sort=True):
+        f = None if fc is None else fc.loc[fc["Department"] == dept].reset_index(drop=True)
+        out[dept] = (d.drop(columns="Department").reset_index(drop=True), f)
+    return out
+
+def part_hash(dept, monthly, fc) -> str:
+    h = hashlib.sha1(f"{PACK_VERSION}|{dept}".encode("utf-8"))
+    h.update(monthly.to_csv(index=False).encode("utf-8"))
+    if fc is not None:
+        h.update(fc.to_csv(index=False).encode("utf-8"))
+    return h.hexdigest()[:16]
+
+def _department_slides(prs, dept, monthly, fc):
+    from make_visuals import ChartRenderer, bar_spec, line_spec
+    renderer = ChartRenderer()
+    actual, budget = monthly["Revenue"].sum(), monthly["Forecast_Revenue"].sum()
+    var_pct = (actual / budget - 1) * 100 if budget else 0.0
+
+    slide = prs.slides.add_slide(prs.slide_layouts[2])  # Section Header
+    slide.shapes.title.text = dept
+    slide.placeholders[1].text = f"Actual ${actual:,.0f} vs budget ${budget:,.0f} ({var_pct:+.1f}%)"
+
     charts = [
-        ("Revenue vs Budget (Trend)", DATA / "viz_trend.png"),
-        ("Variance % by Department", DATA / "viz_dept_variance.png"),
-        ("Forecast by Department (6 mo.)", DATA / "viz_forecast_dept.png"),
+        (f"{dept} – Variance vs Budget",
+         bar_spec(monthly, x="Month", y="Variance", title=f"{dept}: Actual − Budget by Month",
+                  fname="variance", ylabel="USD")),
+        (f"{dept} – Revenue Trend",
+         line_spec(monthly.rename(columns={"Revenue": "Actual", "Forecast_Revenue": "Budget"}), x="Month",
+                   ys=["Actual", "Budget"], title=f"{dept}: Revenue vs Budget", fname="trend", ylabel="USD")),
     ]
-    for title, path in charts:
-        if path.exists():
-            add_picture_slide(prs, title, path)
+    if fc is not None and not fc.empty:
+        hist = monthly[["Month", "Revenue"]].tail(12).rename(columns={"Revenue": "Actual"})
+        joined = hist.merge(fc[["Month", "Forecast", "Lower", "Upper"]], on="Month", how="outer").sort_values("Month")
+        charts.append((f"{dept} – Forecast ({len(fc)} mo.)",
+                       line_spec(joined, x="Month", ys=["Actual", "Forecast", "Lower", "Upper"],
+                                 title=f"{dept}: Forecast", fname="forecast", ylabel="USD")))
+    for title, spec in charts:
+        add_picture_slide(prs, title, io.BytesIO(renderer.png_bytes(spec)))
 
+def _build_part(task):
+    """Worker entry point: build one department's part deck. Returns its path."""
+    from pptx import Presentation
+    dept, monthly, fc, path = task
+    prs = Presentation()
+    _department_slides(prs, dept, monthly, fc)
+    tmp = Path(path).with_suffix(".tmp")
+    prs.save(tmp)
+    os.replace(tmp, path)
+    return path
+
+def copy_slides(src, dst):
+    """Append every slide of Presentation src to dst (same template), re-linking pictures. Returns new slides."""
+    from pptx.oxml.ns import qn
+    layouts = {layout.name: layout for layout in dst.slide_layouts}
+    added = []
+    for slide in src.slides:
+        new = dst.slides.add_slide(layouts[slide.slide_layout.name])
+        tree = new.shapes._spTree
+        for shape in list(new.shapes):
+            tree.remove(shape._element)
+        for shape in slide.shapes:
+            el = copy.deepcopy(shape._element)
+            for blip in el.iter(qn("a:blip")):
+                rid = blip.get(qn("r:embed"))
+                if rid:
+                    blob = slide.part.related_part(rid).blob
+                    _, new_rid = new.part.get_or_add_image_part(io.BytesIO(blob))
+                    blip.set(qn("r:embed"), new_rid)
+            tree.append(el)
+        added.append(new)
+    return added
+
+def _add_sections(prs, sections):
+    """Write PowerPoint sections ([(name, [slides])]) into presentation.xml."""
+    from lxml import etree
+    from pptx.oxml.ns import qn
+    p14 = "http://schemas.microsoft.com/office/powerpoint/2010/main"
+    pres = prs.part._element
+    ext_lst = pres.find(qn("p:extLst"))
+    if ext_lst is None:
+        ext_lst = etree.SubElement(pres, qn("p:extLst"))
+    ext = etree.SubElement(ext_lst, qn("p:ext"), uri="{521415D9-36F7-43E2-AB2F-B90AF26B5E84}")
+    lst = etree.SubElement(ext, f"{{{p14}}}sectionLst", nsmap={"p14": p14})
+    for name, slides in sections:
+        sec = etree.SubElement(lst, f"{{{p14}}}section", name=name, id="{%s}" % str(uuid.uuid5(uuid.NAMESPACE_URL, name)).upper())
+        ids = etree.SubElement(sec, f"{{{p14}}}sldIdLst")
+        for slide in slides:
+            etree.SubElement(ids, f"{{{p14}}}sldId", id=str(slide.slide_id))
+
+def build_pack(dept_var, fby=None, exec_md=None, data_dir=DATA, parts_dir=PARTS_DIR, workers=1, force=False,
+               anomalies=None):
+    """
+    Executive pack with one section per department (divider, variance, trend and forecast slides).
+    Department parts are rebuilt only when their inputs changed; anomalies defaults
+    to the anomalies table when it exists.
+    Returns (path, rebuilt departments, reused departments)
+    """
+    from pptx import Presentation
+    data_dir, parts_dir = Path(data_dir), Path(parts_dir)
+    parts_dir.mkdir(parents=True, exist_ok=True)
+    inputs = department_inputs(dept_var, fby)
+
+    from make_visuals import _slug
+    parts, todo = {}, []
+    for dept, (monthly, fc) in inputs.items():
+        path = parts_dir / f"{_slug(dept)}-{part_hash(dept, monthly, fc)}.pptx"
+        parts[dept] = path
+        if force or not path.exists():
+            todo.append((dept, monthly, fc, str(path)))
+
+    with span("deck.build_parts", parts=len(todo)):
+        workers = workers or os.cpu_count() or 1
+        if workers > 1 and len(todo) > 1:
+            with ProcessPoolExecutor(max_workers=min(workers, len(todo))) as pool:
+                list(pool.map(_build_part, todo))
+        else:
+            for task in todo:
+                _build_part(task)
+
+    # Drop parts no current department points at
+    keep = {p.name for p in parts.values()}
+    for stale in parts_dir.glob("*.pptx"):
+        if stale.name not in keep:
+            stale.unlink()
+
+    with span("deck.assemble", departments=len(parts)):
+        prs = Presentation()
+        add_title_slide(prs, "FP&A AI Dashboard – Department Pack", "Variance • Trend • Forecast by Department")
+        if exec_md is None:
+            exec_md = (data_dir / "exec_summary.md").read_text(encoding="utf-8") if (data_dir / "exec_summary.md").exists() else "Summary unavailable."
+        add_text_slide(prs, "Executive Summary", exec_md)
+
+        # Month-level variance breaks
+        if anomalies is None and storage.table_exists("anomalies", data_dir=data_dir):
+            anomalies = storage.read_table("anomalies", data_dir=data_dir)
+        text = anomaly_text(anomalies)
+        if text:
+            add_text_slide(prs, "Variance Anomalies", text)
+        sections = [("Overview", list(prs.slides))]
+        for dept, path in parts.items():
+            sections.append((dept, copy_slides(Presentation(path), prs)))
+        _add_sections(prs, sections)
+
+    out = data_dir / "fpna_department_pack.pptx"
+    with span("deck.save", slides=len(prs.slides)):
+        prs.save(out)
+    rebuilt = [t[0] for t in todo]
+    return out, rebuilt, [d for d in parts if d not in rebuilt]
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Build the executive deck")
+    p.add_argument("--pack", action="store_true",
+                   help="also build the per-department pack (data/fpna_department_pack.pptx)")
+    p.add_argument("--workers", type=int, default=1, help="processes building department parts (0 = all cores)")
+    p.add_argument("--force", action="store_true", help="rebuild the deck and every department part")
+    return p.parse_args(argv)
+
+def main(argv=None):
+    from build_cache import BuildCache
+    args = parse_args(argv)
+    # Same cache entry as the pipeline's deck stage: skip when the summary and charts are unchanged
+    cache = BuildCache()
+    inputs = [storage.resolve(i) if isinstance(i, str) else i for i in cache_inputs()]
+    key = cache.stage_key("deck", inputs, code=CACHE_CODE, params={})
     out = DATA / "fpna_onepager.pptx"
-    prs.save(out)
-    print("✅ Deck created:", out)
+    if not args.force and cache.lookup("deck", key):
+        print("♻️ Deck unchanged:", out)
+    else:
+        out = build_deck()
+        cache.record("deck", key, [out])
+        print("✅ Deck created:", out)
+    cache.save()
+
+    if args.pack:
+        dv = storage.read_table("department_variance", columns=["Month", "Department", "Revenue", "Forecast_Revenue"])
+        fby = None
+        if storage.table_exists("forecast_by_department"):
+            fby = storage.read_table("forecast_by_department", columns=["Month", "Department", "Forecast", "Lower", "Upper"])
+        path, rebuilt, reused = build_pack(dv, fby, workers=args.workers, force=args.force)
+        print(f"✅ Department pack created: {path} ({len(rebuilt)} department(s) rebuilt, {len(reused)} reused)")
 
 if __name__ == "__main__":
     main()
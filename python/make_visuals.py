@@ -1,77 +1,258 @@
 # python/make_visuals.py
+"""
+Dashboard charts, rendered with the object-oriented Agg backend (no pyplot state).
+
+Charts are described as plain-data specs (title, x labels, named series), which
+lets them be hashed, shipped to worker processes and emitted as JSON for web
+dashboards. Each process renders through one reused Figure/Axes pair, and a
+chart whose spec hash matches the manifest in the output folder is not redrawn.
+"""
+import argparse
+import hashlib
+import io
+import json
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
+
+import shared_ledger
+import storage
+from instrument import span
 
 ROOT = Path(__file__).resolve().parents[1]
 DATA = ROOT / "data"
 OUT = ROOT / "data"
+CHART_DIR = OUT / "charts"        # per-department charts
+MANIFEST = ".chart_manifest.json"  # {file name: spec hash} per output folder
 
-def save_line(df, x, ys, title, fname, xlabel="Month", ylabel="Value"):
-    plt.figure()
-    for y in ys:
-        if y in df.columns:
-            plt.plot(df[x], df[y], label=y)
-    plt.title(title)
-    plt.xlabel(xlabel)
-    plt.ylabel(ylabel)
-    plt.xticks(rotation=45, ha="right")
-    plt.legend()
-    plt.tight_layout()
-    plt.savefig(OUT / fname, dpi=160)
-    plt.close()
-
-def save_bar(df, x, y, title, fname, xlabel=None, ylabel=None):
-    plt.figure()
-    plt.bar(df[x], df[y])
-    plt.title(title)
-    plt.xlabel(xlabel or x)
-    plt.ylabel(ylabel or y)
-    plt.xticks(rotation=25, ha="right")
-    plt.tight_layout()
-    plt.savefig(OUT / fname, dpi=160)
-    plt.close()
-
-def main():
-    # 1) Trend: Actual vs Budget
-    trend = pd.read_csv(DATA / "monthly_trend.csv")
-    save_line(
-        trend,
-        x="Month",
-        ys=["Actual_Revenue", "Budget_Forecast", "Gross_Profit"],
-        title="Revenue vs Budget (Trend)",
-        fname="viz_trend.png",
-        ylabel="USD"
-    )
+DPI = 160
+FORMATS = ("png", "svg", "json")
+RENDER_VERSION = 1  # bump when chart styling changes so cached files are redrawn
 
-    # 2) Variance by Department (bar, sorted by Variance_Pct)
-    dept = pd.read_csv(DATA / "variance_summary.csv").sort_values("Variance_Pct", ascending=False)
-    save_bar(
-        dept,
-        x="Department",
-        y="Variance_Pct",
-        title="Variance % by Department",
-        fname="viz_dept_variance.png",
-        ylabel="Variance %"
-    )
+# ---------- Specs ----------
+def _values(s: pd.Series) -> list:
+    """Floats with gaps as None, so specs stay valid JSON."""
+    return [None if pd.isna(v) else float(v) for v in s]
+
+def line_spec(df, x, ys, title, fname, xlabel="Month", ylabel="Value"):
+    return {
+        "kind": "line", "name": fname, "title": title, "xlabel": xlabel, "ylabel": ylabel,
+        "x": df[x].astype(str).tolist(),
+        "series": {y: _values(df[y]) for y in ys if y in df.columns},
+    }
+
+def bar_spec(df, x, y, title, fname, xlabel=None, ylabel=None):
+    return {
+        "kind": "bar", "name": fname, "title": title, "xlabel": xlabel or x, "ylabel": ylabel or y,
+        "x": df[x].astype(str).tolist(),
+        "series": {y: _values(df[y])},
+    }
 
-    # 3) Forecast by Department (line)
-    fby = pd.read_csv(DATA / "forecast_by_department.csv")
+def dashboard_specs(trend, dept, fby) -> list:
+    """The three dashboard charts (trend, department variance, forecast)."""
+    fby = fby.assign(Month=fby["Month"].astype(str), Department=fby["Department"].astype(str))
     # Pivot to lines per department
     pivot = fby.pivot(index="Month", columns="Department", values="Forecast").reset_index()
-    save_line(
-        pivot,
-        x="Month",
-        ys=[c for c in pivot.columns if c != "Month"],
-        title="Forecast by Department (Next 6 Months)",
-        fname="viz_forecast_dept.png",
-        ylabel="USD"
+    return [
+        # 1) Trend: Actual vs Budget
+        line_spec(trend, x="Month", ys=["Actual_Revenue", "Budget_Forecast", "Gross_Profit"],
+                  title="Revenue vs Budget (Trend)", fname="viz_trend", ylabel="USD"),
+        # 2) Variance by Department (bar, sorted by Variance_Pct)
+        bar_spec(dept.sort_values("Variance_Pct", ascending=False), x="Department", y="Variance_Pct",
+                 title="Variance % by Department", fname="viz_dept_variance", ylabel="Variance %"),
+        # 3) Forecast by Department (line)
+        line_spec(pivot, x="Month", ys=[c for c in pivot.columns if c != "Month"],
+                  title="Forecast by Department (Next 6 Months)", fname="viz_forecast_dept", ylabel="USD"),
+    ]
+
+def _slug(name) -> str:
+    return re.sub(r"[^A-Za-z0-9]+", "_", str(name)).strip("_").lower() or "blank"
+
+def department_specs(dept_var, fby=None) -> list:
+    """One actual-vs-budget line chart per department (plus its forecast when given)."""
+    monthly = (
+        dept_var.assign(Month=dept_var["Month"].astype(str))
+                .groupby(["Department", "Month"], observed=True, sort=True)[["Revenue", "Forecast_Revenue"]]
+                .sum()
+                .reset_index()
     )
+    fc = None
+    if fby is not None:
+        fc = fby.assign(Month=fby["Month"].astype(str), Department=fby["Department"].astype(str))
+    specs = []
+    for name, d in monthly.groupby("Department", observed=True, sort=True):
+        frame = d.rename(columns={"Revenue": "Actual", "Forecast_Revenue": "Budget"})
+        if fc is not None:
+            f = fc.loc[fc["Department"] == str(name), ["Month", "Forecast"]]
+            frame = frame.merge(f, on="Month", how="outer").sort_values("Month")
+        specs.append(line_spec(frame, x="Month", ys=["Actual", "Budget", "Forecast"],
+                               title=f"{name}: Revenue vs Budget", fname=f"dept_{_slug(name)}", ylabel="USD"))
+    return specs
+
+def spec_hash(spec: dict, fmt: str) -> str:
+    payload = json.dumps({"v": RENDER_VERSION, "fmt": fmt, "dpi": DPI, "spec": spec}, sort_keys=True)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+# ---------- Rendering ----------
+class ChartRenderer:
+    """One Figure/Axes pair reused for every chart drawn in this process."""
+
+    def __init__(self):
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        self.fig = Figure()
+        FigureCanvasAgg(self.fig)
+        self.ax = self.fig.add_subplot()
+
+    def draw(self, spec: dict):
+        ax = self.ax
+        ax.clear()
+        x = spec["x"]
+        if spec["kind"] == "bar":
+            (values,) = spec["series"].values()
+            ax.bar(x, np.asarray(values, dtype=float))
+            rotation = 25
+        else:
+            for label, values in spec["series"].items():
+                ax.plot(x, np.asarray(values, dtype=float), label=label)
+            rotation = 45
+            if spec["series"]:
+                ax.legend()
+        ax.set_title(spec["title"])
+        ax.set_xlabel(spec["xlabel"])
+        ax.set_ylabel(spec["ylabel"])
+        ax.tick_params(axis="x", labelrotation=rotation)
+        for label in ax.get_xticklabels():
+            label.set_horizontalalignment("right")
+        self.fig.tight_layout()
+
+    def png_bytes(self, spec: dict) -> bytes:
+        """Draw spec and return it as PNG bytes (for embedding, e.g. in slides)."""
+        buf = io.BytesIO()
+        self.draw(spec)
+        with span("visuals.savefig", file=spec["name"], rows=len(spec["x"])):
+            self.fig.savefig(buf, format="png", dpi=DPI)
+        return buf.getvalue()
+
+    def save(self, spec: dict, path: Path, fmt: str):
+        if fmt == "json":
+            path.write_text(json.dumps(spec), encoding="utf-8")
+            return
+        self.draw(spec)
+        with span("visuals.savefig", file=path.name, rows=len(spec["x"])):
+            if fmt == "svg":
+                import matplotlib
+                with matplotlib.rc_context({"svg.fonttype": "none"}):  # keep text as text: small files
+                    self.fig.savefig(path, format="svg")
+            else:
+                self.fig.savefig(path, format=fmt, dpi=DPI)
+
+_renderer = None
+_renderer_lock = threading.Lock()  # the shared Figure is not thread-safe (pipeline runs stages in threads)
+
+def _render_task(task):
+    """Worker entry point: (spec, path, fmt) -> path. Reuses this process's renderer."""
+    global _renderer
+    spec, path, fmt = task
+    with _renderer_lock:
+        if _renderer is None:
+            _renderer = ChartRenderer()
+        _renderer.save(spec, Path(path), fmt)
+    return path
+
+def _load_manifest(out_dir: Path) -> dict:
+    try:
+        return json.loads((out_dir / MANIFEST).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+def render_specs(specs, out_dir=OUT, formats=("png",), workers=1, force=False):
+    """
+    Render specs into out_dir in each format, skipping files whose spec hash is unchanged.
+    workers > 1 spreads charts over processes (0 = all cores).
+    Returns (list of paths, number actually rendered)
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    manifest = _load_manifest(out_dir)
+
+    paths, todo, hashes = [], [], {}
+    for spec in specs:
+        for fmt in formats:
+            path = out_dir / f"{spec['name']}.{fmt}"
+            paths.append(path)
+            h = spec_hash(spec, fmt)
+            if not force and manifest.get(path.name) == h and path.exists():
+                continue
+            todo.append((spec, str(path), fmt))
+            hashes[path.name] = h
+
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and len(todo) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(todo))) as pool:
+            list(pool.map(_render_task, todo, chunksize=max(1, len(todo) // (workers * 4))))
+    else:
+        for task in todo:
+            _render_task(task)
+
+    if todo:
+        manifest.update(hashes)
+        tmp = out_dir / (MANIFEST + ".tmp")
+        tmp.write_text(json.dumps(manifest, indent=0, sort_keys=True), encoding="utf-8")
+        os.replace(tmp, out_dir / MANIFEST)
+    return paths, len(todo)
+
+def render_charts(trend, dept, fby, out_dir=OUT, formats=("png",), workers=1, force=False):
+    """
+    Render the three dashboard charts from in-memory frames into out_dir
+    (force=True redraws charts the manifest says are unchanged).
+    trend: monthly_trend, dept: variance_summary, fby: forecast_by_department
+    Returns list of written paths
+    """
+    paths, _ = render_specs(dashboard_specs(trend, dept, fby), out_dir, formats, workers, force)
+    return paths
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Render dashboard charts")
+    p.add_argument("--format", default="png",
+                   help=f"comma-separated output formats from {','.join(FORMATS)}")
+    p.add_argument("--per-department", action="store_true",
+                   help=f"also render one chart per department into {CHART_DIR.relative_to(ROOT)}")
+    p.add_argument("--workers", type=int, default=1, help="render processes (0 = all cores)")
+    p.add_argument("--force", action="store_true", help="redraw even when the input data is unchanged")
+    p.add_argument("--shared", action="store_true",
+                   help="per-department charts read monthly totals from the memory-mapped ledger (shared_ledger.py)")
+    return p.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    formats = tuple(f.strip().lower() for f in args.format.split(",") if f.strip())
+    bad = set(formats) - set(FORMATS)
+    if bad:
+        raise SystemExit(f"Unknown format(s) {sorted(bad)}; expected {','.join(FORMATS)}")
+
+    trend = storage.read_table("monthly_trend", columns=["Month", "Actual_Revenue", "Budget_Forecast", "Gross_Profit"])
+    dept = storage.read_table("variance_summary", columns=["Department", "Variance_Pct"])
+    fby = storage.read_table("forecast_by_department", columns=["Month", "Department", "Forecast"])
+    paths, rendered = render_specs(dashboard_specs(trend, dept, fby), OUT, formats, args.workers, args.force)
+
+    if args.per_department:
+        if args.shared:
+            dv = shared_ledger.ensure().monthly(["Revenue", "Forecast_Revenue"])
+        else:
+            dv = storage.read_table("department_variance", columns=["Month", "Department", "Revenue", "Forecast_Revenue"])
+        more, n = render_specs(department_specs(dv, fby), CHART_DIR, formats, args.workers, args.force)
+        paths += more
+        rendered += n
 
-    print("✅ Saved charts:")
-    print("  - data/viz_trend.png")
-    print("  - data/viz_dept_variance.png")
-    print("  - data/viz_forecast_dept.png")
+    print(f"✅ Saved charts ({rendered} rendered, {len(paths) - rendered} unchanged):")
+    for path in paths:
+        print(f"  - {path.relative_to(ROOT)}")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,87 @@
+# python/param_cache.py
+import hashlib
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+CACHE_VERSION = 1
+
+def series_fingerprint(s: pd.Series) -> str:
+    """Content hash of a monthly series (dates + values, NaNs included)."""
+    h = hashlib.sha1()
+    h.update(np.asarray(s.index, dtype="datetime64[ns]").view("int64").tobytes())
+    h.update(s.to_numpy(dtype=float).tobytes())
+    return h.hexdigest()
+
+class ParamCache:
+    """
+    On-disk cache of fitted Holt-Winters parameters, one entry per department.
+    Each entry holds the series fingerprint, the model config, the smoothing
+    parameters and initial states of the last fit, and a last-used timestamp.
+
+    Lookups are classified as:
+      hit   - same department, same fingerprint -> reuse parameters as-is
+      warm  - same department, data changed     -> warm-start the optimizer
+      miss  - nothing cached                    -> full optimization
+    """
+
+    def __init__(self, path: Path, max_entries: int = 5000, max_age_days: float = 90):
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.max_age_days = max_age_days
+        self.entries = {}
+        self.stats = {"hit": 0, "warm": 0, "miss": 0, "evicted": 0}
+        self.load()
+
+    def load(self):
+        if not self.path.exists():
+            return
+        try:
+            payload = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return  # unreadable cache is just a cold cache
+        if payload.get("version") == CACHE_VERSION:
+            self.entries = payload.get("entries", {})
+
+    def get(self, dept):
+        return self.entries.get(str(dept))
+
+    def record(self, dept, status, entry=None):
+        """Count a lookup outcome and store the entry produced by the fit (if any)."""
+        if status in self.stats:
+            self.stats[status] += 1
+        if entry is not None:
+            entry = dict(entry, last_used=time.time())
+            self.entries[str(dept)] = entry
+
+    def invalidate(self, dept=None):
+        """Drop one department's entry, or everything when dept is None."""
+        if dept is None:
+            self.entries.clear()
+        else:
+            self.entries.pop(str(dept), None)
+
+    def evict(self):
+        """Drop entries older than max_age_days, then least-recently-used beyond max_entries."""
+        before = len(self.entries)
+        if self.max_age_days:
+            cutoff = time.time() - self.max_age_days * 86400
+            self.entries = {k: e for k, e in self.entries.items() if e.get("last_used", 0) >= cutoff}
+        if self.max_entries and len(self.entries) > self.max_entries:
+            newest = sorted(self.entries.items(), key=lambda kv: kv[1].get("last_used", 0), reverse=True)
+            self.entries = dict(newest[: self.max_entries])
+        self.stats["evicted"] += before - len(self.entries)
+
+    def save(self):
+        self.evict()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(json.dumps({"version": CACHE_VERSION, "entries": self.entries}), encoding="utf-8")
+        tmp.replace(self.path)
+
+    def summary(self) -> str:
+        s = self.stats
+        return f"{s['hit']} hits, {s['warm']} warm starts, {s['miss']} misses, {s['evicted']} evicted"
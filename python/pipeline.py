@@ -0,0 +1,283 @@
+# python/pipeline.py
+import argparse
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+
+os.environ.setdefault("MPLBACKEND", "Agg")  # no GUI backend; make_visuals renders through Agg directly
+
+import instrument
+import schema
+import storage
+import ai_summary
+import anomaly
+import forecast
+import generate_data
+import make_deck
+import make_visuals
+import reconcile
+import variance_analysis
+from build_cache import BuildCache
+from param_cache import ParamCache
+
+# ---------- Stages ----------
+# name -> (dependencies, fn(results of dependencies) -> result[, cache spec])
+# DataFrames are handed between stages in memory; each stage still persists
+# its outputs to data/ so BI tools and the standalone scripts see them.
+#
+# A cache spec lists the stage's input and output files (table names or paths),
+# the modules it runs (build_cache adds every local module they import), its
+# parameters, and how to load its result back from the outputs. With the build
+# cache on, a stage whose key and outputs are unchanged is skipped and its result
+# is read from disk only if a later stage actually needs it.
+class Lazy:
+    """A skipped stage's result, loaded from its outputs on first use."""
+
+    def __init__(self, load):
+        self._load, self._lock, self._value, self._done = load, threading.Lock(), None, False
+
+    def get(self):
+        with self._lock:
+            if not self._done:
+                self._value, self._done = self._load(), True
+        return self._value
+
+def resolve(value):
+    return value.get() if isinstance(value, Lazy) else value
+
+def _llm_params() -> dict:
+    import summary_engine
+    summary_engine.load_env()
+    names = ["OPENAI_MODEL", "OPENAI_BASE_URL", "AZURE_OPENAI_ENDPOINT", "AZURE_OPENAI_DEPLOYMENT"]
+    return {
+        **{n: os.getenv(n) for n in names},
+        "keyed": bool(os.getenv("OPENAI_API_KEY") or os.getenv("AZURE_OPENAI_KEY")),
+    }
+
+def build_stages(args) -> dict:
+    data = storage.DATA_DIR
+    charts = [data / "viz_trend.png", data / "viz_dept_variance.png", data / "viz_forecast_dept.png"]
+    fmt = {"format": storage.DEFAULT_FORMAT}
+
+    def ledger(r):
+        if args.generate:
+            df = generate_data.generate()
+            storage.write_table(df, "financials")
+            return df
+        return Lazy(variance_analysis.load_financials)  # not read at all if every consumer is cached
+
+    def variance(r):
+        # add_derived() returns a new frame, so forecast can share the ledger
+        outputs = variance_analysis.build_outputs(r["ledger"])
+        variance_analysis.write_outputs(outputs)
+        return outputs
+
+    def fcst(r):
+        cache = None if args.no_cache else ParamCache(forecast.PARAM_CACHE)
+        out, errors = forecast.forecast_frame(r["ledger"], workers=args.workers, cache=cache)
+        if cache is not None:
+            cache.save()
+        for dept, err in errors.items():
+            print(f"⚠️ Forecast failed for {dept}: {err}")
+        storage.write_table(out, forecast.OUTPUT)
+        return out
+
+    def reconciled(r):
+        rec, errors = reconcile.reconcile_ledger(r["ledger"], args.reconcile, workers=args.workers)
+        for node, err in errors.items():
+            print(f"⚠️ Base forecast failed for {node}: {err}")
+        storage.write_table(rec.round(2), reconcile.OUTPUT)
+        return reconcile.total_forecast(rec)
+
+    def anomalies(r):
+        previous = storage.read_table(anomaly.OUTPUT) if storage.table_exists(anomaly.OUTPUT) else None
+        anoms, _ = anomaly.run(r["variance"]["department_variance"], previous=previous)
+        storage.write_table(anoms, anomaly.OUTPUT)
+        return anoms
+
+    def summary(r):
+        v = r["variance"]
+        text, provider = ai_summary.build_summary(v["latest_kpis"], v["variance_summary"], r["forecast"],
+                                                  fc_total=r.get("reconcile"), anomalies=r["anomalies"])
+        ai_summary.write_summary(text)
+        return text
+
+    def visuals(r):
+        v = r["variance"]
+        return make_visuals.render_charts(v["monthly_trend"], v["variance_summary"], r["forecast"])
+
+    def deck(r):
+        return make_deck.build_deck(r["summary"], anomalies=r["anomalies"])
+
+    summary_inputs = ["latest_kpis", "variance_summary", forecast.OUTPUT, anomaly.OUTPUT]
+    specs = {
+        "variance": {
+            "inputs": ["financials"], "outputs": variance_analysis.OUTPUT_NAMES,
+            "code": ["variance_analysis"],
+            "params": {**fmt, "measures": schema.MEASURE_DTYPE},
+            "load": lambda: {n: storage.read_table(n) for n in variance_analysis.OUTPUT_NAMES},
+        },
+        "forecast": {
+            "inputs": ["financials"], "outputs": [forecast.OUTPUT],
+            "code": ["forecast"],
+            "params": {**fmt, "statsmodels": forecast.HAS_SM},
+            "load": lambda: storage.read_table(forecast.OUTPUT),
+        },
+        "anomalies": {
+            "inputs": ["department_variance"], "outputs": [anomaly.OUTPUT],
+            "code": ["anomaly"],
+            "params": fmt,
+            "load": lambda: storage.read_table(anomaly.OUTPUT),
+        },
+        "reconcile": {
+            "inputs": ["financials"], "outputs": [reconcile.OUTPUT],
+            "code": ["reconcile"],
+            "params": {**fmt, "statsmodels": forecast.HAS_SM, "method": args.reconcile},
+            "load": lambda: reconcile.total_forecast(storage.read_table(reconcile.OUTPUT)),
+        },
+        "summary": {
+            "inputs": summary_inputs + ([reconcile.OUTPUT] if args.reconcile else []),
+            "outputs": [data / "exec_summary.md"],
+            "code": ["ai_summary"],
+            "params": {**fmt, "llm": _llm_params()},
+            "load": lambda: (data / "exec_summary.md").read_text(encoding="utf-8"),
+        },
+        "visuals": {
+            "inputs": ["monthly_trend", "variance_summary", forecast.OUTPUT], "outputs": charts,
+            "code": ["make_visuals"],
+            "params": fmt,
+            "load": lambda: charts,
+        },
+        "deck": {
+            "inputs": make_deck.cache_inputs(data), "outputs": [data / "fpna_onepager.pptx"],
+            "code": make_deck.CACHE_CODE,
+            "params": {},
+            "load": lambda: data / "fpna_onepager.pptx",
+        },
+    }
+
+    stages = {
+        "ledger": ((), ledger),
+        "variance": (("ledger",), variance, specs["variance"]),
+        "forecast": (("ledger",), fcst, specs["forecast"]),
+        "anomalies": (("variance",), anomalies, specs["anomalies"]),
+        "summary": (("variance", "forecast", "anomalies"), summary, specs["summary"]),
+        "visuals": (("variance", "forecast"), visuals, specs["visuals"]),
+        "deck": (("summary", "visuals", "anomalies"), deck, specs["deck"]),
+    }
+    if args.reconcile:
+        stages["reconcile"] = (("ledger",), reconciled, specs["reconcile"])
+        stages["summary"] = (("variance", "forecast", "anomalies", "reconcile"), summary, specs["summary"])
+    return stages
+
+def _files(items, reading: bool) -> list:
+    """Table names to their file paths (where they are read from / written to); paths pass through."""
+    if reading:
+        return [storage.resolve(i) if isinstance(i, str) else i for i in items]
+    return [storage.table_path(i) if isinstance(i, str) else i for i in items]
+
+# ---------- Runner ----------
+def run_dag(stages: dict, max_parallel: int = 4, cache: BuildCache = None, rebuild: bool = False):
+    """
+    Run stages as soon as their dependencies finish, up to max_parallel at once.
+    A failing stage stops new work from being scheduled; its error is re-raised
+    once the running stages finish.
+    With a build cache, stages with a cache spec are skipped when their key and
+    outputs are unchanged (rebuild=True runs them anyway but still records them).
+    Returns (results {name: value or Lazy}, timings {name: (start offset s, duration s)})
+    """
+    results, timings = {}, {}
+    pending = dict(stages)
+    running = {}
+    failure = None
+    t0 = time.perf_counter()
+
+    def timed(name, fn, inputs, spec):
+        start = time.perf_counter()
+        with instrument.span(f"stage.{name}", cat="stage") as sp, instrument.profiled(f"stage_{name}"):
+            key = None
+            if cache is not None and spec is not None:
+                key = cache.stage_key(name, _files(spec["inputs"], True), spec["code"], spec["params"])
+                if not rebuild and cache.lookup(name, key):
+                    sp["cached"] = True
+                    timings[name] = (start - t0, time.perf_counter() - start)
+                    return Lazy(spec["load"])
+            value = fn({d: resolve(v) for d, v in inputs.items()})
+            if key is not None:
+                cache.record(name, key, _files(spec["outputs"], False))
+        timings[name] = (start - t0, time.perf_counter() - start)
+        return value
+
+    with ThreadPoolExecutor(max_workers=max_parallel) as pool:
+        while pending or running:
+            if failure is None:
+                ready = [n for n, (deps, *_) in pending.items() if all(d in results for d in deps)]
+                for name in ready:
+                    deps, fn, *spec = pending.pop(name)
+                    spec = spec[0] if spec else None
+                    running[pool.submit(timed, name, fn, {d: results[d] for d in deps}, spec)] = name
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in done:
+                name = running.pop(fut)
+                try:
+                    results[name] = fut.result()
+                except Exception as e:
+                    failure = failure or (name, e)
+
+    if failure is not None:
+        name, e = failure
+        raise RuntimeError(f"Stage '{name}' failed: {e}") from e
+    return results, timings
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Run the whole FP&A pipeline in one process")
+    p.add_argument("--generate", action="store_true",
+                   help="regenerate synthetic financials instead of loading data/financials")
+    p.add_argument("--workers", type=int, default=1,
+                   help="forecast worker processes (1 = in-process, 0 = all cores)")
+    p.add_argument("--no-cache", action="store_true", help="disable the Holt-Winters parameter cache")
+    p.add_argument("--reconcile", choices=reconcile.METHODS, default=None,
+                   help="also reconcile forecasts over the hierarchy; the summary uses the coherent total")
+    p.add_argument("--rebuild", action="store_true",
+                   help="run every stage even when the build cache says its outputs are current")
+    p.add_argument("--no-build-cache", action="store_true",
+                   help="neither consult nor update the build cache (data/.build_cache.json)")
+    p.add_argument("--max-parallel", type=int, default=4, help="stages allowed to run at once")
+    p.add_argument("--trace", type=Path, default=None,
+                   help="write a Chrome trace-event JSON of stage and hot-spot spans")
+    p.add_argument("--profile", type=Path, default=None,
+                   help="dump cProfile stats per stage into this directory")
+    return p.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    instrument.enable(trace=args.trace, profile=args.profile)
+    t0 = time.perf_counter()
+    cache = None if args.no_build_cache else BuildCache()
+    try:
+        _, timings = run_dag(build_stages(args), max_parallel=args.max_parallel, cache=cache, rebuild=args.rebuild)
+    finally:
+        if cache is not None:
+            cache.save()
+    total = time.perf_counter() - t0
+
+    reused = set(cache.stats["reused"]) if cache is not None else set()
+    print("✅ Pipeline finished")
+    print("⏱️ Stage timings:")
+    for name, (start, secs) in sorted(timings.items(), key=lambda kv: kv[1][0]):
+        print(f"  - {name:<9} start +{start:6.2f}s  took {secs:6.2f}s{'  (reused)' if name in reused else ''}")
+    print(f"  = total     {total:.2f}s")
+    if cache is not None:
+        print(f"♻️ Build cache: {cache.summary()}")
+    if args.trace:
+        print(f"🧭 Trace → {args.trace} (open in chrome://tracing or ui.perfetto.dev)")
+        print(instrument.summarize(instrument.load_trace(args.trace)).head(15).to_string())
+    if args.profile:
+        print(f"🧭 cProfile stats → {args.profile}/stage_*.prof")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,407 @@
+# python/scenarios.py
+"""
+What-if scenarios: driver shocks evaluated over a scenario axis.
+
+A scenario is a list of shocks; each scales one driver by pct percent,
+optionally only for some departments and a month range:
+
+  {"scenarios": [
+    {"name": "Downside", "shocks": [
+      {"driver": "revenue", "pct": -8},
+      {"driver": "expense", "pct": 12, "departments": ["Marketing"], "from": "2024-07"}
+    ]}
+  ]}
+
+Drivers are revenue, expense and budget (Forecast_Revenue). Shocks on the
+same cell compound. --sweep builds a grid instead (every combination of the
+listed percentages), e.g. --sweep revenue=-20:20:2 --sweep expense@R&D=0:30:5.
+
+The ledger is read once and reduced to month x department cells. Shocks
+become a (scenarios x drivers x months x departments) multiplier array, and
+every output is computed for all scenarios at once by broadcasting it over the
+cells, so the ledger is never re-read or copied per scenario. A "Base"
+scenario with no shocks is always first.
+
+Forecasts: Holt-Winters parameters are fitted once per department on the base
+series (cached parameters are reused), then every scenario's shocked series
+is run through the same smoothing recursions, vectorized over scenarios.
+That is exact for shocks that cover the whole history; for shocks that start
+later the model reacts like a fitted model does to new data. Departments that
+take forecast.py's rolling-mean fallback are done in one batch.
+
+Avg_Gross_Margin_Pct averages unrounded row margins, so it can differ from
+variance_summary in the last decimal.
+"""
+import argparse
+import itertools
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import schema
+import storage
+import forecast
+import variance_analysis
+from instrument import span
+from param_cache import ParamCache
+
+DATA_DIR = Path(__file__).resolve().parents[1] / "data"
+DRIVERS = {"revenue": "Revenue", "expense": "Expense", "budget": "Forecast_Revenue"}
+BASE = "Base"
+OUTPUTS = ["scenario_summary", "scenario_trend", "scenario_department_variance", "scenario_kpis", "scenario_forecast"]
+DEFAULT_SWEEP = ["revenue=-10:10:5", "expense=-10:10:5"]
+
+# ---------- Scenario specs ----------
+def _month_code(label):
+    return None if label is None else int(schema.month_codes([str(label)])[0])
+
+def load_spec(path: Path) -> list:
+    """Scenarios from a JSON spec: [{"name", "shocks": [{driver, pct, departments?, from?, to?}]}]."""
+    payload = json.loads(Path(path).read_text(encoding="utf-8"))
+    scenarios = payload["scenarios"] if isinstance(payload, dict) else payload
+    for sc in scenarios:
+        for shock in sc.get("shocks", []):
+            if shock.get("driver") not in DRIVERS:
+                raise ValueError(f"Scenario {sc.get('name')!r}: unknown driver {shock.get('driver')!r}; "
+                                 f"expected one of {', '.join(DRIVERS)}")
+    return scenarios
+
+def _steps(spec: str) -> np.ndarray:
+    """'-10:10:5' -> [-10, -5, 0, 5, 10]; '3' -> [3]; '1,2,4' -> [1, 2, 4]."""
+    if ":" in spec:
+        lo, hi, step = (float(x) for x in spec.split(":"))
+        return np.round(np.arange(lo, hi + step / 2, step), 6)
+    return np.array([float(x) for x in spec.split(",")])
+
+def sweep(items) -> list:
+    """
+    Grid of scenarios from driver[@Dept,Dept]=lo:hi:step items.
+    Returns one scenario per combination of the listed percentages.
+    """
+    axes = []
+    for item in items:
+        key, _, values = item.partition("=")
+        driver, _, depts = key.partition("@")
+        if driver not in DRIVERS or not values:
+            raise ValueError(f"Bad sweep {item!r}; expected driver[@Dept,...]=lo:hi:step with driver in {', '.join(DRIVERS)}")
+        axes.append((driver, [d for d in depts.split(",") if d], _steps(values)))
+
+    scenarios = []
+    for combo in itertools.product(*(steps for _, _, steps in axes)):
+        shocks, parts = [], []
+        for (driver, depts, _), pct in zip(axes, combo):
+            shocks.append({"driver": driver, "pct": float(pct), "departments": depts})
+            parts.append(f"{driver}{'@' + '+'.join(depts) if depts else ''}{pct:+g}%")
+        scenarios.append({"name": " ".join(parts), "shocks": shocks})
+    return scenarios
+
+# ---------- Base cells ----------
+def base_cells(df: pd.DataFrame) -> dict:
+    """
+    One pass over a compact ledger: per (month, department) cell sums of the
+    measures, row counts, and the sum of Expense / Revenue over rows with
+    revenue (for the average margin). Arrays are months x departments over the
+    full month range.
+    """
+    df = df if schema.is_compact(df) else schema.compact(df)
+    month = df["Month"].to_numpy()
+    m0 = int(month.min())
+    n_months = int(month.max()) - m0 + 1
+    dept = df["Department"].cat
+    n_depts = len(dept.categories)
+    cell = (month - m0).astype(np.int64) * n_depts + dept.codes.to_numpy()
+    size = n_months * n_depts
+
+    def total(weights=None):
+        return np.bincount(cell, weights=weights, minlength=size).reshape(n_months, n_depts)
+
+    rev = df["Revenue"].to_numpy()
+    has_rev = rev != 0
+    ratio = np.zeros(len(rev))
+    np.divide(df["Expense"].to_numpy(), rev, out=ratio, where=has_rev)
+    return {
+        "months": np.arange(m0, m0 + n_months, dtype=np.int32),
+        "departments": np.asarray(dept.categories, dtype=object),
+        **{m: total(df[m].to_numpy().astype(float)) for m in DRIVERS.values()},
+        "rows": total(),
+        "margin_rows": total(has_rev.astype(float)),
+        "cost_ratio": total(ratio),
+    }
+
+def multipliers(scenarios: list, cells: dict) -> np.ndarray:
+    """(scenarios x drivers x months x departments) multipliers; Base (all ones) first."""
+    months, depts = cells["months"], cells["departments"]
+    drivers = list(DRIVERS)
+    mult = np.ones((len(scenarios) + 1, len(drivers), len(months), len(depts)))
+    dept_pos = {d: i for i, d in enumerate(depts)}
+    for i, sc in enumerate(scenarios, start=1):
+        for shock in sc.get("shocks", []):
+            rows = np.ones(len(months), dtype=bool)
+            lo, hi = _month_code(shock.get("from")), _month_code(shock.get("to"))
+            if lo is not None:
+                rows &= months >= lo
+            if hi is not None:
+                rows &= months <= hi
+            cols = np.ones(len(depts), dtype=bool)
+            if shock.get("departments"):
+                unknown = [d for d in shock["departments"] if d not in dept_pos]
+                if unknown:
+                    raise ValueError(f"Scenario {sc['name']!r}: unknown department(s) {unknown}")
+                cols = np.isin(depts, shock["departments"])
+            mult[i, drivers.index(shock["driver"])][np.ix_(rows, cols)] *= 1 + float(shock["pct"]) / 100
+    return mult
+
+# ---------- Variance outputs ----------
+def _ratio_pct(num, den):
+    out = np.full(np.broadcast(num, den).shape, np.nan)
+    np.divide(num, den, out=out, where=den != 0)
+    return out * 100
+
+def _stack(names, inner: pd.DataFrame, n_inner: int) -> pd.DataFrame:
+    """Prefix a Scenario column to a frame laid out scenario-major."""
+    return pd.concat([pd.DataFrame({"Scenario": np.repeat(np.asarray(names, dtype=object), n_inner)}), inner], axis=1)
+
+def scenario_variance(cells: dict, mult: np.ndarray, names: list) -> dict:
+    """Variance summary, monthly trend, department variance by month and latest KPIs for every scenario."""
+    drivers = list(DRIVERS)
+    rev = mult[:, drivers.index("revenue")] * cells["Revenue"]            # S x M x D
+    exp = mult[:, drivers.index("expense")] * cells["Expense"]
+    bud = mult[:, drivers.index("budget")] * cells["Forecast_Revenue"]
+    var, gp = rev - bud, rev - exp
+    n_sc = len(names)
+    present = cells["rows"].sum(axis=1) > 0                               # months with any rows
+    labels = schema.month_labels(cells["months"])
+    depts = cells["departments"]
+    observed = cells["rows"].sum(axis=0) > 0
+
+    # Row margins are 1 - cost_ratio scaled by each cell's expense/revenue multiplier
+    rev_m, exp_m = mult[:, drivers.index("revenue")], mult[:, drivers.index("expense")]
+    live = rev_m != 0
+    k = np.divide(exp_m, rev_m, out=np.zeros_like(exp_m), where=live)
+    margin_rows = (live * cells["margin_rows"]).sum(axis=1)
+    margin_sum = (live * (cells["margin_rows"] - k * cells["cost_ratio"])).sum(axis=1)
+
+    # 1) summary: S x D, departments by Actual_Total descending within each scenario
+    actual, budget, var_total = rev.sum(axis=1), bud.sum(axis=1), var.sum(axis=1)
+    avg_margin = _ratio_pct(margin_sum, margin_rows)
+    d_idx = np.flatnonzero(observed)
+    order = np.argsort(-actual[:, d_idx], axis=1, kind="stable")
+    pick = d_idx[order]
+    take = lambda a: np.take_along_axis(a, pick, axis=1).ravel()
+    summary = _stack(names, pd.DataFrame({
+        "Department": depts[pick.ravel()],
+        "Actual_Total": take(actual),
+        "Budget_Total": take(budget),
+        "Variance_Total": take(var_total),
+        "Avg_Gross_Margin_Pct": take(avg_margin),
+        "Variance_Pct": np.round(take(var_total) / np.where(take(budget) != 0, take(budget), np.nan), 4) * 100,
+    }), len(d_idx))
+
+    # 2) monthly trend: S x months present; YoY is 12 rows back, like monthly_trend
+    m_idx = np.flatnonzero(present)
+    actual_m = rev.sum(axis=2)[:, m_idx]
+    yoy = np.full(actual_m.shape, np.nan)
+    if actual_m.shape[1] > 12:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            yoy[:, 12:] = (actual_m[:, 12:] / actual_m[:, :-12] - 1) * 100
+    trend = _stack(names, pd.DataFrame({
+        "Month": np.tile(labels[m_idx], n_sc),
+        "Actual_Revenue": actual_m.ravel(),
+        "Budget_Forecast": bud.sum(axis=2)[:, m_idx].ravel(),
+        "Gross_Profit": gp.sum(axis=2)[:, m_idx].ravel(),
+        "YoY_Actual_Revenue": np.round(yoy, 2).ravel(),
+    }), len(m_idx))
+
+    # 3) department variance by month: S x (month, department) cells with rows
+    mm, dd = np.nonzero(cells["rows"] > 0)
+    cell_rev, cell_bud, cell_var = rev[:, mm, dd], bud[:, mm, dd], var[:, mm, dd]
+    dept_var = _stack(names, pd.DataFrame({
+        "Month": np.tile(labels[mm], n_sc),
+        "Department": np.tile(depts[dd], n_sc),
+        "Revenue": cell_rev.ravel(),
+        "Forecast_Revenue": cell_bud.ravel(),
+        "Variance_vs_Forecast": cell_var.ravel(),
+        "Variance_Pct": _ratio_pct(cell_var, cell_bud).ravel(),
+        "Gross_Margin_Pct": _ratio_pct(gp[:, mm, dd], cell_rev).ravel(),
+    }), len(mm))
+
+    # 4) latest KPIs: one row per scenario
+    last = m_idx[-1]
+    kpi_actual, kpi_budget = rev[:, last].sum(axis=1), bud[:, last].sum(axis=1)
+    kpi_var, kpi_gp = var[:, last].sum(axis=1), gp[:, last].sum(axis=1)
+    kpis = pd.DataFrame({
+        "Scenario": np.asarray(names, dtype=object),
+        "Month": labels[last],
+        "Actual_Total": kpi_actual,
+        "Budget_Total": kpi_budget,
+        "Variance_Total": kpi_var,
+        "Variance_Pct": _ratio_pct(kpi_var, kpi_budget),
+        "Gross_Margin_Pct": _ratio_pct(kpi_gp, kpi_actual),
+    })
+    return {
+        "scenario_summary": summary.round(2),
+        "scenario_trend": trend.round(2),
+        "scenario_department_variance": dept_var.round(2),
+        "scenario_kpis": kpis.round(2),
+    }
+
+# ---------- Forecast outputs ----------
+def holt_winters_scenarios(y: np.ndarray, first: np.ndarray, last: np.ndarray, entries: list, scale: np.ndarray):
+    """
+    Re-run fitted Holt-Winters models over every scenario's history.
+    y: S x T x D shocked revenue; first/last: per-department valid span (indices into T);
+    entries: per-department forecast.py cache entries (smoothing params + initial states);
+    scale: S x D multiplier applied to each model's initial states.
+    Returns (forecast S x D x HORIZON, residual std S x D)
+    """
+    n_sc, T, n_d = y.shape
+    sp = [np.asarray(e["start_params"], dtype=float) for e in entries]
+    m = len(sp[0]) - 5
+    alpha, beta, gamma = (np.array([p[i] for p in sp]) for i in range(3))
+    level = scale * np.array([p[3] for p in sp])
+    trend = scale * np.array([p[4] for p in sp])
+    seas = scale[:, :, None] * np.array([p[5:] for p in sp])          # S x D x m, circular
+    cols = np.arange(n_d)
+
+    resid_sum = np.zeros((n_sc, n_d))
+    resid_sq = np.zeros((n_sc, n_d))
+    for t in range(T):
+        active = (t >= first) & (t <= last)
+        if not active.any():
+            continue
+        pos = (t - first) % m if m else None
+        s_old = seas[:, cols, pos] if m else 0.0
+        yt = y[:, t]
+        err = yt - (level + trend + s_old)
+        new_level = alpha * (yt - s_old) + (1 - alpha) * (level + trend)
+        new_trend = beta * (new_level - level) + (1 - beta) * trend
+        if m:
+            new_seas = gamma * (yt - level - trend) + (1 - gamma) * s_old
+            seas[:, cols, pos] = np.where(active, new_seas, s_old)
+        level = np.where(active, new_level, level)
+        trend = np.where(active, new_trend, trend)
+        resid_sum += np.where(active, err, 0.0)
+        resid_sq += np.where(active, err * err, 0.0)
+
+    n = (last - first + 1).astype(float)
+    var = (resid_sq - resid_sum ** 2 / n) / np.maximum(n - 1, 1)
+    resid_std = np.where(n > 1, np.sqrt(np.maximum(var, 0.0)), 0.0)
+
+    h = np.arange(1, forecast.HORIZON + 1)
+    fc = level[:, :, None] + h * trend[:, :, None]
+    if m:
+        idx = ((last - first + 1)[:, None] + (h - 1) % m) % m            # D x HORIZON
+        fc = fc + np.take_along_axis(seas, np.broadcast_to(idx, (n_sc, *idx.shape)), axis=2)
+    return fc, resid_std
+
+def scenario_forecast(cells: dict, mult: np.ndarray, names: list, cache=None) -> pd.DataFrame:
+    """Revenue forecast per scenario and department: Scenario, Month, Department, Forecast, Lower, Upper."""
+    cols = ["Scenario", "Month", "Department", "Forecast", "Lower", "Upper"]
+    has_rows = cells["rows"] > 0
+    keep = has_rows.any(axis=0)
+    base = np.where(has_rows, cells["Revenue"], np.nan)[:, keep]          # T x D, NaN where no rows
+    depts = cells["departments"][keep]
+    rev_mult = mult[:, list(DRIVERS).index("revenue")][:, :, keep]        # S x T x D
+    n_sc, T, n_d = rev_mult.shape
+    labels = pd.period_range(schema.month_labels(cells["months"][:1])[0], periods=T + forecast.HORIZON,
+                             freq="M").strftime("%Y-%m")
+    valid = ~np.isnan(base)
+    first = valid.argmax(axis=0)
+    last = T - 1 - valid[::-1].argmax(axis=0)
+
+    # Fit (or reuse) one model per department on the base series
+    wide = pd.DataFrame(base, index=schema.month_start(cells["months"]), columns=depts)
+    spans = forecast.series_spans(wide)
+    entries = [None] * n_d
+    if forecast.HAS_SM:
+        with span("scenarios.base_fits", series=int((spans >= 4).sum())):
+            for j, dept in enumerate(depts):
+                if spans[j] < max(forecast.ROLLING_WINDOW + 1, 4):
+                    continue
+                gappy = np.isnan(base[first[j]:last[j] + 1, j]).any()
+                if gappy:
+                    continue  # fit_series would fail on the gap and fall back too
+                _, entries[j], _ = forecast.fit_series(wide[dept], cache.get(dept) if cache else None)
+    hw = np.array([e is not None for e in entries], dtype=bool)
+
+    frames = []
+    shocked = base[None] * rev_mult                                      # S x T x D
+    if hw.any():
+        sel = np.flatnonzero(hw)
+        scale = rev_mult[:, first[sel], sel]                             # multiplier at each series' start
+        with span("scenarios.hw_paths", scenarios=n_sc, series=len(sel)):
+            fc, resid_std = holt_winters_scenarios(
+                np.nan_to_num(shocked[:, :, sel]), first[sel], last[sel], [entries[j] for j in sel], scale)
+        future = last[sel][:, None] + np.arange(1, forecast.HORIZON + 1)
+        band = 1.96 * resid_std[:, :, None]
+        frames.append(pd.DataFrame({
+            "Scenario": np.repeat(np.arange(n_sc), len(sel) * forecast.HORIZON),
+            "Month": np.tile(np.asarray(labels)[future.ravel()], n_sc),
+            "Department": np.tile(np.repeat(depts[sel], forecast.HORIZON), n_sc),
+            "Forecast": fc.ravel(),
+            "Lower": (fc - band).ravel(),
+            "Upper": (fc + band).ravel(),
+        }))
+    if (~hw).any():
+        sel = np.flatnonzero(~hw)
+        stacked = shocked[:, :, sel].transpose(1, 0, 2).reshape(T, n_sc * len(sel))
+        with span("scenarios.fallback_batch", series=stacked.shape[1]):
+            fb = forecast.forecast_fallback_batch(pd.DataFrame(stacked, index=wide.index))
+        pos = fb["Department"].to_numpy(dtype=np.int64)
+        fb["Scenario"] = pos // len(sel)
+        fb["Department"] = depts[sel][pos % len(sel)]
+        frames.append(fb)
+
+    out = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=cols)
+    out = out.sort_values(["Scenario", "Department"], kind="stable").reset_index(drop=True)
+    out["Scenario"] = np.asarray(names, dtype=object)[out["Scenario"].to_numpy(dtype=np.int64)]
+    return out[cols].round(2)
+
+# ---------- Run ----------
+def run_scenarios(df: pd.DataFrame, scenarios: list, cache=None, with_forecast: bool = True) -> dict:
+    """All scenario outputs for a ledger frame. Returns {table name: frame}."""
+    names = [BASE, *[sc["name"] for sc in scenarios]]
+    if len(set(names)) != len(names):
+        raise ValueError("Scenario names must be unique (and not 'Base')")
+    with span("scenarios.cells", rows=len(df)):
+        cells = base_cells(df)
+    mult = multipliers(scenarios, cells)
+    with span("scenarios.variance", scenarios=len(names)):
+        outputs = scenario_variance(cells, mult, names)
+    if with_forecast:
+        with span("scenarios.forecast", scenarios=len(names)):
+            outputs["scenario_forecast"] = scenario_forecast(cells, mult, names, cache)
+    return outputs
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Evaluate what-if driver shocks over many scenarios at once")
+    p.add_argument("--spec", type=Path, default=None, help="JSON scenario spec (see module docstring)")
+    p.add_argument("--sweep", action="append", default=None,
+                   help="driver[@Dept,...]=lo:hi:step grid axis; repeat for more axes "
+                        f"(default: {' '.join(DEFAULT_SWEEP)} when no --spec)")
+    p.add_argument("--no-forecast", action="store_true", help="variance outputs only")
+    p.add_argument("--no-cache", action="store_true", help="refit Holt-Winters instead of reusing cached parameters")
+    return p.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    scenarios = load_spec(args.spec) if args.spec else []
+    if args.sweep or not args.spec:
+        scenarios += sweep(args.sweep or DEFAULT_SWEEP)
+
+    df = variance_analysis.load_financials()
+    cache = None if args.no_cache else ParamCache(forecast.PARAM_CACHE)
+    outputs = run_scenarios(df, scenarios, cache=cache, with_forecast=not args.no_forecast)
+
+    for name, frame in outputs.items():
+        path = storage.write_table(frame, name)
+        print(f"✅ {name}: {len(frame):,} rows → {path}")
+    kpis = outputs["scenario_kpis"].sort_values("Actual_Total")
+    print(f"🔎 {len(kpis)} scenario(s), latest month {kpis['Month'].iloc[0]} actual revenue "
+          f"{kpis['Actual_Total'].min():,.0f} – {kpis['Actual_Total'].max():,.0f}")
+    print(pd.concat([kpis.head(3), kpis.tail(3)]).drop_duplicates().to_string(index=False))
+
+if __name__ == "__main__":
+    main()
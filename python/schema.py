@@ -0,0 +1,143 @@
+# python/schema.py
+"""
+Compact in-memory representation of the ledger.
+
+  Month       int32 month code: months since 1970-01 (the same ordinal as
+              period[M] and numpy datetime64[M]), so it sorts chronologically
+  dimensions  categorical with sorted categories (Department, Entity, ...)
+  measures    as stored (int64/float64), or all float32 with FPNA_MEASURE_DTYPE=float32
+
+Month codes are turned back into "YYYY-MM" labels only on output, one string
+per distinct month. float32 halves measure memory but keeps only ~7
+significant digits, so totals over millions of rows can drift by tens of cents.
+
+    python python/schema.py            # memory of the raw vs compact ledger
+"""
+import argparse
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import storage
+
+DATA_DIR = Path(__file__).resolve().parents[1] / "data"
+
+MONTH = "Month"
+DIMENSIONS = sorted(storage.CATEGORICAL)
+MEASURES = ["Revenue", "Expense", "Forecast_Revenue"]
+MEASURE_DTYPES = ["auto", "float32", "float64"]
+MEASURE_DTYPE = os.getenv("FPNA_MEASURE_DTYPE", "auto").lower()
+
+def _measure_dtype(dtype=None):
+    """numpy dtype for measures, or None to keep them as stored ("auto")."""
+    dtype = (dtype or MEASURE_DTYPE).lower()
+    if dtype not in MEASURE_DTYPES:
+        raise ValueError(f"Unknown measure dtype {dtype!r}; expected one of {MEASURE_DTYPES}")
+    return None if dtype == "auto" else dtype
+
+# ---------- Months ----------
+def month_codes(values) -> np.ndarray:
+    """int32 month codes from YYYY-MM(-DD) strings, periods, datetimes, categoricals or codes."""
+    s = values if isinstance(values, pd.Series) else pd.Series(values)
+    if pd.api.types.is_integer_dtype(s.dtype):
+        return s.to_numpy(dtype=np.int32)
+    if isinstance(s.dtype, pd.PeriodDtype):
+        return s.array.asi8.astype(np.int32)
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        codes, uniques = s.cat.codes.to_numpy(), s.cat.categories
+    else:
+        codes, uniques = pd.factorize(s)
+    if (codes < 0).any():
+        raise ValueError("Month has missing values")
+    # Parse each distinct month once, then broadcast through the codes
+    months = np.array([str(u)[:7] for u in uniques], dtype="datetime64[M]")
+    return months.astype(np.int64).astype(np.int32)[codes]
+
+def month_labels(codes) -> np.ndarray:
+    """"YYYY-MM" strings (object array) for int32 month codes."""
+    codes = np.asarray(codes)
+    uniques, inverse = np.unique(codes, return_inverse=True)
+    labels = np.datetime_as_string(uniques.astype(np.int64).astype("datetime64[M]"), unit="M")
+    return labels.astype(object)[inverse]
+
+def month_categorical(codes) -> pd.Categorical:
+    """Month labels as a categorical: per-row int codes, one string per distinct month."""
+    codes = np.asarray(codes)
+    if codes.size == 0:
+        return pd.Categorical([])
+    lo = int(codes.min())
+    rel = codes - lo
+    present = np.bincount(rel) > 0
+    remap = (np.cumsum(present) - 1).astype(np.int16)  # rank of each month among those present
+    return pd.Categorical.from_codes(remap[rel], categories=month_labels(np.flatnonzero(present) + lo))
+
+def month_start(values) -> np.ndarray:
+    """datetime64[ns] first-of-month for any Month representation month_codes() accepts."""
+    return month_codes(values).astype(np.int64).astype("datetime64[M]").astype("datetime64[ns]")
+
+# ---------- Frames ----------
+def _sorted_category(s: pd.Series) -> pd.Series:
+    s = s if isinstance(s.dtype, pd.CategoricalDtype) else s.astype("category")
+    cats = s.cat.categories
+    if not cats.is_monotonic_increasing:
+        s = s.cat.reorder_categories(cats.sort_values())
+    return s
+
+def compact(df: pd.DataFrame, measure_dtype=None) -> pd.DataFrame:
+    """
+    Ledger frame in the compact layout. Columns already in the target dtype
+    are passed through without copying; other columns are left as they are.
+    """
+    dtype = _measure_dtype(measure_dtype)
+    cols = {}
+    for col in df.columns:
+        s = df[col]
+        if col == MONTH:
+            s = month_codes(s)
+        elif col in storage.CATEGORICAL:
+            s = _sorted_category(s)
+        elif col in MEASURES and dtype is not None and s.dtype != dtype:
+            s = s.to_numpy(dtype=dtype)
+        cols[col] = s
+    return pd.DataFrame(cols, index=df.index, copy=False)
+
+def is_compact(df: pd.DataFrame) -> bool:
+    return MONTH in df.columns and df[MONTH].dtype == np.int32
+
+def load_ledger(name: str = "financials", columns=None, measure_dtype=None, data_dir: Path = DATA_DIR) -> pd.DataFrame:
+    """
+    Read a ledger table straight into the compact layout. CSV months and
+    dimensions are parsed as categoricals, so no per-row string column is built.
+    """
+    dtype = _measure_dtype(measure_dtype)
+    names = list(columns) if columns is not None else storage.table_columns(name, data_dir=data_dir)
+    parse = {c: "category" for c in names if c == MONTH or c in storage.CATEGORICAL}
+    if dtype is not None:
+        parse.update({c: dtype for c in names if c in MEASURES})
+    df = storage.read_table(name, columns=columns, data_dir=data_dir, dtype=parse)
+    return compact(df, dtype or "auto")
+
+def footprint(df: pd.DataFrame) -> float:
+    """Deep memory use in MB."""
+    return df.memory_usage(deep=True).sum() / 2**20
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Compare raw and compact ledger memory use")
+    p.add_argument("--table", default="financials")
+    p.add_argument("--measure-dtype", choices=MEASURE_DTYPES, default=None)
+    return p.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    raw = storage.read_table(args.table)
+    lean = load_ledger(args.table, measure_dtype=args.measure_dtype)
+    print(f"🗂️ {args.table}: {len(raw):,} rows")
+    print(f"  raw      {footprint(raw):9.1f} MB")
+    print(f"  compact  {footprint(lean):9.1f} MB  ({footprint(raw) / max(footprint(lean), 1e-9):.1f}x smaller)")
+    for col in lean.columns:
+        print(f"  - {col:<18} {str(raw[col].dtype):<10} → {lean[col].dtype}")
+
+if __name__ == "__main__":
+    main()
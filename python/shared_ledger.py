@@ -0,0 +1,269 @@
+# python/shared_ledger.py
+"""
+Memory-mapped, department-sorted copy of the ledger for multi-process workers.
+
+Built once from financials into data/.shared_ledger/<build id>/, with
+data/.shared_ledger/current naming the build to attach to:
+
+  meta.json     columns, dimension categories, month range, source file stamp
+  offsets.npy   row offsets per department (department i = rows offsets[i]:offsets[i+1])
+  <col>.npy     one array per column: Month as int32 codes (schema.py),
+                dimensions as int32 category codes, measures as float64
+
+Rows are sorted by (Department, Month), so a department is one contiguous
+slice. Any process attaches with np.load(mmap_mode="r"): pages are shared
+through the OS page cache and nothing is copied or pickled. Worker tasks carry
+a SliceRef (store path, build id, department) instead of data and build their
+own series from that slice.
+
+The store is rebuilt when the ledger file's size or mtime changes. A build
+directory is never modified: a rebuild writes a new one and then moves the
+current pointer. A handle maps every column of its build when it is opened,
+so processes still attached keep reading the old build (the mappings outlive
+its files once older builds are pruned).
+
+    python python/shared_ledger.py build [--force]
+    python python/shared_ledger.py info
+"""
+import argparse
+import json
+import os
+import shutil
+import uuid
+from collections import namedtuple
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import schema
+import storage
+from instrument import span
+
+DATA_DIR = Path(__file__).resolve().parents[1] / "data"
+STORE_DIR = DATA_DIR / ".shared_ledger"
+SOURCE = "financials"
+STORE_VERSION = 1
+KEY = "Department"
+
+SliceRef = namedtuple("SliceRef", ["path", "build", "department", "measure"])
+
+# ---------- Build ----------
+def _source_stamp(path: Path) -> dict:
+    st = path.stat()
+    return {"file": path.name, "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+def current_build(out_dir: Path = STORE_DIR):
+    """Directory of the build the store currently points at, or None."""
+    pointer = Path(out_dir) / "current"
+    if not pointer.exists():
+        return None
+    path = Path(out_dir) / pointer.read_text(encoding="utf-8").strip()
+    return path if (path / "meta.json").exists() else None
+
+def build(source: str = SOURCE, data_dir: Path = DATA_DIR, out_dir: Path = STORE_DIR) -> Path:
+    """Write the memory-mappable store for a ledger table. Returns the new build's directory."""
+    out_dir = Path(out_dir)
+    src = storage.resolve(source, data_dir=data_dir)
+    stamp = _source_stamp(src)
+    df = schema.load_ledger(source, measure_dtype="float64", data_dir=data_dir)
+    if KEY not in df.columns:
+        raise ValueError(f"{src} has no {KEY} column")
+
+    with span("shared_ledger.build", rows=len(df)):
+        dept = df[KEY].cat.codes.to_numpy()
+        order = np.lexsort((df["Month"].to_numpy(), dept))
+        build_id = uuid.uuid4().hex
+        tmp = out_dir / f"{build_id}.tmp"
+        tmp.mkdir(parents=True)
+        categories, measures = {}, []
+        for col in df.columns:
+            values = df[col]
+            if col == schema.MONTH:
+                arr = values.to_numpy()[order]
+            elif isinstance(values.dtype, pd.CategoricalDtype):
+                arr = values.cat.codes.to_numpy().astype(np.int32)[order]
+                categories[col] = [str(c) for c in values.cat.categories]
+            else:
+                arr = values.to_numpy(dtype=np.float64)[order]
+                measures.append(col)
+            np.save(tmp / f"{col}.npy", arr)
+        counts = np.bincount(dept, minlength=len(categories[KEY]))
+        np.save(tmp / "offsets.npy", np.concatenate([[0], np.cumsum(counts)]).astype(np.int64))
+        month = df["Month"].to_numpy()
+        meta = {
+            "version": STORE_VERSION,
+            "build": build_id,
+            "source": stamp,
+            "rows": len(df),
+            "columns": list(df.columns),
+            "measures": measures,
+            "categories": categories,
+            "m0": int(month.min()) if len(df) else 0,
+            "n_months": int(month.max() - month.min() + 1) if len(df) else 0,
+        }
+        (tmp / "meta.json").write_text(json.dumps(meta), encoding="utf-8")
+
+    # Publish: the build directory first, then the pointer
+    previous = current_build(out_dir)
+    os.replace(tmp, out_dir / build_id)
+    pointer = out_dir / f"current.{build_id}.tmp"
+    pointer.write_text(build_id, encoding="utf-8")
+    os.replace(pointer, out_dir / "current")
+
+    # Keep the build just replaced for processes opening it right now; drop older
+    # builds (and files of the single-directory layout) but not other writers' .tmp
+    keep = {"current", build_id, previous.name if previous else None}
+    for old in out_dir.iterdir():
+        if old.name in keep or old.name.endswith(".tmp"):
+            continue
+        if old.is_dir():
+            shutil.rmtree(old, ignore_errors=True)
+        else:
+            old.unlink(missing_ok=True)
+    return out_dir / build_id
+
+def is_current(source: str = SOURCE, data_dir: Path = DATA_DIR, out_dir: Path = STORE_DIR) -> bool:
+    path = current_build(out_dir)
+    if path is None:
+        return False
+    meta = json.loads((path / "meta.json").read_text(encoding="utf-8"))
+    src = storage.resolve(source, data_dir=data_dir)
+    return meta.get("version") == STORE_VERSION and src.exists() and meta.get("source") == _source_stamp(src)
+
+def ensure(source: str = SOURCE, data_dir: Path = DATA_DIR, out_dir: Path = STORE_DIR) -> "SharedLedger":
+    """Attach to the store, (re)building it first when missing or older than the ledger."""
+    if not is_current(source, data_dir, out_dir):
+        build(source, data_dir, out_dir)
+    return attach(out_dir, reload=True)
+
+# ---------- Attach ----------
+class SharedLedger:
+    """
+    Read-only view of one build of a store (the current one when opened).
+    Every column is memory-mapped up front (no data is read until used), so the
+    handle stays on its build whatever later rebuilds do.
+    """
+
+    def __init__(self, path: Path = STORE_DIR):
+        self.path = Path(path)
+        build_dir = current_build(self.path)
+        if build_dir is None:
+            raise FileNotFoundError(f"No shared ledger build in {self.path}; run shared_ledger.py build")
+        self.meta = json.loads((build_dir / "meta.json").read_text(encoding="utf-8"))
+        self.build = self.meta["build"]
+        self.departments = self.meta["categories"][KEY]
+        self._pos = {d: i for i, d in enumerate(self.departments)}
+        self.offsets = np.load(build_dir / "offsets.npy")
+        self.m0, self.n_months = self.meta["m0"], self.meta["n_months"]
+        self._columns = {c: np.load(build_dir / f"{c}.npy", mmap_mode="r") for c in self.meta["columns"]}
+
+    def column(self, name: str) -> np.ndarray:
+        return self._columns[name]
+
+    def rows(self, dept) -> slice:
+        i = self._pos[str(dept)]
+        return slice(int(self.offsets[i]), int(self.offsets[i + 1]))
+
+    def slice(self, dept, columns=None) -> dict:
+        """{column: memory-mapped view} of one department's rows (no copy)."""
+        sl = self.rows(dept)
+        return {c: self.column(c)[sl] for c in (columns or self.meta["columns"])}
+
+    def month_index(self) -> pd.DatetimeIndex:
+        start = schema.month_start([self.m0])[0]
+        return pd.date_range(start, periods=self.n_months, freq="MS")
+
+    def series(self, dept, measure: str = "Revenue") -> pd.Series:
+        """
+        Monthly totals of one department on the ledger's full month range, NaN
+        where it has no rows (the same grid as forecast.ledger_series).
+        """
+        s = self.slice(dept, [schema.MONTH, measure])
+        month = s[schema.MONTH] - self.m0
+        values = np.asarray(s[measure])
+        ok = ~np.isnan(values)
+        total = np.bincount(month[ok], weights=values[ok], minlength=self.n_months)
+        count = np.bincount(month[ok], minlength=self.n_months)
+        return pd.Series(np.where(count > 0, total, np.nan), index=self.month_index(), name=str(dept))
+
+    def wide(self, depts=None, measure: str = "Revenue") -> pd.DataFrame:
+        """Months x departments grid of monthly totals."""
+        depts = self.departments if depts is None else [str(d) for d in depts]
+        cols = {d: self.series(d, measure).to_numpy() for d in depts}
+        return pd.DataFrame(cols, index=self.month_index(), columns=pd.Index(depts, name=KEY), dtype=float)
+
+    def monthly(self, measures=("Revenue", "Forecast_Revenue")) -> pd.DataFrame:
+        """Month, Department and measure totals for every (month, department) with rows."""
+        month = self.column(schema.MONTH)
+        dept = self.column(KEY)
+        cell = (month - self.m0).astype(np.int64) + dept.astype(np.int64) * self.n_months
+        size = len(self.departments) * self.n_months
+        count = np.bincount(cell, minlength=size)
+        keep = np.flatnonzero(count)
+        out = {
+            "Month": schema.month_labels(self.m0 + keep % self.n_months),
+            KEY: np.asarray(self.departments, dtype=object)[keep // self.n_months],
+        }
+        for m in measures:
+            out[m] = np.bincount(cell, weights=np.nan_to_num(self.column(m)), minlength=size)[keep]
+        return pd.DataFrame(out)
+
+    def spans(self) -> np.ndarray:
+        """Months from each department's first to last row (0 when it has none); see forecast.series_spans."""
+        month = self.column(schema.MONTH)
+        lo, hi = self.offsets[:-1], self.offsets[1:]
+        has = hi > lo
+        out = np.zeros(len(lo), dtype=np.int64)
+        out[has] = month[hi[has] - 1].astype(np.int64) - month[lo[has]] + 1
+        return out
+
+    def ref(self, dept, measure: str = "Revenue") -> SliceRef:
+        return SliceRef(str(self.path), self.build, str(dept), measure)
+
+_attached = {}  # per process: store path -> SharedLedger
+
+def attach(path: Path = STORE_DIR, reload: bool = False) -> SharedLedger:
+    """This process's attachment to a store (opened once, reused by later tasks)."""
+    key = str(path)
+    if reload or key not in _attached:
+        _attached[key] = SharedLedger(path)
+    return _attached[key]
+
+def resolve(series):
+    """A SliceRef's series, read from this process's attachment; anything else is returned as is."""
+    if not isinstance(series, SliceRef):
+        return series
+    store = attach(series.path)
+    if store.build != series.build:
+        store = attach(series.path, reload=True)
+        if store.build != series.build:
+            raise RuntimeError(f"Shared ledger {series.path} was rebuilt while a task referenced it")
+    return store.series(series.department, series.measure)
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Build or inspect the memory-mapped shared ledger")
+    sub = p.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build", help="build the store from financials (skipped when current)")
+    b.add_argument("--force", action="store_true", help="rebuild even when the store is current")
+    sub.add_parser("info", help="departments, rows and columns of the store")
+    return p.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.cmd == "build":
+        if args.force or not is_current():
+            print(f"✅ Shared ledger built → {build()}")
+        else:
+            print(f"♻️ Shared ledger is current: {STORE_DIR}")
+        return
+    store = attach()
+    sizes = np.diff(store.offsets)
+    print(f"🗂️ {STORE_DIR} (build {store.build[:8]}): {store.meta['rows']:,} rows, {len(store.departments)} department(s), "
+          f"{store.n_months} month(s), built from {store.meta['source']['file']}")
+    print(f"  columns: {', '.join(store.meta['columns'])}")
+    print(f"  rows per department: min {sizes.min():,}, max {sizes.max():,}")
+    print(f"  current: {'yes' if is_current() else 'no (ledger changed since the build)'}")
+
+if __name__ == "__main__":
+    main()
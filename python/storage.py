@@ -0,0 +1,220 @@
+# python/storage.py
+"""
+Pluggable table storage shared by every pipeline stage.
+
+Tables are addressed by logical name ("financials", "variance_summary", ...) and
+stored under data/ as <name>.<ext>. The backend is chosen with FPNA_STORAGE:
+
+  csv      (default) plain CSV, untyped, same files as always
+  parquet  columnar, typed (needs pyarrow)
+  feather  Arrow IPC, typed (needs pyarrow)
+
+Columnar backends store typed columns: categorical Department, period[M] Month
+and float64 measures. With FPNA_EXPORT_CSV=1 a CSV copy is written next to each
+columnar table for Power BI/Tableau.
+"""
+import os
+from pathlib import Path
+
+import pandas as pd
+
+from instrument import span
+
+DATA_DIR = Path(__file__).resolve().parents[1] / "data"
+
+FORMATS = {"csv": ".csv", "parquet": ".parquet", "feather": ".feather"}
+DEFAULT_FORMAT = os.getenv("FPNA_STORAGE", "csv").lower()
+EXPORT_CSV = os.getenv("FPNA_EXPORT_CSV", "") == "1"
+
+CATEGORICAL = {"Department", "Entity", "Account", "Product", "Region", "Cost_Center"}
+PERIOD = {"Month"}
+
+def _fmt(fmt=None) -> str:
+    fmt = (fmt or DEFAULT_FORMAT).lower()
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown storage format {fmt!r}; expected one of {sorted(FORMATS)}")
+    return fmt
+
+def _require_pyarrow(fmt):
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError as e:
+        raise ImportError(f"FPNA_STORAGE={fmt} needs pyarrow (pip install pyarrow)") from e
+
+def table_path(name: str, fmt=None, data_dir: Path = DATA_DIR) -> Path:
+    return Path(data_dir) / f"{name}{FORMATS[_fmt(fmt)]}"
+
+def resolve(name: str, fmt=None, data_dir: Path = DATA_DIR) -> Path:
+    """Path to read `name` from: the configured format if present, else the CSV copy."""
+    path = table_path(name, fmt, data_dir)
+    if not path.exists():
+        csv = table_path(name, "csv", data_dir)
+        if csv.exists():
+            return csv
+    return path
+
+def table_exists(name: str, fmt=None, data_dir: Path = DATA_DIR) -> bool:
+    return resolve(name, fmt, data_dir).exists()
+
+def table_columns(name: str, fmt=None, data_dir: Path = DATA_DIR) -> list:
+    """Column names of a table, read from its header/schema only."""
+    path = resolve(name, fmt, data_dir)
+    if not path.exists():
+        raise FileNotFoundError(f"Missing {path}")
+    if path.suffix == ".csv":
+        return list(pd.read_csv(path, nrows=0).columns)
+    _require_pyarrow(path.suffix[1:])
+    if path.suffix == ".parquet":
+        import pyarrow.parquet as pq
+        return list(pq.read_schema(path).names)
+    import pyarrow.ipc as ipc
+    with ipc.open_file(path) as reader:
+        return list(reader.schema.names)
+
+def apply_schema(df: pd.DataFrame) -> pd.DataFrame:
+    """Typed columns for columnar storage: categorical dims, period[M] Month, float64 measures."""
+    out = {}
+    for col in df.columns:
+        s = df[col]
+        if col in PERIOD and not isinstance(s.dtype, pd.PeriodDtype):
+            s = pd.PeriodIndex(s.astype(str).str[:7], freq="M").to_series(index=df.index)
+        elif col in CATEGORICAL:
+            s = s.astype("category")
+        elif pd.api.types.is_numeric_dtype(s) and not pd.api.types.is_bool_dtype(s):
+            s = s.astype("float64")
+        out[col] = s
+    return pd.DataFrame(out, index=df.index)
+
+def read_table(name: str, columns=None, fmt=None, data_dir: Path = DATA_DIR, dtype=None) -> pd.DataFrame:
+    """
+    Load a table, reading only `columns` when given.
+    dtype: {column: dtype} parse hints for CSV (columnar tables are already typed).
+    """
+    path = resolve(name, fmt, data_dir)
+    if not path.exists():
+        raise FileNotFoundError(f"Missing {path}")
+    columns = list(columns) if columns is not None else None
+    with span("storage.read", table=name, format=path.suffix[1:]) as sp:
+        if path.suffix == ".csv":
+            df = pd.read_csv(path, usecols=columns, dtype=dtype)
+            df = df[columns] if columns else df
+        else:
+            _require_pyarrow(path.suffix[1:])
+            if path.suffix == ".parquet":
+                df = pd.read_parquet(path, columns=columns)
+            else:
+                df = pd.read_feather(path, columns=columns)
+        sp["rows"] = len(df)
+    return df
+
+def write_table(frame: pd.DataFrame, name: str, fmt=None, data_dir: Path = DATA_DIR, export_csv=None) -> Path:
+    """Write a table in the configured format (plus an optional CSV export). Returns its path."""
+    fmt = _fmt(fmt)
+    path = table_path(name, fmt, data_dir)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with span("storage.write", table=name, format=fmt, rows=len(frame)):
+        if fmt == "csv":
+            frame.to_csv(path, index=False)
+            return path
+
+        _require_pyarrow(fmt)
+        typed = apply_schema(frame.reset_index(drop=True))
+        if fmt == "parquet":
+            typed.to_parquet(path, index=False)
+        else:
+            typed.to_feather(path)
+        if EXPORT_CSV if export_csv is None else export_csv:
+            frame.to_csv(table_path(name, "csv", data_dir), index=False)
+    return path
+
+def _traced_chunks(name: str, chunks):
+    """Re-yield chunks, timing each read (not the caller's work between reads)."""
+    chunks = iter(chunks)
+    while True:
+        with span("storage.read_chunk", table=name) as sp:
+            chunk = next(chunks, None)
+            sp["rows"] = 0 if chunk is None else len(chunk)
+        if chunk is None:
+            return
+        yield chunk
+
+def iter_table(name: str, columns=None, chunksize: int = 500_000, fmt=None, data_dir: Path = DATA_DIR):
+    """Yield a table in chunks of about `chunksize` rows so large ledgers never sit in memory whole."""
+    path = resolve(name, fmt, data_dir)
+    if not path.exists():
+        raise FileNotFoundError(f"Missing {path}")
+    columns = list(columns) if columns is not None else None
+    yield from _traced_chunks(name, _read_chunks(path, columns, chunksize))
+
+def _read_chunks(path: Path, columns, chunksize: int):
+    if path.suffix == ".csv":
+        for chunk in pd.read_csv(path, usecols=columns, chunksize=chunksize):
+            yield chunk[columns] if columns else chunk
+        return
+
+    _require_pyarrow(path.suffix[1:])
+    import pyarrow.parquet as pq
+    import pyarrow.ipc as ipc
+    if path.suffix == ".parquet":
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas()
+        return
+    with ipc.open_file(path) as reader:
+        for i in range(reader.num_record_batches):
+            batch = reader.get_batch(i)
+            yield (batch.select(columns) if columns else batch).to_pandas()
+
+class TableWriter:
+    """
+    Append frames to one table piece by piece (used by streaming stages).
+
+        with TableWriter("department_variance") as w:
+            for part in parts:
+                w.write(part)
+    """
+
+    def __init__(self, name: str, fmt=None, data_dir: Path = DATA_DIR, export_csv=None):
+        self.fmt = _fmt(fmt)
+        self.path = table_path(name, self.fmt, data_dir)
+        self.csv_path = table_path(name, "csv", data_dir)
+        self.export_csv = (EXPORT_CSV if export_csv is None else export_csv) and self.fmt != "csv"
+        self._writer = None
+        self._schema = None
+        self._first = True
+
+    def __enter__(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if self.fmt != "csv":
+            _require_pyarrow(self.fmt)
+        return self
+
+    def write(self, frame: pd.DataFrame):
+        if self.fmt == "csv" or self.export_csv:
+            frame.to_csv(self.csv_path, mode="w" if self._first else "a", header=self._first, index=False)
+        if self.fmt != "csv":
+            self._write_arrow(frame)
+        self._first = False
+
+    def _write_arrow(self, frame: pd.DataFrame):
+        import pyarrow as pa
+        table = pa.Table.from_pandas(apply_schema(frame.reset_index(drop=True)), preserve_index=False)
+        if self._writer is None:
+            # Fix dictionary index width up front so later pieces with more categories still fit
+            fields = [
+                pa.field(f.name, pa.dictionary(pa.int32(), f.type.value_type)) if pa.types.is_dictionary(f.type) else f
+                for f in table.schema
+            ]
+            self._schema = pa.schema(fields, metadata=table.schema.metadata)
+            if self.fmt == "parquet":
+                import pyarrow.parquet as pq
+                self._writer = pq.ParquetWriter(self.path, self._schema)
+            else:
+                self._writer = pa.ipc.new_file(str(self.path), self._schema)
+        self._writer.write_table(table.cast(self._schema))
+
+    def __exit__(self, *exc):
+        if self._writer is not None:
+            self._writer.close()
+        elif self._first and self.fmt == "csv":
+            self.path.write_text("", encoding="utf-8")
+        return False
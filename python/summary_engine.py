@@ -0,0 +1,269 @@
+# python/summary_engine.py
+"""
+Async LLM narrative engine used by ai_summary.py.
+
+Every prompt goes through one SummaryEngine:
+  - at most `concurrency` requests are in flight (asyncio.Semaphore)
+  - each attempt is bounded by `timeout` seconds; timeouts, connection errors, 429 and
+    5xx retry with exponential backoff, any other error (400, 401, ...) is raised at once
+  - responses are cached on disk under data/.llm_cache, keyed on sha256(model + temperature + prompt),
+    so prompts built from unchanged KPIs are answered without a request
+
+Provider is picked from the same env vars as before (Azure first, then OpenAI).
+OPENAI_BASE_URL points the OpenAI client at any compatible server, e.g. a local fake.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import random
+import sys
+from pathlib import Path
+
+import pandas as pd
+
+from instrument import span
+
+DATA_DIR = Path(__file__).resolve().parents[1] / "data"
+CACHE_DIR = DATA_DIR / ".llm_cache"
+
+DEFAULT_MODEL = "gpt-4o-mini"
+TEMPERATURE = 0.2
+
+# ---------- Response cache ----------
+def prompt_key(model: str, prompt: str) -> str:
+    return hashlib.sha256(f"{model}\n{TEMPERATURE}\n{prompt}".encode("utf-8")).hexdigest()
+
+class ResponseCache:
+    """One JSON file per response, named by prompt_key() (sha256 of model, temperature and prompt). Safe to share between runs."""
+
+    def __init__(self, path: Path = CACHE_DIR):
+        self.path = Path(path)
+        self.hits = 0
+        self.misses = 0
+
+    def _file(self, key: str) -> Path:
+        return self.path / key[:2] / f"{key}.json"
+
+    def get(self, model: str, prompt: str):
+        f = self._file(prompt_key(model, prompt))
+        try:
+            text = json.loads(f.read_text(encoding="utf-8"))["text"]
+        except (OSError, ValueError, KeyError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return text
+
+    def put(self, model: str, prompt: str, text: str):
+        f = self._file(prompt_key(model, prompt))
+        f.parent.mkdir(parents=True, exist_ok=True)
+        tmp = f.with_suffix(".tmp")
+        tmp.write_text(json.dumps({"model": model, "text": text}), encoding="utf-8")
+        os.replace(tmp, f)
+
+    def clear(self) -> int:
+        n = 0
+        for f in self.path.glob("*/*.json"):
+            f.unlink()
+            n += 1
+        return n
+
+# ---------- Provider ----------
+_env_loaded = False
+
+def load_env():
+    """Load the repo's .env once, if python-dotenv is installed (imported only when a client is built)."""
+    global _env_loaded
+    if _env_loaded:
+        return
+    _env_loaded = True
+    try:
+        from dotenv import load_dotenv
+        load_dotenv(dotenv_path=Path(__file__).resolve().parents[1] / ".env")
+    except Exception:
+        pass
+
+def make_client():
+    """
+    Async chat client from env vars (and .env), or Nones when no key is
+    configured or the openai package is missing.
+    Returns (client, model, provider name)
+    """
+    load_env()
+    azure_key = os.getenv("AZURE_OPENAI_KEY")
+    azure_endpoint = os.getenv("AZURE_OPENAI_ENDPOINT")
+    azure_deployment = os.getenv("AZURE_OPENAI_DEPLOYMENT")
+    azure_api_version = os.getenv("AZURE_OPENAI_API_VERSION", "2024-07-18")
+    openai_key = os.getenv("OPENAI_API_KEY")
+    if not ((azure_key and azure_endpoint and azure_deployment) or openai_key):
+        return None, None, None
+    try:
+        import openai
+    except ImportError:
+        return None, None, None
+    # Retries are handled by SummaryEngine so backoff/timeouts are applied in one place
+    if azure_key and azure_endpoint and azure_deployment:
+        client = openai.AsyncAzureOpenAI(api_key=azure_key, azure_endpoint=azure_endpoint,
+                                         api_version=azure_api_version, max_retries=0)
+        return client, azure_deployment, "azure"
+    client = openai.AsyncOpenAI(api_key=openai_key, max_retries=0)  # honours OPENAI_BASE_URL
+    return client, os.getenv("OPENAI_MODEL", DEFAULT_MODEL), "openai"
+
+# ---------- Engine ----------
+def retryable(exc: BaseException) -> bool:
+    """Timeouts, connection errors, 429 and 5xx are worth another attempt; anything else is not."""
+    if isinstance(exc, (asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True
+    status = getattr(exc, "status_code", None)
+    if status is not None:
+        return status == 429 or status >= 500
+    openai = sys.modules.get("openai")  # only loaded when make_client() built an openai client
+    return openai is not None and isinstance(exc, openai.APIConnectionError)
+
+class SummaryEngine:
+    def __init__(self, client=None, model=None, concurrency: int = 8, timeout: float = 30.0,
+                 retries: int = 3, backoff: float = 1.0, cache: ResponseCache = None, provider=None):
+        if client is None and model is None:
+            client, model, provider = make_client()
+        self.client = client
+        self.model = model or DEFAULT_MODEL
+        self.provider = provider or ("custom" if client is not None else "fallback")
+        self.concurrency = max(1, concurrency)
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.cache = cache
+        self.requests = 0
+        self.failures = 0
+
+    @property
+    def available(self) -> bool:
+        return self.client is not None
+
+    async def _request(self, prompt: str) -> str:
+        # Wall time here is request latency; concurrent requests overlap on one thread
+        with span("llm.request", model=self.model, prompt_chars=len(prompt)) as sp:
+            resp = await self.client.chat.completions.create(
+                model=self.model,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=TEMPERATURE,
+            )
+            usage = getattr(resp, "usage", None)
+            if usage is not None:
+                sp["tokens"] = getattr(usage, "total_tokens", None)
+        return resp.choices[0].message.content.strip()
+
+    async def complete(self, prompt: str, sem: asyncio.Semaphore = None) -> str:
+        """Cached completion with per-attempt timeout and jittered exponential backoff on retryable errors."""
+        if self.cache is not None:
+            text = self.cache.get(self.model, prompt)
+            if text is not None:
+                return text
+        if not self.available:
+            raise RuntimeError("no LLM provider configured")
+
+        sem = sem or asyncio.Semaphore(1)
+        for attempt in range(self.retries + 1):
+            try:
+                async with sem:
+                    self.requests += 1
+                    text = await asyncio.wait_for(self._request(prompt), self.timeout)
+                break
+            except Exception as e:
+                if attempt == self.retries or not retryable(e):
+                    self.failures += 1
+                    raise
+                await asyncio.sleep(self.backoff * (2 ** attempt) * (0.5 + random.random()))
+        if self.cache is not None:
+            self.cache.put(self.model, prompt, text)
+        return text
+
+    async def complete_many(self, prompts: dict) -> dict:
+        """
+        Run {key: prompt} concurrently (bounded by self.concurrency).
+        Returns {key: text or the exception raised for that prompt}
+        """
+        sem = asyncio.Semaphore(self.concurrency)
+        keys = list(prompts)
+        results = await asyncio.gather(*(self.complete(prompts[k], sem) for k in keys),
+                                       return_exceptions=True)
+        return dict(zip(keys, results))
+
+    def run(self, prompts: dict) -> dict:
+        """Blocking wrapper around complete_many() for sync callers."""
+        return asyncio.run(self.complete_many(prompts))
+
+    def stats(self) -> str:
+        cache = f", cache {self.cache.hits} hit/{self.cache.misses} miss" if self.cache is not None else ""
+        return f"{self.requests} request(s), {self.failures} failed{cache}"
+
+# ---------- Prompts ----------
+def department_prompt(month, dept, row) -> str:
+    pct = row["Variance_Pct"]
+    pct = "n/a" if pd.isna(pct) else f"{pct:.2f}%"
+    margin = row["Gross_Margin_Pct"]  # NaN when the department had no revenue
+    margin = "n/a" if pd.isna(margin) else f"{margin:.2f}"
+    return f"""
+You are an FP&A analyst. In 2–3 sentences, explain {dept}'s performance for {month}.
+- Revenue: {row['Revenue']:.2f}
+- Budget: {row['Forecast_Revenue']:.2f}
+- Variance: {row['Variance_vs_Forecast']:.2f} ({pct})
+- Gross Margin %: {margin}
+Be specific and neutral. Return plain markdown, no title.
+""".strip()
+
+def month_prompt(row) -> str:
+    yoy = row.get("YoY_Actual_Revenue")
+    yoy = "n/a" if pd.isna(yoy) else f"{yoy:.2f}%"
+    return f"""
+You are an FP&A analyst. In 2–3 sentences, summarize company performance for {row['Month']}.
+- Revenue: {row['Actual_Revenue']:.2f}
+- Budget: {row['Budget_Forecast']:.2f}
+- Gross Profit: {row['Gross_Profit']:.2f}
+- YoY revenue growth: {yoy}
+Be specific and neutral. Return plain markdown, no title.
+""".strip()
+
+def narrative_prompts(dept_var: pd.DataFrame, trend: pd.DataFrame, months=None) -> dict:
+    """
+    {(scope, Month, Department): prompt} for every department-month and every month.
+    Department rows are summed per month first so multi-entity ledgers get one narrative each.
+    `months` restricts both to the given months (as YYYY-MM strings).
+    """
+    dv = dept_var.assign(Month=dept_var["Month"].astype(str))
+    tr = trend.assign(Month=trend["Month"].astype(str))
+    if months is not None:
+        months = {str(m) for m in months}
+        dv = dv[dv["Month"].isin(months)]
+        tr = tr[tr["Month"].isin(months)]
+
+    agg = dv.groupby(["Month", "Department"], observed=True, sort=True).agg(
+        Revenue=("Revenue", "sum"),
+        Forecast_Revenue=("Forecast_Revenue", "sum"),
+        Variance_vs_Forecast=("Variance_vs_Forecast", "sum"),
+        Gross_Margin_Pct=("Gross_Margin_Pct", "mean"),
+    ).reset_index()
+    # No budget -> no variance %; the prompt says "n/a" rather than inf or 0
+    agg["Variance_Pct"] = (agg["Variance_vs_Forecast"] / agg["Forecast_Revenue"] * 100).where(agg["Forecast_Revenue"] != 0)
+
+    prompts = {}
+    for r in agg.to_dict("records"):
+        prompts[("department", r["Month"], str(r["Department"]))] = department_prompt(r["Month"], r["Department"], r)
+    for r in tr.to_dict("records"):
+        prompts[("month", r["Month"], "")] = month_prompt(r)
+    return prompts
+
+def narratives_frame(results: dict) -> pd.DataFrame:
+    """Scope, Month, Department, Narrative, Error rows from SummaryEngine.run() output."""
+    rows = []
+    for (scope, month, dept), out in results.items():
+        err = isinstance(out, BaseException)
+        rows.append({
+            "Scope": scope,
+            "Month": month,
+            "Department": dept,
+            "Narrative": "" if err else out,
+            "Error": f"{type(out).__name__}: {out}" if err else "",
+        })
+    return pd.DataFrame(rows, columns=["Scope", "Month", "Department", "Narrative", "Error"])
@@ -1,123 +1,508 @@
 # python/variance_analysis.py
+import argparse
+import hashlib
+import io
+import json
+import tempfile
+import numpy as np
 import pandas as pd
 from pathlib import Path
 
+import schema
+import storage
+from instrument import span
+
 # ---------- Paths ----------
 DATA_DIR = Path(__file__).resolve().parents[1] / "data"
-INPUT = DATA_DIR / "financials.csv"
+STATE_DIR = DATA_DIR / ".variance_state"   # incremental mode: partition aggregates + input fingerprint
+
+EXPECTED = ["Month", "Department", "Revenue", "Expense", "Forecast_Revenue"]
+STATE_VERSION = 2  # 2: partition hashes taken over int32 month codes
 
 # ---------- Load ----------
-df = pd.read_csv(INPUT)
+def validate(df: pd.DataFrame) -> pd.DataFrame:
+    missing = set(EXPECTED) - set(df.columns)
+    if missing:
+        raise ValueError(f"Missing columns in financials.csv: {missing}")
+    return df
 
-# Validate schema
-expected = {"Month", "Department", "Revenue", "Expense", "Forecast_Revenue"}
-missing = expected - set(df.columns)
-if missing:
-    raise ValueError(f"Missing columns in financials.csv: {missing}")
+def load_financials(data_dir: Path = DATA_DIR) -> pd.DataFrame:
+    """Read only the ledger columns this stage uses, in the compact schema layout."""
+    if not set(EXPECTED) <= set(storage.table_columns("financials", data_dir=data_dir)):
+        validate(storage.read_table("financials", data_dir=data_dir))
+    return schema.load_ledger("financials", columns=EXPECTED, data_dir=data_dir)
 
 # ---------- Derivations ----------
-df["Gross_Profit"] = df["Revenue"] - df["Expense"]
-df["Gross_Margin_Pct"] = (
-    (df["Gross_Profit"] / df["Revenue"]).where(df["Revenue"] != 0)
-).round(4) * 100
+def _pct(num: np.ndarray, den: np.ndarray) -> np.ndarray:
+    """round(num / den, 4) * 100, NaN where den == 0, computed in one buffer."""
+    out = np.full(len(num), np.nan, dtype=np.result_type(num, den, np.float32))
+    np.divide(num, den, out=out, where=den != 0)
+    np.round(out, 4, out=out)
+    out *= 100
+    return out
 
-df["Variance_vs_Forecast"] = df["Revenue"] - df["Forecast_Revenue"]
-df["Variance_Pct"] = (
-    (df["Variance_vs_Forecast"] / df["Forecast_Revenue"]).where(df["Forecast_Revenue"] != 0)
-).round(4) * 100
+def add_derived(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    New frame with Gross_Profit, margin and variance columns, and Month as
+    int32 codes (schema.month_codes). Input columns are shared, not copied.
+    """
+    df = df if schema.is_compact(df) else schema.compact(df)
+    rev = df["Revenue"].to_numpy()
+    fc = df["Forecast_Revenue"].to_numpy()
+    gp = np.subtract(rev, df["Expense"].to_numpy())
+    var = np.subtract(rev, fc)
+    cols = {c: df[c] for c in df.columns}
+    cols.update({
+        "Gross_Profit": gp,
+        "Gross_Margin_Pct": _pct(gp, rev),
+        "Variance_vs_Forecast": var,
+        "Variance_Pct": _pct(var, fc),
+    })
+    return pd.DataFrame(cols, index=df.index, copy=False)
 
-# Normalize Month to YYYY-MM and add sortable key
-df["Month"] = df["Month"].astype(str).str[:7]
-df["MonthKey"] = pd.to_datetime(df["Month"] + "-01")
+def _labelled(df: pd.DataFrame) -> pd.DataFrame:
+    """Month codes back to YYYY-MM labels for output (categorical: one string per month)."""
+    return df.assign(Month=schema.month_categorical(df["Month"]))
 
 # ---------- 1) Department rollup ----------
-summary = (
-    df.groupby("Department", as_index=False)
-    .agg(
-        Actual_Total=("Revenue", "sum"),
-        Budget_Total=("Forecast_Revenue", "sum"),
-        Variance_Total=("Variance_vs_Forecast", "sum"),
-        Avg_Gross_Margin_Pct=("Gross_Margin_Pct", "mean"),
+def department_rollup(df: pd.DataFrame) -> pd.DataFrame:
+    summary = (
+        df.groupby("Department", as_index=False, observed=True)
+        .agg(
+            Actual_Total=("Revenue", "sum"),
+            Budget_Total=("Forecast_Revenue", "sum"),
+            Variance_Total=("Variance_vs_Forecast", "sum"),
+            Avg_Gross_Margin_Pct=("Gross_Margin_Pct", "mean"),
+        )
+        .sort_values("Actual_Total", ascending=False)
     )
-    .sort_values("Actual_Total", ascending=False)
-)
-summary["Variance_Pct"] = (
-    (summary["Variance_Total"] / summary["Budget_Total"]).where(summary["Budget_Total"] != 0)
-).round(4) * 100
+    summary["Variance_Pct"] = (
+        (summary["Variance_Total"] / summary["Budget_Total"]).where(summary["Budget_Total"] != 0)
+    ).round(4) * 100
+    return summary
 
 # ---------- 2) Monthly trend ----------
-trend = (
-    df.groupby(["Month", "MonthKey"], as_index=False)
-    .agg(
-        Actual_Revenue=("Revenue", "sum"),
-        Budget_Forecast=("Forecast_Revenue", "sum"),
-        Gross_Profit=("Gross_Profit", "sum"),
+def monthly_trend(df: pd.DataFrame) -> pd.DataFrame:
+    trend = (
+        df.groupby("Month", as_index=False, sort=True)  # int32 codes sort chronologically
+        .agg(
+            Actual_Revenue=("Revenue", "sum"),
+            Budget_Forecast=("Forecast_Revenue", "sum"),
+            Gross_Profit=("Gross_Profit", "sum"),
+        )
     )
-    .sort_values("MonthKey")
-)
 
-# Optional YoY growth (valid after 12 months)
-trend["YoY_Actual_Revenue"] = (
-    trend.set_index("MonthKey")["Actual_Revenue"].pct_change(12).reset_index(drop=True) * 100
-).round(2)
+    # Optional YoY growth (valid after 12 months)
+    trend["YoY_Actual_Revenue"] = (trend["Actual_Revenue"].pct_change(12) * 100).round(2)
+    return _labelled(trend)
 
 # ---------- 3) Department variance by month ----------
-dept_var = df[
-    [
-        "Month",
-        "MonthKey",
-        "Department",
-        "Revenue",
-        "Forecast_Revenue",
-        "Variance_vs_Forecast",
-        "Variance_Pct",
-        "Gross_Margin_Pct",
-    ]
-].sort_values(["MonthKey", "Department"])
+DEPT_VAR_COLS = [
+    "Month",
+    "Department",
+    "Revenue",
+    "Forecast_Revenue",
+    "Variance_vs_Forecast",
+    "Variance_Pct",
+    "Gross_Margin_Pct",
+]
+
+def department_variance(df: pd.DataFrame, decimals=None) -> pd.DataFrame:
+    """Row-level variance columns in (Month, Department) order, optionally rounded."""
+    # One stable argsort over the integer keys, then each column gathered (and
+    # rounded) on its own. Department categories are sorted, so code order is name order.
+    order = np.lexsort((df["Department"].cat.codes.to_numpy(), df["Month"].to_numpy()))
+    dept = df["Department"].cat
+    cols = {"Department": pd.Categorical.from_codes(dept.codes.to_numpy()[order], categories=dept.categories)}
+    for col in DEPT_VAR_COLS:
+        if col == "Department":
+            continue
+        values = df[col].to_numpy()[order]
+        if decimals is not None and values.dtype.kind == "f":
+            np.round(values, decimals, out=values)
+        cols[col] = values
+    return _labelled(pd.DataFrame(cols, columns=DEPT_VAR_COLS, copy=False))
 
 # ---------- 4) Latest month KPIs (single-row) ----------
-latest_key = df["MonthKey"].max()
-
-# Aggregate to a Series, then to one-row DataFrame
-latest_series = df[df["MonthKey"] == latest_key].agg(
-    {
-        "Revenue": "sum",
-        "Forecast_Revenue": "sum",
-        "Variance_vs_Forecast": "sum",
-        "Gross_Profit": "sum",
+def _finish_kpis(latest: pd.DataFrame, month: str) -> pd.DataFrame:
+    latest["Variance_Pct"] = (
+        (latest["Variance_Total"] / latest["Budget_Total"]).where(latest["Budget_Total"] != 0) * 100
+    )
+    latest["Gross_Margin_Pct"] = (
+        (latest["Gross_Profit"] / latest["Actual_Total"]).where(latest["Actual_Total"] != 0) * 100
+    )
+    latest["Month"] = month
+    return latest[
+        ["Month", "Actual_Total", "Budget_Total", "Variance_Total", "Variance_Pct", "Gross_Margin_Pct"]
+    ].round(2)
+
+def latest_kpis(df: pd.DataFrame) -> pd.DataFrame:
+    latest_key = df["Month"].max()
+
+    # Aggregate to a Series, then to one-row DataFrame
+    latest_series = df[df["Month"] == latest_key].agg(
+        {
+            "Revenue": "sum",
+            "Forecast_Revenue": "sum",
+            "Variance_vs_Forecast": "sum",
+            "Gross_Profit": "sum",
+        }
+    )
+    latest = latest_series.to_frame().T.rename(
+        columns={
+            "Revenue": "Actual_Total",
+            "Forecast_Revenue": "Budget_Total",
+            "Variance_vs_Forecast": "Variance_Total",
+        }
+    )
+    return _finish_kpis(latest, schema.month_labels([latest_key])[0])
+
+# ---------- Outputs ----------
+def build_outputs(df: pd.DataFrame) -> dict:
+    """Derive columns on a raw ledger and return {file name: output frame}."""
+    with span("variance.derive", rows=len(df)):
+        df = add_derived(df)
+    steps = {
+        "variance_summary": lambda: department_rollup(df).round(2),
+        "monthly_trend": lambda: monthly_trend(df).round(2),
+        "department_variance": lambda: department_variance(df, decimals=2),  # rounded while gathered
+        "latest_kpis": lambda: latest_kpis(df).round(2),
+    }
+    outputs = {}
+    for name, step in steps.items():
+        with span(f"variance.{name}", rows=len(df)) as sp:
+            outputs[name] = step()
+            sp["out_rows"] = len(outputs[name])
+    return outputs
+
+OUTPUT_NAMES = ["variance_summary", "monthly_trend", "department_variance", "latest_kpis"]
+
+def write_outputs(outputs: dict, data_dir: Path = DATA_DIR) -> list:
+    return [storage.write_table(frame, name, data_dir=data_dir) for name, frame in outputs.items()]
+
+# ---------- Incremental state ----------
+# One row per (Month, Department) partition: additive aggregates plus an
+# order-independent content hash (sums of per-row 32-bit hash halves), so a
+# partition can be extended by appended rows without re-reading its history.
+PARTITION_KEYS = ["Month", "Department"]
+
+def partition_aggregates(df: pd.DataFrame) -> pd.DataFrame:
+    """Per-partition aggregates of a derived ledger frame."""
+    h = pd.util.hash_pandas_object(df[EXPECTED], index=False).to_numpy()
+    parts = df[PARTITION_KEYS].assign(
+        Rows=1,
+        Hash_Lo=(h & 0xFFFFFFFF).astype("int64"),
+        Hash_Hi=(h >> 32).astype("int64"),
+        Revenue=df["Revenue"],
+        Forecast_Revenue=df["Forecast_Revenue"],
+        Variance_vs_Forecast=df["Variance_vs_Forecast"],
+        Gross_Profit=df["Gross_Profit"],
+        GM_Sum=df["Gross_Margin_Pct"],
+        GM_Count=df["Gross_Margin_Pct"].notna().astype("int64"),
+    )
+    parts = parts.groupby(PARTITION_KEYS, as_index=False, observed=True).sum()
+    return parts.assign(Month=schema.month_labels(parts["Month"]), Department=parts["Department"].astype(str))
+
+def _file_sha1(path: Path, size: int) -> str:
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        remaining = size
+        while remaining > 0:
+            block = f.read(min(1 << 20, remaining))
+            if not block:
+                break
+            h.update(block)
+            remaining -= len(block)
+    return h.hexdigest()
+
+def load_state(state_dir: Path = STATE_DIR):
+    meta_path, parts_path = state_dir / "meta.json", state_dir / "partitions.csv"
+    if not (meta_path.exists() and parts_path.exists()):
+        return None, None
+    meta = json.loads(meta_path.read_text(encoding="utf-8"))
+    if meta.get("version") != STATE_VERSION:
+        return None, None
+    parts = pd.read_csv(parts_path, dtype={"Month": str, "Department": str})
+    return meta, parts
+
+def save_state(parts: pd.DataFrame, input_path: Path, state_dir: Path = STATE_DIR):
+    state_dir.mkdir(parents=True, exist_ok=True)
+    size = input_path.stat().st_size
+    meta = {"version": STATE_VERSION, "input_size": size, "input_sha1": _file_sha1(input_path, size)}
+    parts.to_csv(state_dir / "partitions.csv", index=False)
+    (state_dir / "meta.json").write_text(json.dumps(meta), encoding="utf-8")
+
+def _read_appended(input_path: Path, meta: dict):
+    """
+    If the ledger only grew by appended lines since the last run, parse just the
+    new tail (with the header). Returns the tail frame, or None if the file was
+    rewritten and needs a full parse.
+    """
+    old_size = meta["input_size"]
+    if input_path.stat().st_size < old_size or _file_sha1(input_path, old_size) != meta["input_sha1"]:
+        return None
+    with open(input_path, "rb") as f:
+        header = f.readline()
+        f.seek(old_size)
+        tail = f.read()
+    if not tail.strip():
+        return pd.DataFrame(columns=EXPECTED)
+    with span("variance.read_appended", bytes=len(tail)) as sp:
+        tail_df = validate(pd.read_csv(io.BytesIO(header + tail)))
+        sp["rows"] = len(tail_df)
+    return tail_df
+
+# ---------- Incremental updates ----------
+def _rollup_from_parts(parts: pd.DataFrame, by: str) -> pd.DataFrame:
+    return parts.groupby(by, as_index=False, observed=True)[
+        ["Revenue", "Forecast_Revenue", "Variance_vs_Forecast", "Gross_Profit", "GM_Sum", "GM_Count"]
+    ].sum()
+
+def _summary_rows(parts: pd.DataFrame) -> pd.DataFrame:
+    """Department rollup rows (unrounded) from partition aggregates."""
+    affected = _rollup_from_parts(parts, "Department")
+    rows = pd.DataFrame({
+        "Department": affected["Department"],
+        "Actual_Total": affected["Revenue"],
+        "Budget_Total": affected["Forecast_Revenue"],
+        "Variance_Total": affected["Variance_vs_Forecast"],
+        "Avg_Gross_Margin_Pct": (affected["GM_Sum"] / affected["GM_Count"]).where(affected["GM_Count"] > 0),
+    })
+    rows["Variance_Pct"] = (
+        (rows["Variance_Total"] / rows["Budget_Total"]).where(rows["Budget_Total"] != 0)
+    ).round(4) * 100
+    return rows
+
+def _order_summary(summary: pd.DataFrame) -> pd.DataFrame:
+    # Same order as the full build: groupby (alphabetical) order, then by Actual_Total
+    summary = summary.sort_values("Department", ignore_index=True)
+    return summary.sort_values("Actual_Total", ascending=False)
+
+def _update_summary(prev: pd.DataFrame, parts: pd.DataFrame, depts: set) -> pd.DataFrame:
+    rows = _summary_rows(parts[parts["Department"].isin(depts)])
+    keep = prev[~prev["Department"].astype(str).isin(depts)]
+    return _order_summary(pd.concat([keep, rows.round(2)], ignore_index=True))
+
+def _trend_from_parts(parts: pd.DataFrame) -> pd.DataFrame:
+    """Full monthly trend (unrounded) from partition aggregates."""
+    totals = _rollup_from_parts(parts, "Month").sort_values("Month")
+    trend = pd.DataFrame({
+        "Month": totals["Month"].astype(str),
+        "Actual_Revenue": totals["Revenue"],
+        "Budget_Forecast": totals["Forecast_Revenue"],
+        "Gross_Profit": totals["Gross_Profit"],
+    }).reset_index(drop=True)
+    trend["YoY_Actual_Revenue"] = (trend["Actual_Revenue"].pct_change(12) * 100).round(2)
+    return trend
+
+def _update_trend(prev: pd.DataFrame, parts: pd.DataFrame, months: set) -> pd.DataFrame:
+    """Replace affected month rows, then recompute YoY only where its 12-month window moved."""
+    prev = prev.assign(Month=prev["Month"].astype(str))
+    all_months = sorted(set(parts["Month"]))
+    old_pos = {m: i for i, m in enumerate(prev["Month"])}
+    new_pos = {m: i for i, m in enumerate(all_months)}
+
+    # Positions whose own value or whose t-12 value changed; a month inserted or
+    # removed mid-series shifts every later position, so those are dirty too.
+    dirty = {new_pos[m] for m in months if m in new_pos}
+    shifted = [i for m, i in new_pos.items() if old_pos.get(m) != i]
+    if shifted:
+        dirty.update(range(min(shifted), len(all_months)))
+    dirty |= {i + 12 for i in dirty if i + 12 < len(all_months)}
+    live = months & set(new_pos)
+    need = {all_months[i] for i in dirty} | {all_months[i - 12] for i in dirty if i >= 12} | live
+
+    totals = _rollup_from_parts(parts[parts["Month"].isin(need)], "Month").set_index("Month")
+    trend = prev[prev["Month"].isin(new_pos)].set_index("Month").reindex(all_months)
+    value_cols = {"Actual_Revenue": "Revenue", "Budget_Forecast": "Forecast_Revenue", "Gross_Profit": "Gross_Profit"}
+    for col, src in value_cols.items():
+        trend.loc[sorted(live), col] = totals.loc[sorted(live), src]
+        trend[col] = trend[col].astype(totals[src].dtype)
+    for i in sorted(dirty):
+        m = all_months[i]
+        if i < 12:
+            trend.loc[m, "YoY_Actual_Revenue"] = float("nan")
+            continue
+        base = totals.loc[all_months[i - 12], "Revenue"]
+        trend.loc[m, "YoY_Actual_Revenue"] = np.round((totals.loc[m, "Revenue"] / base - 1) * 100, 2)
+    return trend.reset_index().round(2)
+
+def _update_dept_var(prev: pd.DataFrame, fresh: pd.DataFrame, drop: set) -> pd.DataFrame:
+    """Drop rows of rewritten partitions, add freshly derived rows, restore (Month, Department) order."""
+    prev = prev.assign(Month=prev["Month"].astype(str), Department=prev["Department"].astype(str))
+    if drop:
+        key = pd.MultiIndex.from_frame(prev[PARTITION_KEYS])
+        prev = prev[~key.isin(list(drop))]
+    rows = department_variance(fresh, decimals=2)
+    out = pd.concat([prev, rows], ignore_index=True)
+    return out.sort_values(PARTITION_KEYS, kind="stable").reset_index(drop=True)
+
+def _kpis_from_parts(parts: pd.DataFrame) -> pd.DataFrame:
+    month = max(parts["Month"])
+    t = parts.loc[parts["Month"] == month, ["Revenue", "Forecast_Revenue", "Variance_vs_Forecast", "Gross_Profit"]].sum()
+    latest = pd.DataFrame([{
+        "Actual_Total": t["Revenue"],
+        "Budget_Total": t["Forecast_Revenue"],
+        "Variance_Total": t["Variance_vs_Forecast"],
+        "Gross_Profit": t["Gross_Profit"],
+    }])
+    return _finish_kpis(latest, month)
+
+def run_incremental(data_dir: Path = DATA_DIR, state_dir: Path = STATE_DIR):
+    """
+    Update the four outputs from the partitions that changed since the last run.
+    Falls back to a full build when there is no usable state or a previous output is missing.
+    Returns (outputs dict, {"mode": ..., "partitions": changed count})
+    """
+    input_path = storage.resolve("financials", data_dir=data_dir)
+    meta, state = load_state(state_dir)
+    missing_outputs = not all(storage.table_exists(n, data_dir=data_dir) for n in OUTPUT_NAMES)
+    if meta is None or missing_outputs:
+        df = add_derived(load_financials(data_dir))
+        outputs = build_outputs(df)
+        save_state(partition_aggregates(df), input_path, state_dir)
+        return outputs, {"mode": "full", "partitions": None}
+
+    # Tail parsing only makes sense for a row-oriented CSV ledger
+    if input_path.suffix == ".csv":
+        tail = _read_appended(input_path, meta)
+    elif input_path.stat().st_size == meta["input_size"] and _file_sha1(input_path, meta["input_size"]) == meta["input_sha1"]:
+        return {}, {"mode": "unchanged", "partitions": 0}
+    else:
+        tail = None
+    if tail is not None:
+        # Append-only: fold the new rows into existing partition aggregates
+        fresh = add_derived(tail)
+        delta = partition_aggregates(fresh)
+        parts = pd.concat([state, delta], ignore_index=True).groupby(PARTITION_KEYS, as_index=False).sum()
+        changed = set(map(tuple, delta[PARTITION_KEYS].to_numpy()))
+        drop = set()
+        mode = "append"
+    else:
+        # Rewritten file: full parse, but only partitions whose content hash moved are rebuilt
+        df = add_derived(load_financials(data_dir))
+        parts = partition_aggregates(df)
+        cmp_cols = PARTITION_KEYS + ["Rows", "Hash_Lo", "Hash_Hi"]
+        both = parts[cmp_cols].merge(state[cmp_cols], how="outer", indicator=True)
+        changed = set(map(tuple, both.loc[both["_merge"] != "both", PARTITION_KEYS].to_numpy()))
+        drop = changed
+        key = pd.MultiIndex.from_arrays([schema.month_labels(df["Month"]), df["Department"].astype(str)])
+        fresh = df[key.isin(list(changed))]
+        mode = "rescan"
+
+    if not changed:
+        save_state(parts, input_path, state_dir)
+        return {}, {"mode": mode, "partitions": 0}
+
+    depts = {d for _, d in changed}
+    months = {m for m, _ in changed}
+    outputs = {
+        "variance_summary": _update_summary(storage.read_table("variance_summary", data_dir=data_dir), parts, depts),
+        "monthly_trend": _update_trend(storage.read_table("monthly_trend", data_dir=data_dir), parts, months),
+        "department_variance": _update_dept_var(
+            storage.read_table("department_variance", data_dir=data_dir), fresh, drop
+        ),
+        "latest_kpis": _kpis_from_parts(parts),
     }
-)
-latest = latest_series.to_frame().T.rename(
-    columns={
-        "Revenue": "Actual_Total",
-        "Forecast_Revenue": "Budget_Total",
-        "Variance_vs_Forecast": "Variance_Total",
+    save_state(parts, input_path, state_dir)
+    return outputs, {"mode": mode, "partitions": len(changed)}
+
+# ---------- Streaming ----------
+def run_streaming(chunksize: int = 500_000, data_dir: Path = DATA_DIR) -> dict:
+    """
+    Build the four outputs from a ledger read in chunks, for files larger than RAM.
+    Only per-(Month, Department) partial aggregates stay in memory; derived
+    department_variance rows are spilled to disk per month and written back in
+    (Month, Department) order one month at a time.
+    Returns {name: output frame}, with department_variance already written
+    (its entry is None).
+    """
+    parts = None
+    with tempfile.TemporaryDirectory(prefix="fpna_spill_") as tmp:
+        spill = Path(tmp)
+        for i, chunk in enumerate(storage.iter_table("financials", columns=EXPECTED,
+                                                     chunksize=chunksize, data_dir=data_dir)):
+            with span("variance.stream_chunk", rows=len(chunk)):
+                chunk = add_derived(validate(chunk))
+                partial = partition_aggregates(chunk)
+                parts = partial if parts is None else (
+                    pd.concat([parts, partial], ignore_index=True)
+                    .groupby(PARTITION_KEYS, as_index=False, observed=True).sum()
+                )
+            rows = _labelled(chunk[DEPT_VAR_COLS]).round(2)
+            for month, g in rows.groupby("Month", sort=False):
+                (spill / month).mkdir(exist_ok=True)
+                g.to_pickle(spill / month / f"{i:08d}.pkl")
+
+        if parts is None:
+            raise ValueError("financials is empty")
+
+        with storage.TableWriter("department_variance", data_dir=data_dir) as writer:
+            for month in sorted(p.name for p in spill.iterdir()):
+                pieces = [pd.read_pickle(f) for f in sorted((spill / month).iterdir())]
+                block = pd.concat(pieces, ignore_index=True)
+                writer.write(block.sort_values("Department", kind="stable"))
+
+    return {
+        "variance_summary": _order_summary(_summary_rows(parts).round(2)),
+        "monthly_trend": _trend_from_parts(parts).round(2),
+        "department_variance": None,
+        "latest_kpis": _kpis_from_parts(parts),
     }
-)
-
-latest["Variance_Pct"] = (
-    (latest["Variance_Total"] / latest["Budget_Total"]).where(latest["Budget_Total"] != 0) * 100
-)
-latest["Gross_Margin_Pct"] = (
-    (latest["Gross_Profit"] / latest["Actual_Total"]).where(latest["Actual_Total"] != 0) * 100
-)
-latest["Month"] = df.loc[df["MonthKey"] == latest_key, "Month"].iloc[0]
-latest = latest[
-    ["Month", "Actual_Total", "Budget_Total", "Variance_Total", "Variance_Pct", "Gross_Margin_Pct"]
-].round(2)
-
-# ---------- Save outputs ----------
-OUTPUTS = {
-    "variance_summary.csv": summary.round(2),
-    "monthly_trend.csv": trend.round(2).drop(columns=["MonthKey"]),
-    "department_variance.csv": dept_var.round(2).drop(columns=["MonthKey"]),
-    "latest_kpis.csv": latest.round(2),
-}
-
-DATA_DIR.mkdir(parents=True, exist_ok=True)
-for name, frame in OUTPUTS.items():
-    frame.to_csv(DATA_DIR / name, index=False)
-
-print("✅ Generated:")
-for name in OUTPUTS:
-    print(f"  - data/{name}")
+
+# ---------- Main ----------
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Variance + KPI pipeline")
+    mode = p.add_mutually_exclusive_group()
+    mode.add_argument("--incremental", action="store_true",
+                      help="only recompute (Month, Department) partitions changed since the last run")
+    mode.add_argument("--stream", action="store_true",
+                      help="read the ledger in chunks with bounded memory (for very large files)")
+    mode.add_argument("--check-parity", action="store_true",
+                      help="run both the pandas and SQL engines and compare their outputs (writes nothing)")
+    p.add_argument("--chunksize", type=int, default=500_000, help="rows per chunk in --stream mode")
+    p.add_argument("--engine", choices=["pandas", "sql"], default="pandas",
+                   help="full-build engine: pandas, or SQLite running sql/variance_analysis.sql")
+    p.add_argument("--sql-db", default=None,
+                   help="SQLite file to keep the loaded ledger in between runs (default: in-memory)")
+    return p.parse_args(argv)
+
+def check_parity(db_path=None) -> list:
+    import variance_sql
+    return variance_sql.compare_outputs(
+        build_outputs(load_financials()), variance_sql.build_outputs_sql(db_path=db_path)
+    )
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.check_parity:
+        problems = check_parity(args.sql_db)
+        if problems:
+            print("❌ pandas and SQL outputs differ:")
+            for p in problems:
+                print(f"  - {p}")
+            raise SystemExit(1)
+        print("✅ pandas and SQL engines agree on all outputs")
+        return
+
+    if args.incremental:
+        OUTPUTS, info = run_incremental()
+        print(f"🔁 Incremental run ({info['mode']}): "
+              f"{'all' if info['partitions'] is None else info['partitions']} partitions recomputed")
+    elif args.stream:
+        OUTPUTS = run_streaming(chunksize=args.chunksize)
+    elif args.engine == "sql":
+        import variance_sql
+        OUTPUTS = variance_sql.build_outputs_sql(db_path=args.sql_db)
+    else:
+        OUTPUTS = build_outputs(load_financials())
+
+    paths = write_outputs({k: v for k, v in OUTPUTS.items() if v is not None})
+    paths += [storage.table_path(k) for k, v in OUTPUTS.items() if v is None]
+
+    print("✅ Generated:")
+    for path in paths:
+        print(f"  - data/{path.name}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+# python/variance_sql.py
+import math
+import re
+import sqlite3
+from pathlib import Path
+
+import pandas as pd
+
+import schema
+import storage
+
+ROOT = Path(__file__).resolve().parents[1]
+DATA_DIR = ROOT / "data"
+SQL_PATH = ROOT / "sql" / "variance_analysis.sql"
+
+LEDGER_COLS = ["Month", "Department", "Revenue", "Expense", "Forecast_Revenue"]
+OUTPUT_NAMES = ["variance_summary", "monthly_trend", "department_variance", "latest_kpis"]
+MEASURES = ["Revenue", "Expense", "Forecast_Revenue"]
+
+# Output sums that pandas keeps int64 when their ledger measures are integers
+# (SQLite's ROUND() always returns REAL): (output, column, measures)
+INTEGER_SUMS = [
+    ("variance_summary", "Actual_Total", ["Revenue"]),
+    ("variance_summary", "Budget_Total", ["Forecast_Revenue"]),
+    ("variance_summary", "Variance_Total", ["Revenue", "Forecast_Revenue"]),
+    ("monthly_trend", "Actual_Revenue", ["Revenue"]),
+    ("monthly_trend", "Budget_Forecast", ["Forecast_Revenue"]),
+    ("monthly_trend", "Gross_Profit", ["Revenue", "Expense"]),
+    ("department_variance", "Revenue", ["Revenue"]),
+    ("department_variance", "Forecast_Revenue", ["Forecast_Revenue"]),
+    ("department_variance", "Variance_vs_Forecast", ["Revenue", "Forecast_Revenue"]),
+]
+
+def load_queries(path: Path = SQL_PATH) -> dict:
+    """Split the .sql file into {name: sql} on '-- name: <name>' markers."""
+    text = path.read_text(encoding="utf-8")
+    blocks = re.split(r"^--\s*name:\s*(\w+)\s*$", text, flags=re.MULTILINE)
+    return {name: sql.strip() for name, sql in zip(blocks[1::2], blocks[2::2])}
+
+def _round(x, digits=0):
+    # numpy's rule (round half to even on x * 10**digits) instead of SQLite's
+    # decimal half-up, so half-cent ties come out as in the pandas build
+    if x is None:
+        return None
+    scale = 10.0 ** digits
+    return math.copysign(round(x * scale) / scale, x)  # keeps -0.0 like numpy
+
+def connect(db_path=None) -> sqlite3.Connection:
+    """In-memory database by default; pass a path to keep the loaded ledger between runs."""
+    if sqlite3.sqlite_version_info < (3, 25):
+        raise RuntimeError(f"SQLite {sqlite3.sqlite_version} lacks window functions (need >= 3.25)")
+    conn = sqlite3.connect(str(db_path) if db_path else ":memory:")
+    conn.create_function("ROUND", 1, _round, deterministic=True)
+    conn.create_function("ROUND", 2, _round, deterministic=True)
+    return conn
+
+def integer_measures(conn: sqlite3.Connection) -> set:
+    """Ledger measures stored as integers in every row (what pandas reads as int64)."""
+    if schema.MEASURE_DTYPE != "auto":
+        return set()
+    counts = conn.execute(
+        "SELECT " + ", ".join(f"SUM(typeof({m}) <> 'integer')" for m in MEASURES) + " FROM financials"
+    ).fetchone()
+    return {m for m, n in zip(MEASURES, counts) if not n}
+
+def load_ledger(conn: sqlite3.Connection, queries: dict, data_dir: Path = DATA_DIR, chunksize: int = 200_000) -> bool:
+    """
+    Bulk-load financials into the indexed table, chunk by chunk.
+    Skipped when a persistent database already holds this exact source file.
+    Returns True if rows were (re)loaded.
+    """
+    # Databases kept from before measures lost their NUMERIC affinity are reloaded
+    types = {r[1]: r[2] for r in conn.execute("PRAGMA table_info(financials)")}
+    if types.get("Revenue"):
+        conn.executescript("DROP TABLE financials; DROP TABLE IF EXISTS load_meta;")
+    conn.executescript(queries["schema"])
+    source = storage.resolve("financials", data_dir=data_dir)
+    st = source.stat()
+    row = conn.execute("SELECT size, mtime_ns FROM load_meta WHERE source = ?", (str(source),)).fetchone()
+    if row == (st.st_size, st.st_mtime_ns):
+        return False
+
+    with conn:
+        conn.execute("DELETE FROM financials")
+        conn.execute("DELETE FROM load_meta")
+        for chunk in storage.iter_table("financials", columns=LEDGER_COLS, chunksize=chunksize, data_dir=data_dir):
+            missing = set(LEDGER_COLS) - set(chunk.columns)
+            if missing:
+                raise ValueError(f"Missing columns in financials: {missing}")
+            chunk = chunk.assign(
+                Month=chunk["Month"].astype(str).str[:7],
+                Department=chunk["Department"].astype(str),
+            )
+            conn.executemany(
+                "INSERT INTO financials VALUES (?, ?, ?, ?, ?)",
+                chunk[LEDGER_COLS].itertuples(index=False, name=None),
+            )
+        conn.execute("INSERT INTO load_meta VALUES (?, ?, ?)", (str(source), st.st_size, st.st_mtime_ns))
+    conn.execute("ANALYZE")
+    return True
+
+def build_outputs_sql(data_dir: Path = DATA_DIR, db_path=None) -> dict:
+    """Compute the four variance outputs with set-based SQL. Returns {name: frame}."""
+    queries = load_queries()
+    conn = connect(db_path)
+    try:
+        load_ledger(conn, queries, data_dir)
+        conn.executescript(queries["derived"])
+        outputs = {name: pd.read_sql_query(queries[name], conn) for name in OUTPUT_NAMES}
+        ints = integer_measures(conn)
+    finally:
+        conn.close()
+
+    for name, col, measures in INTEGER_SUMS:
+        if set(measures) <= ints:
+            outputs[name][col] = outputs[name][col].astype("int64")
+
+    # pandas builds the KPI row through one Series: int64 totals only when every measure is
+    kpis = outputs["latest_kpis"]
+    totals = ["Actual_Total", "Budget_Total", "Variance_Total"]
+    kpis[kpis.columns.drop("Month")] = kpis[kpis.columns.drop("Month")].astype(float)
+    if set(MEASURES) <= ints:
+        kpis[totals] = kpis[totals].astype("int64")
+    return outputs
+
+def compare_outputs(left: dict, right: dict) -> list:
+    """
+    Differences between two {name: frame} output sets (e.g. pandas vs SQL).
+    Numeric columns must match exactly, with the same dtype, so both write the
+    same files; labels are compared as text. Returns a list of problem descriptions.
+    """
+    problems = []
+    for name in OUTPUT_NAMES:
+        a = left[name].reset_index(drop=True)
+        b = right[name].reset_index(drop=True)
+        if list(a.columns) != list(b.columns):
+            problems.append(f"{name}: columns {list(a.columns)} != {list(b.columns)}")
+            continue
+        if len(a) != len(b):
+            problems.append(f"{name}: {len(a)} rows != {len(b)} rows")
+            continue
+        if name == "variance_summary":
+            # Ties in Actual_Total may legitimately come out in a different order
+            a = a.sort_values(["Actual_Total", "Department"], ascending=[False, True], ignore_index=True)
+            b = b.sort_values(["Actual_Total", "Department"], ascending=[False, True], ignore_index=True)
+        for col in a.columns:
+            x, y = a[col], b[col]
+            if pd.api.types.is_numeric_dtype(x) or pd.api.types.is_numeric_dtype(y):
+                if x.dtype != y.dtype:
+                    problems.append(f"{name}.{col}: dtype {x.dtype} != {y.dtype}")
+                    continue
+                bad = ~((x == y) | (x.isna() & y.isna()))
+            else:
+                bad = x.astype(str) != y.astype(str)
+            if bad.any():
+                i = bad.idxmax()
+                problems.append(f"{name}.{col}: {int(bad.sum())} rows differ (first at row {i}: {x[i]!r} vs {y[i]!r})")
+    return problems
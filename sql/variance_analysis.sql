@@ -0,0 +1,108 @@
+-- sql/variance_analysis.sql
+-- SQL version of the variance rollup (same four outputs as python/variance_analysis.py).
+-- Written for SQLite >= 3.25 (window functions). Blocks are split on "-- name:" markers
+-- by python/variance_sql.py, which also makes ROUND() round half to even like pandas.
+
+-- name: schema
+-- Month is stored normalized to YYYY-MM so the indexes serve month filters directly.
+-- Measures have no declared type, so integer and float ledgers keep their storage
+-- class (NUMERIC would turn 100.0 into 100) and sums come out int or float like pandas.
+CREATE TABLE IF NOT EXISTS financials (
+    Month            TEXT    NOT NULL,
+    Department       TEXT    NOT NULL,
+    Revenue,
+    Expense,
+    Forecast_Revenue
+);
+CREATE INDEX IF NOT EXISTS ix_financials_month_dept ON financials (Month, Department);
+CREATE INDEX IF NOT EXISTS ix_financials_dept ON financials (Department);
+CREATE TABLE IF NOT EXISTS load_meta (source TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER);
+
+-- name: derived
+CREATE TEMP VIEW IF NOT EXISTS ledger AS
+SELECT
+    rowid                                   AS row_id,
+    Month,
+    Department,
+    Revenue,
+    Expense,
+    Forecast_Revenue,
+    Revenue - Expense                       AS Gross_Profit,
+    CASE WHEN Revenue <> 0
+         THEN ROUND(1.0 * (Revenue - Expense) / Revenue, 4) * 100 END           AS Gross_Margin_Pct,
+    Revenue - Forecast_Revenue              AS Variance_vs_Forecast,
+    CASE WHEN Forecast_Revenue <> 0
+         THEN ROUND(1.0 * (Revenue - Forecast_Revenue) / Forecast_Revenue, 4) * 100 END AS Variance_Pct
+FROM financials;
+
+-- name: variance_summary
+SELECT
+    Department,
+    ROUND(Actual, 2)                        AS Actual_Total,
+    ROUND(Budget_Total, 2)                  AS Budget_Total,
+    ROUND(Variance_Total, 2)                AS Variance_Total,
+    ROUND(Avg_Gross_Margin_Pct, 2)          AS Avg_Gross_Margin_Pct,
+    ROUND(CASE WHEN Budget_Total <> 0
+               THEN ROUND(1.0 * Variance_Total / Budget_Total, 4) * 100 END, 2) AS Variance_Pct
+FROM (
+    SELECT
+        Department,
+        SUM(Revenue)                        AS Actual,
+        SUM(Forecast_Revenue)               AS Budget_Total,
+        SUM(Variance_vs_Forecast)           AS Variance_Total,
+        AVG(Gross_Margin_Pct)               AS Avg_Gross_Margin_Pct
+    FROM ledger
+    GROUP BY Department
+)
+ORDER BY Actual DESC, Department;  -- unrounded totals, as pandas sorts before rounding
+
+-- name: monthly_trend
+SELECT
+    Month,
+    ROUND(Actual_Revenue, 2)                AS Actual_Revenue,
+    ROUND(Budget_Forecast, 2)               AS Budget_Forecast,
+    ROUND(Gross_Profit, 2)                  AS Gross_Profit,
+    ROUND((1.0 * Actual_Revenue / LAG(Actual_Revenue, 12) OVER (ORDER BY Month) - 1) * 100, 2)
+                                            AS YoY_Actual_Revenue
+FROM (
+    SELECT
+        Month,
+        SUM(Revenue)                        AS Actual_Revenue,
+        SUM(Forecast_Revenue)               AS Budget_Forecast,
+        SUM(Gross_Profit)                   AS Gross_Profit
+    FROM ledger
+    GROUP BY Month
+)
+ORDER BY Month;
+
+-- name: department_variance
+SELECT
+    Month,
+    Department,
+    ROUND(Revenue, 2)                       AS Revenue,
+    ROUND(Forecast_Revenue, 2)              AS Forecast_Revenue,
+    ROUND(Variance_vs_Forecast, 2)          AS Variance_vs_Forecast,
+    ROUND(Variance_Pct, 2)                  AS Variance_Pct,
+    ROUND(Gross_Margin_Pct, 2)              AS Gross_Margin_Pct
+FROM ledger
+ORDER BY Month, Department, row_id;
+
+-- name: latest_kpis
+SELECT
+    Month,
+    ROUND(Actual_Total, 2)                  AS Actual_Total,
+    ROUND(Budget_Total, 2)                  AS Budget_Total,
+    ROUND(Variance_Total, 2)                AS Variance_Total,
+    ROUND(CASE WHEN Budget_Total <> 0 THEN 1.0 * Variance_Total / Budget_Total * 100 END, 2) AS Variance_Pct,
+    ROUND(CASE WHEN Actual_Total <> 0 THEN 1.0 * Gross_Profit / Actual_Total * 100 END, 2) AS Gross_Margin_Pct
+FROM (
+    SELECT
+        Month,
+        SUM(Revenue)                        AS Actual_Total,
+        SUM(Forecast_Revenue)               AS Budget_Total,
+        SUM(Variance_vs_Forecast)           AS Variance_Total,
+        SUM(Gross_Profit)                   AS Gross_Profit
+    FROM ledger
+    WHERE Month = (SELECT MAX(Month) FROM financials)
+    GROUP BY Month
+);
@@ -0,0 +1,7 @@
+# tests/conftest.py
+import sys
+from pathlib import Path
+
+# The pipeline modules are flat scripts in python/, imported by name
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "python"))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
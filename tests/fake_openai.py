@@ -0,0 +1,99 @@
+# tests/fake_openai.py
+"""
+Minimal OpenAI-compatible chat endpoint on the standard library, for exercising
+summary_engine without a real provider.
+
+Answers POST /v1/chat/completions with "echo: <prompt>" and records what it saw:
+requests served and the most requests in flight at once. `script` scripts the
+first responses: each entry is ("sleep", seconds) to stall that request or
+("status", code) to fail it; later requests get `delay` and then a normal answer.
+
+    python tests/fake_openai.py --port 8765   # then OPENAI_BASE_URL=http://127.0.0.1:8765/v1
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class FakeOpenAI:
+    def __init__(self, delay: float = 0.0, script=None, port: int = 0):
+        self.delay = delay
+        self.script = list(script or [])
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}/v1"
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                with fake._lock:
+                    fake.requests += 1
+                    fake.in_flight += 1
+                    fake.max_in_flight = max(fake.max_in_flight, fake.in_flight)
+                    action = fake.script.pop(0) if fake.script else ("sleep", fake.delay)
+                try:
+                    kind, value = action
+                    if kind == "status":
+                        return self._send(value, {"error": {"message": f"fake {value}", "type": "fake", "code": None}})
+                    time.sleep(value)
+                    prompt = body["messages"][-1]["content"]
+                    self._send(200, {
+                        "id": f"chatcmpl-{fake.requests}",
+                        "object": "chat.completion",
+                        "created": int(time.time()),
+                        "model": body.get("model", "fake"),
+                        "choices": [{"index": 0, "finish_reason": "stop",
+                                     "message": {"role": "assistant", "content": f"echo: {prompt}"}}],
+                        "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+                    })
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # the client gave up (timeout)
+                finally:
+                    with fake._lock:
+                        fake.in_flight -= 1
+
+            def _send(self, status, payload):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Serve a fake OpenAI chat endpoint")
+    p.add_argument("--port", type=int, default=8765)
+    p.add_argument("--delay", type=float, default=0.0, help="seconds per request")
+    args = p.parse_args(argv)
+    fake = FakeOpenAI(delay=args.delay, port=args.port)
+    print(f"🧪 Fake OpenAI on {fake.base_url}")
+    fake.server.serve_forever()
+
+if __name__ == "__main__":
+    main()
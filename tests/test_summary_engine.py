@@ -0,0 +1,100 @@
+# tests/test_summary_engine.py
+"""SummaryEngine against a local fake OpenAI endpoint (tests/fake_openai.py)."""
+import pandas as pd
+import pytest
+
+openai = pytest.importorskip("openai")
+
+import summary_engine
+from fake_openai import FakeOpenAI
+from summary_engine import ResponseCache, SummaryEngine
+
+@pytest.fixture
+def fake():
+    servers = []
+
+    def start(**kwargs):
+        server = FakeOpenAI(**kwargs).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.stop()
+
+def engine_for(server, **kwargs):
+    client = openai.AsyncOpenAI(api_key="test", base_url=server.base_url, max_retries=0)
+    kwargs.setdefault("backoff", 0.01)
+    return SummaryEngine(client=client, model="fake-model", **kwargs)
+
+def test_concurrency_is_bounded(fake):
+    server = fake(delay=0.1)
+    engine = engine_for(server, concurrency=3)
+    out = engine.run({i: f"prompt {i}" for i in range(12)})
+    assert out == {i: f"echo: prompt {i}" for i in range(12)}
+    assert server.requests == 12
+    assert 1 < server.max_in_flight <= 3
+
+def test_timeout_then_retry_succeeds(fake):
+    server = fake(script=[("sleep", 2.0)])
+    engine = engine_for(server, timeout=0.3, retries=2)
+    out = engine.run({"a": "slow first"})
+    assert out["a"] == "echo: slow first"
+    assert server.requests == 2
+    assert engine.requests == 2 and engine.failures == 0
+
+@pytest.mark.parametrize("status", [429, 500, 503])
+def test_transient_status_is_retried(fake, status):
+    server = fake(script=[("status", status)])
+    engine = engine_for(server, retries=2)
+    assert engine.run({"a": "hi"})["a"] == "echo: hi"
+    assert server.requests == 2
+
+@pytest.mark.parametrize("status", [400, 401])
+def test_client_error_is_not_retried(fake, status):
+    server = fake(script=[("status", status)] * 3)
+    engine = engine_for(server, retries=2)
+    out = engine.run({"a": "hi"})
+    assert isinstance(out["a"], openai.APIStatusError)
+    assert server.requests == 1
+    assert engine.failures == 1
+
+def test_cache_hit_makes_no_request(fake, tmp_path):
+    server = fake()
+    cache = ResponseCache(tmp_path)
+    assert engine_for(server, cache=cache).run({"a": "cached"})["a"] == "echo: cached"
+    assert server.requests == 1
+
+    engine = engine_for(server, cache=cache)
+    assert engine.run({"a": "cached"})["a"] == "echo: cached"
+    assert server.requests == 1
+    assert engine.requests == 0 and cache.hits == 1
+
+def test_zero_budget_renders_na():
+    dv = pd.DataFrame({
+        "Month": ["2024-01", "2024-01"],
+        "Department": ["Sales", "R&D"],
+        "Revenue": [100.0, 50.0],
+        "Forecast_Revenue": [80.0, 0.0],
+        "Variance_vs_Forecast": [20.0, 50.0],
+        "Gross_Margin_Pct": [40.0, 30.0],
+    })
+    trend = pd.DataFrame(columns=["Month", "Actual_Revenue", "Budget_Forecast", "Gross_Profit"])
+    prompts = summary_engine.narrative_prompts(dv, trend)
+    assert "(25.00%)" in prompts[("department", "2024-01", "Sales")]
+    assert "(n/a)" in prompts[("department", "2024-01", "R&D")]
+    assert "inf" not in prompts[("department", "2024-01", "R&D")]
+
+def test_missing_margin_renders_na():
+    dv = pd.DataFrame({
+        "Month": ["2024-01"],
+        "Department": ["Sales"],
+        "Revenue": [0.0],
+        "Forecast_Revenue": [80.0],
+        "Variance_vs_Forecast": [-80.0],
+        "Gross_Margin_Pct": [float("nan")],
+    })
+    trend = pd.DataFrame(columns=["Month", "Actual_Revenue", "Budget_Forecast", "Gross_Profit"])
+    prompt = summary_engine.narrative_prompts(dv, trend)[("department", "2024-01", "Sales")]
+    assert "Gross Margin %: n/a" in prompt
+    assert "nan" not in prompt
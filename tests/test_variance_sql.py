@@ -0,0 +1,48 @@
+# tests/test_variance_sql.py
+"""The SQLite engine (sql/variance_analysis.sql) against the pandas build on small ledgers."""
+import numpy as np
+import pandas as pd
+import pytest
+
+import variance_analysis
+import variance_sql
+
+def write_ledger(data_dir, decimals):
+    """Three departments over 15 months (so YoY has values), with zero-revenue and zero-forecast rows."""
+    rng = np.random.default_rng(7)
+    months = pd.period_range("2023-01", periods=15, freq="M").astype(str)
+    rows = [(m, d) for m in months for d in ["Sales", "Marketing", "R&D"] for _ in range(2)]
+    df = pd.DataFrame(rows, columns=["Month", "Department"])
+    n = len(df)
+    values = {c: rng.uniform(1_000, 50_000, n) for c in ["Revenue", "Expense", "Forecast_Revenue"]}
+    for c, v in values.items():
+        df[c] = np.round(v, decimals) if decimals else np.round(v).astype("int64")
+    df.loc[[3, 10, 11], "Revenue"] = 0
+    df.loc[[5, 12, 40], "Forecast_Revenue"] = 0
+    df.loc[df["Department"] == "R&D", "Forecast_Revenue"] *= 0  # a department without budget
+    df.to_csv(data_dir / "financials.csv", index=False)
+
+@pytest.mark.parametrize("decimals", [0, 2], ids=["int", "float"])
+def test_engines_agree(tmp_path, decimals):
+    write_ledger(tmp_path, decimals)
+    pandas_out = variance_analysis.build_outputs(variance_analysis.load_financials(tmp_path))
+    sql_out = variance_sql.build_outputs_sql(data_dir=tmp_path)
+    assert variance_sql.compare_outputs(pandas_out, sql_out) == []
+    for name in variance_sql.OUTPUT_NAMES:
+        assert not sql_out[name].empty, name
+
+def test_persistent_database_reloads_changed_ledger(tmp_path):
+    db = tmp_path / "ledger.db"
+    write_ledger(tmp_path, 2)
+    variance_sql.build_outputs_sql(data_dir=tmp_path, db_path=db)
+    write_ledger(tmp_path, 0)
+    pandas_out = variance_analysis.build_outputs(variance_analysis.load_financials(tmp_path))
+    assert variance_sql.compare_outputs(pandas_out, variance_sql.build_outputs_sql(data_dir=tmp_path, db_path=db)) == []
+
+def test_compare_outputs_is_exact(tmp_path):
+    write_ledger(tmp_path, 2)
+    out = variance_sql.build_outputs_sql(data_dir=tmp_path)
+    off = {name: frame.copy() for name, frame in out.items()}
+    off["monthly_trend"].loc[0, "Actual_Revenue"] += 0.01
+    problems = variance_sql.compare_outputs(out, off)
+    assert len(problems) == 1 and problems[0].startswith("monthly_trend.Actual_Revenue")